@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+"""
+Script de pruebas de rendimiento del pipeline de datos de entrenamiento
+Este script mide cada etapa (lectura de Firestore, procesamiento, guardado, preparación y subida) con datos sintéticos.
+
+Cada etapa se ejecuta en un proceso nuevo, así que la memoria máxima (RSS)
+que se informa es la de esa etapa. Para cada etapa y tamaño se guardan en
+JSON el rendimiento (ejemplos/s), los percentiles p50/p99 del tiempo por
+ejemplo y el RSS máximo, junto con el commit de git, para comparar versiones.
+
+Las etapas usan sustitutos locales de los servicios:
+- Firestore: el emulador (FIRESTORE_EMULATOR_HOST); sin él, las etapas fetch se omiten.
+- GCS: un directorio local, o el emulador si STORAGE_EMULATOR_HOST está definido.
+
+El tiempo por ejemplo se mide entre ejemplos consecutivos e incluye la
+generación de los datos sintéticos; la etapa "generate" mide solo el
+generador, como referencia.
+
+Uso:
+python benchmark-pipeline.py --sizes=1000,100000 --output=benchmark.json
+"""
+
+import argparse
+import datetime
+import importlib.util
+import itertools
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, Optional
+
+from instrumentation import peak_rss_bytes
+from synthetic_data import iter_conversations, iter_examples, write_examples_jsonl
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STAGES = [
+    "generate",
+    "fetch",
+    "fetch_parallel",
+    "sample",
+    "process",
+    "quality",
+    "pii",
+    "dedup",
+    "window",
+    "save",
+    "save_gzip",
+    "profile",
+    "prepare",
+    "prepare_shards",
+    "upload",
+    "cache",
+    "store_write",
+    "store_filter",
+    "shuffle_split",
+    "startup",
+]
+
+# Subcomandos de cognia-data.py cuyo arranque mide la etapa startup
+STARTUP_COMMANDS = ["collect", "prepare", "upload", "train", "profile", "test"]
+STARTUP_RUNS = 5
+
+# Configuración de argumentos
+parser = argparse.ArgumentParser(description="Pruebas de rendimiento del pipeline de datos de entrenamiento")
+parser.add_argument("--sizes", type=str, default="1000,10000", help="Números de conversaciones a probar, separados por comas")
+parser.add_argument("--stages", type=str, default=",".join(STAGES), help="Etapas a medir, separadas por comas")
+parser.add_argument("--seed", type=int, default=42, help="Semilla del generador de datos sintéticos")
+parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Hilos o procesos de las etapas paralelas")
+parser.add_argument("--page-size", type=int, default=500, help="Documentos por página de Firestore")
+parser.add_argument("--max-tokens", type=int, default=2048, help="Presupuesto de tokens de la etapa window")
+parser.add_argument("--work-dir", type=str, default=None, help="Directorio para los archivos generados (por defecto uno temporal)")
+parser.add_argument("--output", type=str, default="benchmark.json", help="Archivo JSON con los resultados")
+# Uso interno: ejecutar una sola etapa en un proceso hijo
+parser.add_argument("--run-stage", type=str, default=None, help=argparse.SUPPRESS)
+parser.add_argument("--size", type=int, default=None, help=argparse.SUPPRESS)
+parser.add_argument("--result-file", type=str, default=None, help=argparse.SUPPRESS)
+
+class StageSkipped(Exception):
+    """
+    La etapa no se puede ejecutar en este entorno
+    """
+
+class LatencyHistogram:
+    """
+    Histograma logarítmico de tiempos (memoria constante para cualquier tamaño)
+
+    Los intervalos crecen un 5 %, así que los percentiles tienen un error
+    relativo menor del 5 %.
+    """
+
+    MIN_SECONDS = 1e-8
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+        self._log_growth = math.log(self.GROWTH)
+
+    def add(self, seconds: float):
+        index = int(math.log(max(seconds, self.MIN_SECONDS) / self.MIN_SECONDS) / self._log_growth)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Percentil en segundos (límite superior del intervalo), o None si está vacío
+        """
+        if not self.total:
+            return None
+        target = math.ceil(self.total * q / 100)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return self.MIN_SECONDS * self.GROWTH ** (index + 1)
+        return None
+
+def timed_items(items: Iterable, histogram: LatencyHistogram) -> Iterator:
+    """
+    Reenvía los elementos y registra el tiempo entre elementos consecutivos
+
+    El tiempo incluye tanto lo que tarda en producirse cada elemento como lo
+    que tarda en consumirlo quien itera.
+    """
+    last = time.perf_counter()
+    for item in items:
+        yield item
+        now = time.perf_counter()
+        histogram.add(now - last)
+        last = now
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Memoria residente máxima del proceso en MB (None si no se puede medir)
+    """
+    peak = peak_rss_bytes()
+    return peak / (1024 * 1024) if peak is not None else None
+
+def load_script(filename: str):
+    """
+    Importa uno de los scripts del directorio (sus nombres llevan guiones)
+    """
+    path = os.path.join(SCRIPTS_DIR, filename)
+    spec = importlib.util.spec_from_file_location(filename.replace("-", "_")[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def dataset_file(work_dir: str, size: int, seed: int) -> str:
+    return os.path.join(work_dir, f"dataset-{size}-{seed}.jsonl")
+
+def drain(items: Iterable) -> int:
+    count = 0
+    for _ in items:
+        count += 1
+    return count
+
+# ---------------------------------------------------------------------------
+# Etapas: cada una devuelve el número de ejemplos y, si aplica, los bytes
+# procesados. Las etapas que no iteran ejemplo a ejemplo dejan el histograma
+# vacío (sin p50/p99).
+# ---------------------------------------------------------------------------
+
+def stage_generate(args, histogram: LatencyHistogram) -> Dict:
+    return {"examples": drain(timed_items(iter_conversations(args.size, args.seed), histogram))}
+
+def _emulator_collection(args):
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        raise StageSkipped("FIRESTORE_EMULATOR_HOST no está definido")
+    collect = load_script("collect-training-data.py")
+    db = collect.initialize_firestore("cognia-benchmark")
+    collection_name = f"benchmark_{args.size}_{args.seed}"
+
+    # Cargar los datos sintéticos una sola vez por tamaño y semilla
+    if not list(db.collection(collection_name).limit(1).stream()):
+        batch = db.batch()
+        pending = 0
+        for conversation in iter_conversations(args.size, args.seed):
+            document = dict(conversation)
+            batch.set(db.collection(collection_name).document(document.pop("id")), document)
+            pending += 1
+            if pending == 500:
+                batch.commit()
+                batch = db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+    return collect, db, collection_name
+
+def stage_fetch(args, histogram: LatencyHistogram) -> Dict:
+    collect, db, collection_name = _emulator_collection(args)
+    start = time.perf_counter()
+    pages = collect.fetch_conversation_pages(db, collection_name, 0, args.size, args.page_size)
+    count = drain(timed_items((conversation for page in pages for conversation in page), histogram))
+    return {"examples": count, "seconds": time.perf_counter() - start}
+
+def stage_fetch_parallel(args, histogram: LatencyHistogram) -> Dict:
+    collect, db, collection_name = _emulator_collection(args)
+    start = time.perf_counter()
+    pages = collect.fetch_conversation_pages_parallel(db, collection_name, 0, args.size, args.page_size, workers=args.workers)
+    count = drain(timed_items((conversation for page in pages for conversation in page), histogram))
+    return {"examples": count, "seconds": time.perf_counter() - start}
+
+def stage_sample(args, histogram: LatencyHistogram) -> Dict:
+    from conversation_sampler import ConversationSampler
+    sampler = ConversationSampler(min(args.size, 1000), seed=str(args.seed))
+    conversations = iter_conversations(args.size, args.seed)
+    # Las conversaciones se generan por bloques fuera de la medición
+    seconds = 0.0
+    while True:
+        block = list(itertools.islice(conversations, 10000))
+        if not block:
+            break
+        start = time.perf_counter()
+        for conversation in timed_items(block, histogram):
+            sampler.add(conversation)
+        seconds += time.perf_counter() - start
+    return {"examples": sampler.seen, "seconds": seconds, "sampled": len(sampler.sample())}
+
+def stage_process(args, histogram: LatencyHistogram) -> Dict:
+    collect = load_script("collect-training-data.py")
+    examples = collect.process_conversations(iter_conversations(args.size, args.seed))
+    return {"examples": drain(timed_items(examples, histogram))}
+
+def stage_quality(args, histogram: LatencyHistogram) -> Dict:
+    from quality_scorer import QualityScorer
+    scorer = QualityScorer(0.7, args.workers)
+    try:
+        count = drain(timed_items(scorer.filter(iter_examples(args.size, args.seed)), histogram))
+    finally:
+        scorer.close()
+    return {"examples": count, "rejected": scorer.rejected}
+
+def stage_pii(args, histogram: LatencyHistogram) -> Dict:
+    from pii_scrubber import PIIScrubber
+    scrubber = PIIScrubber(workers=args.workers)
+    examples = iter_examples(args.size, args.seed)
+    # Los ejemplos se generan por bloques fuera de la medición, y los MB/s se
+    # calculan sobre el texto de los mensajes
+    seconds = 0.0
+    text_bytes = 0
+    count = 0
+    try:
+        while True:
+            block = list(itertools.islice(examples, 10000))
+            if not block:
+                break
+            text_bytes += sum(len(message["content"].encode("utf-8")) for example in block for message in example["messages"])
+            start = time.perf_counter()
+            count += drain(timed_items(scrubber.scrub(block), histogram))
+            seconds += time.perf_counter() - start
+    finally:
+        scrubber.close()
+    return {"examples": count, "bytes": text_bytes, "seconds": seconds, "replaced": sum(scrubber.counts.values())}
+
+def stage_dedup(args, histogram: LatencyHistogram) -> Dict:
+    from training_pipeline import Deduplicator, deduplicate
+    deduplicator = Deduplicator()
+    count = drain(timed_items(deduplicate(iter_examples(args.size, args.seed), deduplicator), histogram))
+    return {"examples": count, "duplicates": deduplicator.exact_duplicates + deduplicator.near_duplicates}
+
+def stage_window(args, histogram: LatencyHistogram) -> Dict:
+    from training_pipeline import Windower, window_examples
+    windower = Windower(args.max_tokens)
+    count = drain(timed_items(window_examples(iter_examples(args.size, args.seed), windower), histogram))
+    return {"examples": count, "split": windower.split}
+
+def _save(args, histogram: LatencyHistogram, extension: str) -> Dict:
+    collect = load_script("collect-training-data.py")
+    output_file = os.path.join(args.work_dir, f"saved-{args.size}{extension}")
+    count = collect.save_training_data(timed_items(iter_examples(args.size, args.seed), histogram), output_file)
+    # Los MB/s se calculan sobre el JSONL sin comprimir, que es idéntico al
+    # archivo sintético del mismo tamaño
+    return {
+        "examples": count,
+        "bytes": os.path.getsize(dataset_file(args.work_dir, args.size, args.seed)),
+        "output_bytes": os.path.getsize(output_file)
+    }
+
+def stage_save(args, histogram: LatencyHistogram) -> Dict:
+    return _save(args, histogram, ".jsonl")
+
+def stage_save_gzip(args, histogram: LatencyHistogram) -> Dict:
+    return _save(args, histogram, ".jsonl.gz")
+
+def stage_profile(args, histogram: LatencyHistogram) -> Dict:
+    from jsonl_codec import iter_jsonl
+    from token_profile import profile_examples
+    data_file = dataset_file(args.work_dir, args.size, args.seed)
+    profile = profile_examples(timed_items(iter_jsonl(data_file), histogram))
+    return {"examples": profile.examples, "bytes": os.path.getsize(data_file)}
+
+def _prepare(args, shards: int) -> Dict:
+    train = load_script("train-gemini-model.py")
+    data_file = dataset_file(args.work_dir, args.size, args.seed)
+    files, _ = train.prepare_training_data(data_file, shards)
+    return {"examples": args.size, "bytes": os.path.getsize(data_file), "files": len(files)}
+
+def stage_prepare(args, histogram: LatencyHistogram) -> Dict:
+    return _prepare(args, 1)
+
+def stage_prepare_shards(args, histogram: LatencyHistogram) -> Dict:
+    return _prepare(args, args.workers)
+
+def stage_upload(args, histogram: LatencyHistogram) -> Dict:
+    train = load_script("train-gemini-model.py")
+    data_file = dataset_file(args.work_dir, args.size, args.seed)
+
+    # Un almacenamiento vacío en cada ejecución: con direccionamiento por
+    # contenido, una segunda subida del mismo archivo se omitiría
+    storage_root = None
+    if not os.environ.get("STORAGE_EMULATOR_HOST"):
+        storage_root = os.path.join(args.work_dir, "fake-gcs")
+        shutil.rmtree(storage_root, ignore_errors=True)
+
+    start = time.perf_counter()
+    uri = train.upload_to_gcs([data_file], "cognia-benchmark", "us-central1", f"benchmark-{int(time.time())}", storage_root=storage_root)
+    return {"examples": args.size, "bytes": os.path.getsize(data_file), "seconds": time.perf_counter() - start, "uri": uri}
+
+def stage_cache(args, histogram: LatencyHistogram) -> Dict:
+    from response_cache import ResponseCache, cache_key
+    from gemini_backends import DEFAULT_CONFIG, DEFAULT_MODEL, examples_to_contents
+    path = os.path.join(args.work_dir, f"cache-{args.size}.sqlite")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    cache = ResponseCache(path, max_entries=None, max_bytes=None)
+
+    # Se llena la caché con la última respuesta de cada ejemplo, en
+    # fragmentos de 20 palabras como los de un stream
+    keys = []
+    start = time.perf_counter()
+    for example in iter_examples(args.size, args.seed):
+        contents = examples_to_contents(example["messages"][:-1])
+        words = example["messages"][-1]["content"].split(" ")
+        key = cache_key(DEFAULT_MODEL, contents, DEFAULT_CONFIG)
+        cache.put(key, DEFAULT_MODEL, [" ".join(words[i:i + 20]) for i in range(0, len(words), 20)])
+        keys.append(key)
+    put_seconds = time.perf_counter() - start
+
+    # Solo se miden las consultas (aciertos), una por clave
+    start = time.perf_counter()
+    for key in keys:
+        lookup = time.perf_counter()
+        cache.get(key)
+        histogram.add(time.perf_counter() - lookup)
+    seconds = time.perf_counter() - start
+    stats = cache.stats()
+    cache.close()
+    return {"examples": len(keys), "bytes": stats["bytes"], "seconds": seconds, "put_seconds": round(put_seconds, 4), "hits": cache.hits}
+
+def _store_dir(args) -> str:
+    return os.path.join(args.work_dir, f"store-{args.size}-{args.seed}")
+
+def stage_store_write(args, histogram: LatencyHistogram) -> Dict:
+    collect = load_script("collect-training-data.py")
+    from conversation_store import ConversationStoreWriter
+    writer = ConversationStoreWriter(_store_dir(args), "parquet")
+
+    # Por páginas, como en la exportación (calidad del campo de Firestore)
+    conversations = timed_items(iter_conversations(args.size, args.seed), histogram)
+    count = 0
+    while True:
+        page = list(itertools.islice(conversations, args.page_size))
+        if not page:
+            break
+        for conversation in page:
+            conversation["quality"] = (zlib.crc32(conversation["id"].encode("utf-8")) % 1000) / 1000
+        count += writer.write(collect.conversation_rows(page))
+    writer.commit()
+    return {"examples": count, "bytes": os.path.getsize(dataset_file(args.work_dir, args.size, args.seed)), "output_bytes": writer.bytes_written}
+
+def stage_store_filter(args, histogram: LatencyHistogram) -> Dict:
+    from conversation_store import count_conversations, store_summary
+    store_dir = _store_dir(args)
+    if not os.path.isdir(store_dir):
+        stage_store_write(args, LatencyHistogram())
+
+    # Calidad y rango de fechas (la mitad central del periodo sintético)
+    start = time.perf_counter()
+    first = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    span = datetime.timedelta(seconds=args.size * 37)
+    matched = count_conversations(store_dir, min_quality=0.7, since=first + span / 4, until=first + span * 3 / 4)
+    summary = store_summary(store_dir, min_quality=0.7)
+    return {"examples": args.size, "matched": matched, "summary_conversations": summary["conversations"], "seconds": time.perf_counter() - start}
+
+def stage_shuffle_split(args, histogram: LatencyHistogram) -> Dict:
+    from jsonl_index import index_path, shuffle_split
+    data_file = dataset_file(args.work_dir, args.size, args.seed)
+    if os.path.exists(index_path(data_file)):
+        os.remove(index_path(data_file))
+
+    # Incluye la construcción del índice del archivo de entrada
+    stem = os.path.join(args.work_dir, f"split-{args.size}")
+    result = shuffle_split(data_file, f"{stem}-train.jsonl", f"{stem}-validation.jsonl", seed=args.seed, validation_fraction=0.1)
+    return {"examples": result["examples"], "bytes": os.path.getsize(data_file), "validation_examples": result["validation_examples"]}
+
+def stage_startup(args, histogram: LatencyHistogram) -> Dict:
+    # Arranque de cada subcomando de cognia-data.py hasta mostrar --help (no
+    # depende del tamaño); "python" es el arranque del intérprete solo
+    script = os.path.join(SCRIPTS_DIR, "cognia-data.py")
+    startup_ms = {}
+    for command in ["python"] + STARTUP_COMMANDS:
+        command_line = [sys.executable, "-c", "pass"] if command == "python" else [sys.executable, script, command, "--help"]
+        times = []
+        for _ in range(STARTUP_RUNS):
+            start = time.perf_counter()
+            subprocess.run(command_line, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            times.append(time.perf_counter() - start)
+        if command != "python":
+            for seconds in times:
+                histogram.add(seconds)
+        startup_ms[command] = round(sorted(times)[STARTUP_RUNS // 2] * 1000, 1)
+    return {"examples": STARTUP_RUNS * len(STARTUP_COMMANDS), "startup_ms": startup_ms}
+
+def run_stage(args) -> Dict:
+    """
+    Ejecuta una etapa en este proceso y devuelve su resultado
+    """
+    result = {"stage": args.run_stage, "size": args.size}
+    histogram = LatencyHistogram()
+    try:
+        start = time.perf_counter()
+        measured = globals()[f"stage_{args.run_stage}"](args, histogram)
+        seconds = measured.pop("seconds", time.perf_counter() - start)
+    except StageSkipped as e:
+        result["skipped"] = str(e)
+        return result
+    except ImportError as e:
+        result["skipped"] = f"falta la dependencia {e.name}"
+        return result
+
+    result.update(measured)
+    result["seconds"] = round(seconds, 4)
+    result["examples_per_second"] = round(measured["examples"] / seconds, 1) if seconds else None
+    if "bytes" in measured:
+        result["mb_per_second"] = round(measured["bytes"] / seconds / (1024 * 1024), 2) if seconds else None
+    p50 = histogram.percentile(50)
+    p99 = histogram.percentile(99)
+    result["p50_ms"] = round(p50 * 1000, 4) if p50 is not None else None
+    result["p99_ms"] = round(p99 * 1000, 4) if p99 is not None else None
+    rss = peak_rss_mb()
+    result["peak_rss_mb"] = round(rss, 1) if rss is not None else None
+    return result
+
+def git_commit() -> Optional[str]:
+    """
+    Commit actual del repositorio (None si no se puede obtener)
+    """
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=SCRIPTS_DIR,
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_in_subprocess(args, stage: str, size: int, work_dir: str) -> Dict:
+    """
+    Ejecuta una etapa en un proceso nuevo para medir su memoria por separado
+    """
+    result_file = os.path.join(work_dir, f"result-{stage}-{size}.json")
+    command = [
+        sys.executable, os.path.abspath(__file__),
+        "--run-stage", stage,
+        "--size", str(size),
+        "--seed", str(args.seed),
+        "--workers", str(args.workers),
+        "--page-size", str(args.page_size),
+        "--max-tokens", str(args.max_tokens),
+        "--work-dir", work_dir,
+        "--result-file", result_file,
+    ]
+    process = subprocess.run(command, cwd=work_dir, capture_output=True, text=True)
+    if process.returncode != 0 or not os.path.exists(result_file):
+        error = (process.stderr or process.stdout).strip().splitlines()
+        return {"stage": stage, "size": size, "error": error[-1] if error else f"código de salida {process.returncode}"}
+    with open(result_file, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+    os.remove(result_file)
+    return result
+
+def format_result(result: Dict) -> str:
+    """
+    Una línea legible por resultado
+    """
+    label = f"{result['stage']:<15} {result['size']:>10,}"
+    if "skipped" in result:
+        return f"{label}  omitida: {result['skipped']}"
+    if "error" in result:
+        return f"{label}  error: {result['error']}"
+    line = f"{label} {result['examples_per_second'] or 0:>12,.0f} ej/s"
+    if result.get("mb_per_second") is not None:
+        line += f" {result['mb_per_second']:>8.1f} MB/s"
+    if result["p50_ms"] is not None:
+        line += f"  p50 {result['p50_ms']:.3f} ms  p99 {result['p99_ms']:.3f} ms"
+    if result["peak_rss_mb"] is not None:
+        line += f"  RSS {result['peak_rss_mb']:.0f} MB"
+    if "startup_ms" in result:
+        line += "\n" + " " * 16 + ", ".join(f"{command} {ms:.0f} ms" for command, ms in result["startup_ms"].items())
+    return line
+
+def main():
+    args = parser.parse_args()
+
+    if args.run_stage:
+        result = run_stage(args)
+        with open(args.result_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"Etapas desconocidas: {', '.join(unknown)} (disponibles: {', '.join(STAGES)})")
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="cognia-benchmark-")
+    os.makedirs(work_dir, exist_ok=True)
+    work_dir = os.path.abspath(work_dir)
+    print(f"Directorio de trabajo: {work_dir}")
+
+    report = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "workers": args.workers,
+        "results": []
+    }
+
+    try:
+        for size in sizes:
+            # Las etapas que leen un JSONL usan el mismo archivo sintético
+            data_file = dataset_file(work_dir, size, args.seed)
+            if not os.path.exists(data_file):
+                print(f"Generando {size:,} ejemplos sintéticos en {data_file}...")
+                write_examples_jsonl(data_file, size, args.seed)
+
+            for stage in stages:
+                result = run_in_subprocess(args, stage, size, work_dir)
+                report["results"].append(result)
+                print(format_result(result))
+
+                # Guardar después de cada etapa para no perder resultados parciales
+                with open(args.output, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, indent=2, ensure_ascii=False)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\nResultados guardados en {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Punto de entrada único de las herramientas de datos de entrenamiento de CognIA
+Este script agrupa los pasos del pipeline (recopilar, preparar, subir, entrenar, perfilar y probar) como subcomandos.
+
+Cada subcomando importa solo lo que necesita: el SDK de Firebase se carga al
+conectarse a Firestore, el de Vertex AI al lanzar el ajuste fino y el de
+google-genai al llamar al modelo, así que --help y los pasos locales arrancan
+sin esperar a ninguno de ellos.
+
+Uso:
+python cognia-data.py collect --project=cogniaintellilearn-ebdb3 --output=training_data.jsonl
+python cognia-data.py profile --data-file=training_data.jsonl
+python cognia-data.py prepare --data-file=training_data.jsonl --shards=4
+python cognia-data.py upload --project=cogniaintellilearn-ebdb3 processed_training_data.jsonl
+python cognia-data.py train --project=cogniaintellilearn-ebdb3 --data-file=training_data.jsonl
+python cognia-data.py test --project=cogniaintellilearn-ebdb3 --model=<modelo>
+
+Los subcomandos collect, train, profile y test aceptan los mismos argumentos
+que su script (collect-training-data.py, train-gemini-model.py,
+profile-training-data.py y test-gemini.py); `cognia-data.py <subcomando> --help`
+los muestra.
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Subcomandos que ejecutan un script con sus propios argumentos
+SCRIPT_COMMANDS = {
+    "collect": ("collect-training-data.py", "Recopilar conversaciones de Firestore y convertirlas en ejemplos"),
+    "train": ("train-gemini-model.py", "Preparar, subir y lanzar el ajuste fino (o un barrido de hiperparámetros)"),
+    "profile": ("profile-training-data.py", "Estimar los tokens y el coste de un archivo de entrenamiento"),
+    "test": ("test-gemini.py", "Probar el modelo con una prueba de carga"),
+}
+
+# Configuración de argumentos
+parser = argparse.ArgumentParser(prog="cognia-data", description="Herramientas de datos de entrenamiento de CognIA")
+subparsers = parser.add_subparsers(dest="command", required=True, metavar="<subcomando>")
+
+for command, (script, description) in SCRIPT_COMMANDS.items():
+    # Sin --help propio: los argumentos (incluido --help) pasan al script
+    subparsers.add_parser(command, help=description, add_help=False)
+
+prepare_parser = subparsers.add_parser("prepare", help="Convertir un archivo JSONL al formato de Vertex AI, sin subirlo")
+prepare_parser.add_argument("--data-file", type=str, default="training_data.jsonl", help="Archivo de datos de entrenamiento")
+prepare_parser.add_argument("--shards", type=int, default=1, help="Preparar los datos en N shards en paralelo (un proceso por CPU)")
+prepare_parser.add_argument("--holdout-fraction", type=float, default=0.0, help="Proporción de ejemplos reservada para evaluar el modelo con eval-model.py")
+prepare_parser.add_argument("--shuffle-seed", type=int, default=None, help="Barajar los ejemplos con esta semilla antes de preparar")
+prepare_parser.add_argument("--validation-fraction", type=float, default=0.0, help="Proporción de usuarios cuyos ejemplos forman el conjunto de validación")
+prepare_parser.add_argument("--max-invalid-fraction", type=float, default=0.05, help="Proporción máxima de ejemplos no válidos (en cuarentena) antes de cancelar")
+prepare_parser.add_argument("--codec", type=str, default="auto", choices=["auto", "orjson", "msgspec", "json"], help="Serializador JSON (auto = el más rápido instalado)")
+
+upload_parser = subparsers.add_parser("upload", help="Subir archivos preparados a Cloud Storage")
+upload_parser.add_argument("files", type=str, nargs="+", help="Archivos preparados (varios shards se unen en un único objeto)")
+upload_parser.add_argument("--project", type=str, required=True, help="ID del proyecto de Google Cloud")
+upload_parser.add_argument("--region", type=str, default="us-central1", help="Región de Google Cloud")
+upload_parser.add_argument("--bucket", type=str, default=None, help="Bucket para los datos de entrenamiento (por defecto <project>-tuning-data)")
+upload_parser.add_argument("--upload-workers", type=int, default=8, help="Partes que se suben en paralelo")
+upload_parser.add_argument("--chunk-size-mb", type=int, default=None, help="Tamaño de cada parte en subidas compuestas (MB, por defecto el de train-gemini-model.py)")
+upload_parser.add_argument("--storage-root", type=str, default=None, help="Directorio local que sustituye a GCS (pruebas sin red)")
+
+def load_script(filename: str):
+    """
+    Importa uno de los scripts del directorio (sus nombres llevan guiones)
+    """
+    path = os.path.join(SCRIPTS_DIR, filename)
+    spec = importlib.util.spec_from_file_location(filename.replace("-", "_")[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def run_script(command: str, argv: list):
+    """
+    Ejecuta el main() de un script con los argumentos indicados
+
+    Args:
+        command: Subcomando (SCRIPT_COMMANDS)
+        argv: Argumentos del script
+    """
+    script, _ = SCRIPT_COMMANDS[command]
+    # El parser del script se crea al importarlo y toma el nombre de sys.argv[0]
+    sys.argv = [f"cognia-data {command}"] + argv
+    load_script(script).main()
+
+def prepare(args):
+    """
+    Prepara los datos de entrenamiento sin subirlos
+    """
+    from jsonl_codec import set_default_codec
+    train = load_script("train-gemini-model.py")
+    set_default_codec(args.codec)
+    files, validation_files = train.prepare_training_data(
+        args.data_file,
+        args.shards,
+        args.codec,
+        args.holdout_fraction,
+        args.shuffle_seed,
+        args.validation_fraction,
+        args.max_invalid_fraction
+    )
+    print("\nArchivos preparados:")
+    for path in files + validation_files:
+        print(f"- {path}")
+
+def upload(args):
+    """
+    Sube archivos ya preparados a Cloud Storage
+    """
+    train = load_script("train-gemini-model.py")
+    uri = train.upload_to_gcs(
+        args.files,
+        args.project,
+        args.region,
+        bucket_name=args.bucket,
+        workers=args.upload_workers,
+        chunk_size=args.chunk_size_mb * 1024 * 1024 if args.chunk_size_mb else train.DEFAULT_CHUNK_SIZE,
+        storage_root=args.storage_root
+    )
+    print(f"Datos disponibles en {uri}")
+
+def main(argv: list = None):
+    args, extra = parser.parse_known_args(argv)
+    if args.command in SCRIPT_COMMANDS:
+        run_script(args.command, extra)
+        return
+    if extra:
+        parser.error(f"Argumentos no reconocidos: {' '.join(extra)}")
+    if args.command == "prepare":
+        prepare(args)
+    elif args.command == "upload":
+        upload(args)
+
+if __name__ == "__main__":
+    main()
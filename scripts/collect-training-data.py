@@ -16,19 +16,71 @@ import argparse
 import json
 import os
 import datetime
-from typing import List, Dict, Any
+import heapq
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
 
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
+from conversation_sampler import SAMPLE_STRATA, ConversationSampler, sample_pages
+from instrumentation import add_metrics_arguments, metrics
+from jsonl_codec import COMPRESSIONS, compression_for_path, set_default_codec
+from pii_scrubber import PII_CATEGORIES, PIIScrubber, scrub_pii
+from quality_scorer import QualityScorer, filter_quality
+from training_pipeline import (
+    ASSISTANT_ROLE,
+    MODEL_ROLE,
+    Deduplicator,
+    Windower,
+    conversations_to_examples,
+    deduplicate,
+    filter_examples,
+    normalize_roles,
+    run_pipeline,
+    save_jsonl,
+    strip_metadata,
+    window_examples,
+    write_jsonl
+)
 
 # Configuración de argumentos
 parser = argparse.ArgumentParser(description="Recopilar datos de entrenamiento desde Firestore")
 parser.add_argument("--project", type=str, required=True, help="ID del proyecto de Google Cloud")
 parser.add_argument("--output", type=str, default="training_data.jsonl", help="Archivo de salida para los datos de entrenamiento")
 parser.add_argument("--min-quality", type=float, default=0.7, help="Puntuación mínima de calidad para incluir una conversación (0-1)")
-parser.add_argument("--max-conversations", type=int, default=1000, help="Número máximo de conversaciones a recopilar")
+parser.add_argument("--quality-source", type=str, default="local", choices=["local", "firestore"], help="Calcular la calidad localmente o filtrar por el campo quality de Firestore")
+parser.add_argument("--quality-workers", type=int, default=None, help="Procesos que puntúan la calidad en paralelo (por defecto uno por CPU)")
+parser.add_argument("--languages", type=str, default="es,en", help="Idiomas aceptados por la puntuación de calidad local (separados por comas)")
+parser.add_argument("--max-conversations", type=int, default=1000, help="Número máximo de conversaciones a recopilar (tamaño de la muestra con --sampling reservoir)")
+parser.add_argument("--sampling", type=str, default="first", choices=["first", "reservoir"], help="Tomar las primeras conversaciones de la consulta o una muestra uniforme de toda la colección")
+parser.add_argument("--sample-by", type=str, default="none", choices=("none",) + SAMPLE_STRATA, help="Estratificar la muestra por usuario (userId) o por mes de startTime")
+parser.add_argument("--sample-per-stratum", type=int, default=None, help="Conversaciones máximas de cada usuario o mes en la muestra (obligatorio con --sample-by)")
+parser.add_argument("--sample-seed", type=str, default="", help="Semilla de la muestra (la misma semilla da la misma muestra)")
 parser.add_argument("--collection", type=str, default="conversations", help="Nombre de la colección de Firestore")
+parser.add_argument("--page-size", type=int, default=500, help="Número de documentos leídos por página de Firestore")
+parser.add_argument("--workers", type=int, default=1, help="Número de hilos que leen particiones de la colección en paralelo")
+parser.add_argument("--incremental", action="store_true", help="Exportar solo conversaciones con endTime posterior a la última ejecución y añadirlas al archivo de salida")
+parser.add_argument("--manifest", type=str, default=None, help="Manifiesto de la exportación incremental (por defecto <output>.manifest.json)")
+parser.add_argument("--dedup", type=str, default="near", choices=["none", "exact", "near"], help="Eliminar duplicados exactos y/o casi duplicados")
+parser.add_argument("--dedup-threshold", type=float, default=0.9, help="Similitud de Jaccard a partir de la cual dos conversaciones son casi duplicadas (0-1)")
+parser.add_argument("--dedup-window", type=int, default=200000, help="Número de ejemplos recientes que recuerda la deduplicación")
+parser.add_argument("--max-tokens", type=int, default=None, help="Dividir las conversaciones que superen este número de tokens en ventanas solapadas")
+parser.add_argument("--window-overlap", type=int, default=1, help="Turnos (pregunta y respuesta) que comparten dos ventanas consecutivas")
+parser.add_argument("--pii", type=str, default="scrub", choices=["scrub", "none"], help="Sustituir los datos personales (correos, teléfonos, documentos, nombres...) por marcadores")
+parser.add_argument("--pii-categories", type=str, default=",".join(PII_CATEGORIES), help="Categorías de datos personales a sustituir (separadas por comas)")
+parser.add_argument("--pii-salt", type=str, default="", help="Clave secreta de los marcadores de datos personales (la misma clave da los mismos marcadores)")
+parser.add_argument("--pii-workers", type=int, default=None, help="Procesos que sustituyen los datos personales en paralelo (por defecto uno por CPU)")
+parser.add_argument("--vertex", action="store_true", help="Escribir directamente el formato de Vertex AI (rol 'model' en las respuestas)")
+parser.add_argument("--codec", type=str, default="auto", choices=["auto", "orjson", "msgspec", "json"], help="Serializador JSON (auto = el más rápido instalado)")
+parser.add_argument("--compression", type=str, default=None, choices=COMPRESSIONS, help="Compresión del archivo de salida (por defecto según la extensión: .gz, .zst)")
+parser.add_argument("--format", type=str, default=None, choices=["jsonl", "parquet", "arrow"], help="Formato de salida: JSONL o almacén columnar Parquet/Arrow (por defecto según la extensión de --output)")
+parser.add_argument("--rows-per-part", type=int, default=1_000_000, help="Conversaciones por archivo del almacén columnar")
+parser.add_argument("--schema-output", type=str, default=None, help="Guardar en este archivo un esquema de ejemplo de la colección de Firestore")
+parser.add_argument("--checkpoint", type=str, default=None, help="Archivo de checkpoint para reanudar la exportación (por defecto <output>.checkpoint.json)")
+add_metrics_arguments(parser)
 
 def initialize_firestore(project_id: str):
     """
@@ -40,6 +92,10 @@ def initialize_firestore(project_id: str):
     Returns:
         Cliente de Firestore
     """
+    # El SDK de Firebase tarda en importarse: solo se carga al conectarse
+    import firebase_admin
+    from firebase_admin import firestore
+
     try:
         # Inicializar Firebase con credenciales predeterminadas
         firebase_admin.initialize_app(options={
@@ -53,119 +109,945 @@ def initialize_firestore(project_id: str):
         print(f"Error al inicializar Firestore: {e}")
         raise
 
-def fetch_conversations(
+# Marca de agua inicial del modo incremental (primera ejecución sin manifiesto)
+INITIAL_WATERMARK = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+def conversation_watermark(conversation: Dict) -> Dict:
+    """
+    Marca de agua del modo incremental: endTime e ID de una conversación
+
+    El ID desempata las conversaciones con el mismo endTime, así que la
+    siguiente ejecución continúa justo después de la última exportada aunque
+    el límite de conversaciones corte un grupo con el mismo endTime.
+
+    Args:
+        conversation: Conversación con "endTime" e "id"
+
+    Returns:
+        Marca de agua ({"endTime": ISO 8601, "id": ID del documento})
+    """
+    return {"endTime": conversation["endTime"].isoformat(), "id": conversation["id"]}
+
+def format_watermark(watermark: Optional[Dict]) -> str:
+    """
+    Describe una marca de agua para los mensajes de progreso
+
+    Args:
+        watermark: Marca de agua del manifiesto (o None)
+
+    Returns:
+        Texto con el endTime y, si lo hay, el ID del documento
+    """
+    if not watermark:
+        return "ninguna"
+    if watermark["id"] is None:
+        return f"endTime {watermark['endTime']}"
+    return f"endTime {watermark['endTime']}, documento {watermark['id']}"
+
+# Alfabeto de los IDs automáticos de Firestore, en orden de bytes
+AUTO_ID_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+def build_conversations_query(
     db,
     collection_name: str,
     min_quality: float,
-    max_conversations: int
-) -> List[Dict]:
+    id_range: Optional[Tuple[Optional[str], Optional[str]]] = None,
+    end_time_after: Optional[datetime.datetime] = None,
+    watermark_id: Optional[str] = None
+):
     """
-    Obtiene conversaciones de Firestore
-    
+    Construye la consulta de conversaciones con un orden total y estable
+
+    El orden por ID de documento ("__name__") permite paginar con cursores
+    (start_after) y reanudar una exportación interrumpida. En modo incremental
+    se ordena por endTime y ID, de forma que lo exportado siempre es un
+    prefijo en ese orden y la marca de agua (endTime, ID) marca dónde seguir.
+
+    Args:
+        db: Cliente de Firestore
+        collection_name: Nombre de la colección
+        min_quality: Puntuación mínima de calidad
+        id_range: Rango [inicio, fin) de IDs de documento a leer (None = sin límite)
+        end_time_after: Leer solo conversaciones con endTime posterior (modo incremental)
+        watermark_id: ID de la última conversación exportada con endTime igual a
+            `end_time_after` (None = todas las de ese endTime ya se exportaron)
+
+    Returns:
+        Consulta de Firestore ordenada
+    """
+    collection = db.collection(collection_name)
+    query = collection
+
+    # Conversaciones terminadas después de la marca de agua
+    if end_time_after is not None:
+        query = query.where("endTime", ">=" if watermark_id is not None else ">", end_time_after)
+
+    # Si existe el campo quality, filtrar por él
+    if min_quality > 0:
+        query = query.where("quality", ">=", min_quality)
+
+    # Restringir a un rango de IDs (lectura particionada)
+    if id_range is not None:
+        start_id, end_id = id_range
+        if start_id is not None:
+            query = query.where("__name__", ">=", collection.document(start_id))
+        if end_id is not None:
+            query = query.where("__name__", "<", collection.document(end_id))
+
+    # Firestore exige ordenar por los campos con filtros de desigualdad
+    for field in query_order_fields(min_quality, end_time_after):
+        query = query.order_by(field)
+
+    # Continuar después de la última conversación exportada con ese endTime
+    if end_time_after is not None and watermark_id is not None:
+        query = query.start_after({"endTime": end_time_after, "__name__": collection.document(watermark_id)})
+
+    return query
+
+def query_order_fields(min_quality: float, end_time_after: Optional[datetime.datetime] = None) -> List[str]:
+    """
+    Devuelve los campos por los que se ordena la consulta de conversaciones
+
+    En modo incremental quality queda solo como filtro: el orden es (endTime,
+    ID), que es lo que guarda la marca de agua.
+
+    Args:
+        min_quality: Puntuación mínima de calidad
+        end_time_after: Marca de agua de endTime (modo incremental)
+
+    Returns:
+        Lista de campos, terminando siempre en "__name__"
+    """
+    fields = []
+    if end_time_after is not None:
+        fields.append("endTime")
+    elif min_quality > 0:
+        fields.append("quality")
+    fields.append("__name__")
+    return fields
+
+def conversation_sort_key(
+    min_quality: float,
+    end_time_after: Optional[datetime.datetime] = None
+) -> Callable[[Dict], Tuple]:
+    """
+    Devuelve la clave de orden equivalente al orden de la consulta en Firestore
+
+    Args:
+        min_quality: Puntuación mínima de calidad
+        end_time_after: Marca de agua de endTime (modo incremental)
+
+    Returns:
+        Función que calcula la clave de orden de una conversación
+    """
+    fields = [("id" if field == "__name__" else field) for field in query_order_fields(min_quality, end_time_after)]
+    return lambda conversation: tuple(conversation.get(field) for field in fields)
+
+def partition_id_ranges(partitions: int) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Divide el espacio de IDs de documento en rangos contiguos
+
+    Los IDs automáticos de Firestore son aleatorios y uniformes sobre
+    AUTO_ID_ALPHABET, así que repartir los dos primeros caracteres en partes
+    iguales da particiones de tamaño similar. El primer y el último rango
+    quedan abiertos para cubrir también IDs no automáticos.
+
+    Args:
+        partitions: Número de particiones
+
+    Returns:
+        Lista de rangos (inicio, fin) con inicio inclusivo y fin exclusivo
+    """
+    base = len(AUTO_ID_ALPHABET)
+    space = base * base
+    bounds = []
+    for i in range(1, partitions):
+        point = i * space // partitions
+        bounds.append(AUTO_ID_ALPHABET[point // base] + AUTO_ID_ALPHABET[point % base])
+
+    starts = [None] + bounds
+    ends = bounds + [None]
+    return list(zip(starts, ends))
+
+def _get_page(query, max_retries: int) -> List[Any]:
+    """
+    Lee una página de resultados, reintentando errores transitorios
+
+    Args:
+        query: Consulta de Firestore ya limitada al tamaño de página
+        max_retries: Número máximo de reintentos
+
+    Returns:
+        Lista de snapshots de la página
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return list(query.stream())
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = 2 ** attempt
+            metrics().inc("firestore_retries")
+            print(f"Error al leer página ({e}), reintentando en {delay}s...")
+            time.sleep(delay)
+
+def fetch_conversation_pages(
+    db,
+    collection_name: str,
+    min_quality: float,
+    max_conversations: int,
+    page_size: int = 500,
+    start_after_id: Optional[str] = None,
+    max_retries: int = 3,
+    id_range: Optional[Tuple[Optional[str], Optional[str]]] = None,
+    stop_event: Optional[threading.Event] = None,
+    end_time_after: Optional[datetime.datetime] = None,
+    watermark_id: Optional[str] = None
+) -> Iterator[List[Dict]]:
+    """
+    Obtiene conversaciones de Firestore página a página
+
+    Solo se mantiene en memoria una página a la vez, así que el consumo de
+    memoria no depende del tamaño de la colección.
+
     Args:
         db: Cliente de Firestore
         collection_name: Nombre de la colección
         min_quality: Puntuación mínima de calidad
         max_conversations: Número máximo de conversaciones
-    
+        page_size: Número de documentos por página
+        start_after_id: ID del último documento exportado (para reanudar)
+        max_retries: Reintentos por página ante errores de lectura
+        id_range: Rango de IDs de documento a leer (lectura particionada)
+        stop_event: Evento para detener la lectura antes de tiempo
+        end_time_after: Leer solo conversaciones con endTime posterior (modo incremental)
+        watermark_id: ID de la última conversación exportada con ese endTime (modo incremental)
+
     Returns:
-        Lista de conversaciones
+        Iterador de páginas (listas de conversaciones)
     """
-    print(f"Obteniendo conversaciones desde la colección {collection_name}...")
-    
-    try:
-        # Consultar conversaciones con calidad mínima
-        query = db.collection(collection_name)
-        
-        # Si existe el campo quality, filtrar por él
-        if min_quality > 0:
-            query = query.where("quality", ">=", min_quality)
-        
-        # Limitar el número de resultados
-        query = query.limit(max_conversations)
-        
-        # Ejecutar consulta
-        results = query.stream()
-        
-        # Procesar resultados
-        conversations = []
-        for doc in results:
+    base_query = build_conversations_query(db, collection_name, min_quality, id_range, end_time_after, watermark_id)
+
+    cursor = None
+    if start_after_id:
+        cursor = db.collection(collection_name).document(start_after_id).get()
+        if not cursor.exists:
+            raise ValueError(
+                f"El documento del checkpoint ({start_after_id}) ya no existe; "
+                "elimina el checkpoint para reiniciar la exportación"
+            )
+
+    remaining = max_conversations
+    while remaining > 0 and not (stop_event and stop_event.is_set()):
+        limit = min(page_size, remaining)
+        query = base_query
+        if cursor is not None:
+            query = query.start_after(cursor)
+
+        snapshots = _get_page(query.limit(limit), max_retries)
+        if not snapshots:
+            break
+
+        page = []
+        for doc in snapshots:
             conversation = doc.to_dict()
             conversation['id'] = doc.id
-            conversations.append(conversation)
-        
-        print(f"Se encontraron {len(conversations)} conversaciones")
-        return conversations
-    except Exception as e:
-        print(f"Error al obtener conversaciones: {e}")
-        return []
+            page.append(conversation)
+
+        yield page
+
+        cursor = snapshots[-1]
+        remaining -= len(snapshots)
+        if len(snapshots) < limit:
+            break
+
+def fetch_conversation_pages_parallel(
+    db,
+    collection_name: str,
+    min_quality: float,
+    max_conversations: int,
+    page_size: int = 500,
+    start_after_id: Optional[str] = None,
+    workers: int = 4,
+    prefetch_pages: int = 2,
+    end_time_after: Optional[datetime.datetime] = None,
+    watermark_id: Optional[str] = None
+) -> Iterator[List[Dict]]:
+    """
+    Obtiene conversaciones leyendo particiones de la colección en paralelo
+
+    Cada partición es un rango de IDs que se lee en un hilo con la misma
+    consulta ordenada que la lectura en serie. Como cada partición llega
+    ordenada, una mezcla ordenada (heapq.merge) reproduce exactamente el orden
+    y el resultado de una ejecución en serie, incluidos el límite y los
+    cursores del checkpoint. Cada hilo mantiene como máximo `prefetch_pages`
+    páginas en cola, así que la memoria sigue acotada.
+
+    Con --min-quality o --incremental la consulta combina desigualdades sobre
+    quality, endTime y __name__, lo que requiere el soporte de Firestore para
+    filtros de rango en varios campos.
+
+    Args:
+        db: Cliente de Firestore
+        collection_name: Nombre de la colección
+        min_quality: Puntuación mínima de calidad
+        max_conversations: Número máximo de conversaciones
+        page_size: Número de documentos por página
+        start_after_id: ID del último documento exportado (para reanudar)
+        workers: Número de particiones leídas en paralelo
+        prefetch_pages: Páginas en cola por partición
+        end_time_after: Leer solo conversaciones con endTime posterior (modo incremental)
+        watermark_id: ID de la última conversación exportada con ese endTime (modo incremental)
+
+    Returns:
+        Iterador de páginas (listas de conversaciones) en el orden de la lectura en serie
+    """
+    id_ranges = partition_id_ranges(workers)
+    stop_event = threading.Event()
+    done = object()
+
+    def put(out: queue.Queue, item):
+        # Esperar mientras la cola esté llena, salvo que se haya cancelado la lectura
+        while not stop_event.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def read_partition(id_range, out: queue.Queue):
+        try:
+            for page in fetch_conversation_pages(
+                db,
+                collection_name,
+                min_quality,
+                max_conversations,
+                page_size,
+                start_after_id=start_after_id,
+                id_range=id_range,
+                stop_event=stop_event,
+                end_time_after=end_time_after,
+                watermark_id=watermark_id
+            ):
+                put(out, page)
+            put(out, done)
+        except Exception as e:
+            put(out, e)
+
+    def drain(out: queue.Queue) -> Iterator[Dict]:
+        while True:
+            item = out.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+
+    queues = [queue.Queue(maxsize=prefetch_pages) for _ in id_ranges]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for id_range, out in zip(id_ranges, queues):
+            executor.submit(read_partition, id_range, out)
+
+        try:
+            merged = heapq.merge(*(drain(out) for out in queues), key=conversation_sort_key(min_quality, end_time_after))
+            merged = islice(merged, max_conversations)
+            while True:
+                page = list(islice(merged, page_size))
+                if not page:
+                    break
+                yield page
+        finally:
+            stop_event.set()
+
+def fetch_conversations(
+    db,
+    collection_name: str,
+    min_quality: float,
+    max_conversations: int,
+    page_size: int = 500,
+    workers: int = 1
+) -> Iterator[Dict]:
+    """
+    Obtiene conversaciones de Firestore como un flujo
+
+    Args:
+        db: Cliente de Firestore
+        collection_name: Nombre de la colección
+        min_quality: Puntuación mínima de calidad
+        max_conversations: Número máximo de conversaciones
+        page_size: Número de documentos por página
+        workers: Número de particiones leídas en paralelo
+
+    Returns:
+        Iterador de conversaciones
+    """
+    if workers > 1:
+        pages = fetch_conversation_pages_parallel(db, collection_name, min_quality, max_conversations, page_size, workers=workers)
+    else:
+        pages = fetch_conversation_pages(db, collection_name, min_quality, max_conversations, page_size)
+    for page in pages:
+        yield from page
+
+def open_conversation_pages(
+    db,
+    collection_name: str,
+    min_quality: float,
+    max_conversations: int,
+    page_size: int,
+    start_after_id: Optional[str] = None,
+    workers: int = 1,
+    end_time_after: Optional[datetime.datetime] = None,
+    watermark_id: Optional[str] = None,
+    sampler: Optional[ConversationSampler] = None
+) -> Iterator[List[Dict]]:
+    """
+    Elige la lectura en serie o por particiones en paralelo
+
+    Con `sampler` se recorre la consulta completa (sin límite) y se devuelve
+    solo la muestra, después de leer la última página.
+
+    Args:
+        db: Cliente de Firestore
+        collection_name: Nombre de la colección
+        min_quality: Puntuación mínima de calidad
+        max_conversations: Número máximo de conversaciones
+        page_size: Número de documentos por página
+        start_after_id: Continuar después de este documento (checkpoint)
+        workers: Número de particiones leídas en paralelo (1 = lectura en serie)
+        end_time_after: Leer solo conversaciones con endTime posterior (modo incremental)
+        watermark_id: ID de la última conversación exportada con ese endTime (modo incremental)
+        sampler: Muestreo de la colección (None = las primeras `max_conversations`)
+
+    Returns:
+        Iterador de páginas de conversaciones
+    """
+    if sampler is not None:
+        pages = open_conversation_pages(
+            db,
+            collection_name,
+            min_quality,
+            sys.maxsize,
+            page_size,
+            workers=workers,
+            end_time_after=end_time_after,
+            watermark_id=watermark_id
+        )
+        return sample_pages(pages, sampler, page_size, start_after_id)
+    if workers > 1:
+        return fetch_conversation_pages_parallel(
+            db,
+            collection_name,
+            min_quality,
+            max_conversations,
+            page_size,
+            start_after_id=start_after_id,
+            workers=workers,
+            end_time_after=end_time_after,
+            watermark_id=watermark_id
+        )
+    return fetch_conversation_pages(
+        db,
+        collection_name,
+        min_quality,
+        max_conversations,
+        page_size,
+        start_after_id=start_after_id,
+        end_time_after=end_time_after,
+        watermark_id=watermark_id
+    )
 
-def process_conversations(conversations: List[Dict]) -> List[Dict]:
+def process_conversations(
+    conversations: Iterable[Dict],
+    deduplicator: Optional[Deduplicator] = None,
+    assistant_role: str = ASSISTANT_ROLE,
+    windower: Optional[Windower] = None,
+    scorer: Optional[QualityScorer] = None,
+    scrubber: Optional[PIIScrubber] = None
+) -> Iterator[Dict]:
     """
     Procesa las conversaciones para convertirlas en datos de entrenamiento
-    
+
     Args:
-        conversations: Lista de conversaciones
-    
+        conversations: Iterable de conversaciones
+        deduplicator: Etapa de deduplicación (None = no eliminar duplicados)
+        assistant_role: Rol de las respuestas (MODEL_ROLE escribe el formato de Vertex AI)
+        windower: División en ventanas de las conversaciones largas (None = no dividir)
+        scorer: Puntuación de calidad local (None = no filtrar por calidad)
+        scrubber: Sustitución de datos personales (None = conservarlos)
+
     Returns:
-        Lista de ejemplos de entrenamiento
+        Iterador de ejemplos de entrenamiento
     """
-    print("Procesando conversaciones...")
-    
-    training_examples = []
-    
-    for conversation in conversations:
-        # Obtener mensajes de la conversación
-        messages = conversation.get("messages", [])
-        
-        if len(messages) < 2:
-            continue  # Ignorar conversaciones con menos de 2 mensajes
-        
-        # Convertir mensajes al formato requerido
-        formatted_messages = []
-        
-        for message in messages:
-            role = message.get("sender", "user").lower()
-            content = message.get("text", "")
-            
-            # Convertir roles al formato esperado
-            if role == "ai":
-                role = "assistant"
-            
-            formatted_messages.append({
-                "role": role,
-                "content": content
-            })
-        
-        # Crear ejemplo de entrenamiento
-        training_example = {
-            "messages": formatted_messages
-        }
-        
-        training_examples.append(training_example)
-    
-    print(f"Se procesaron {len(training_examples)} ejemplos de entrenamiento")
-    return training_examples
+    stages = [
+        conversations_to_examples,
+        filter_examples,  # Ignorar conversaciones con menos de 2 mensajes
+        lambda examples: normalize_roles(examples, assistant_role)
+    ]
+    if scrubber is not None:
+        # Antes que el resto de etapas: ninguna ve los datos personales, y un
+        # nombre presentado al principio se sustituye en todas las ventanas
+        stages.append(lambda examples: scrub_pii(examples, scrubber))
+    if scorer is not None:
+        stages.append(lambda examples: filter_quality(examples, scorer))
+    if deduplicator is not None:
+        stages.append(lambda examples: deduplicate(examples, deduplicator))
+    if windower is not None:
+        # Después de deduplicar: se comparan conversaciones completas, no ventanas
+        stages.append(lambda examples: window_examples(examples, windower))
+    if assistant_role == MODEL_ROLE:
+        stages.append(strip_metadata)
+    return run_pipeline(conversations, *stages)
 
-def save_training_data(examples: List[Dict], output_file: str):
+def save_training_data(examples: Iterable[Dict], output_file: str, compression: Optional[str] = None) -> int:
     """
     Guarda los ejemplos de entrenamiento en un archivo JSONL
     
     Args:
-        examples: Lista de ejemplos de entrenamiento
+        examples: Iterable de ejemplos de entrenamiento
         output_file: Ruta del archivo de salida
+        compression: Compresión de la salida (None = según la extensión)
+
+    Returns:
+        Número de ejemplos guardados
     """
     print(f"Guardando datos de entrenamiento en {output_file}...")
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for example in examples:
-            f.write(json.dumps(example) + "\n")
+    count = save_jsonl(examples, output_file, compression=compression)
     
-    print(f"Se guardaron {len(examples)} ejemplos en {output_file}")
+    print(f"Se guardaron {count} ejemplos en {output_file}")
+    return count
+
+def conversation_rows(
+    conversations: Iterable[Dict],
+    scorer: Optional[QualityScorer] = None,
+    scrubber: Optional[PIIScrubber] = None
+) -> Iterator[Dict]:
+    """
+    Convierte conversaciones en filas del almacén columnar
+
+    Los mensajes se guardan ya normalizados (role/content). La calidad es la
+    puntuación local si hay `scorer` y, si no, el campo quality de Firestore;
+    no se descarta ninguna conversación por calidad, el filtro se aplica al
+    leer el almacén.
+
+    Args:
+        conversations: Conversaciones de una página
+        scorer: Puntuación de calidad local (None = usar el campo de Firestore)
+        scrubber: Sustitución de datos personales (None = conservarlos)
+
+    Returns:
+        Iterador de filas
+    """
+    conversations = [c for c in conversations if len(c.get("messages", [])) >= 2]
+    examples = normalize_roles(conversations_to_examples(conversations))
+    if scrubber is not None:
+        examples = scrubber.scrub(examples)
+    examples = list(examples)
+    if scorer is not None:
+        qualities = scorer.scores(examples)
+    else:
+        qualities = (conversation.get("quality") for conversation in conversations)
+    for conversation, example, quality in zip(conversations, examples, qualities):
+        yield {
+            "id": conversation.get("id"),
+            "userId": conversation.get("userId"),
+            "quality": quality,
+            "startTime": conversation.get("startTime"),
+            "endTime": conversation.get("endTime"),
+            "messages": example["messages"],
+        }
+
+def load_checkpoint(checkpoint_file: str) -> Optional[Dict]:
+    """
+    Carga el checkpoint de una exportación anterior, si existe
+
+    Args:
+        checkpoint_file: Ruta del archivo de checkpoint
+
+    Returns:
+        Estado guardado o None
+    """
+    if not os.path.exists(checkpoint_file):
+        return None
+    with open(checkpoint_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def write_json_atomic(path: str, data: Dict):
+    """
+    Escribe un archivo JSON de forma atómica (escritura a temporal + reemplazo)
+
+    Args:
+        path: Ruta del archivo
+        data: Datos a guardar
+    """
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_file, path)
+
+def save_checkpoint(checkpoint_file: str, state: Dict):
+    """
+    Guarda el checkpoint de forma atómica
+
+    Args:
+        checkpoint_file: Ruta del archivo de checkpoint
+        state: Estado de la exportación
+    """
+    write_json_atomic(checkpoint_file, state)
+
+def load_manifest(manifest_file: str) -> Optional[Dict]:
+    """
+    Carga el manifiesto de la exportación incremental, si existe
+
+    Args:
+        manifest_file: Ruta del manifiesto
+
+    Returns:
+        Manifiesto o None
+    """
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def update_manifest(manifest_file: str, manifest: Optional[Dict], collection_name: str, output_file: str, state: Dict) -> Dict:
+    """
+    Actualiza el manifiesto con los totales y la nueva marca de agua
+
+    Args:
+        manifest_file: Ruta del manifiesto
+        manifest: Manifiesto anterior (o None en la primera ejecución)
+        collection_name: Nombre de la colección
+        output_file: Ruta del archivo de salida
+        state: Estado final de la exportación
+
+    Returns:
+        Manifiesto actualizado
+    """
+    manifest = manifest or {"total_documents": 0, "total_examples": 0, "watermark": None}
+    manifest.update({
+        "collection": collection_name,
+        "output": output_file,
+        "watermark": state["watermark"] or manifest["watermark"],
+        "total_documents": manifest["total_documents"] + state["documents"],
+        "total_examples": manifest["total_examples"] + state["examples"],
+        "output_bytes": state["output_bytes"],
+        "last_run": {
+            "finished_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "documents": state["documents"],
+            "examples": state["examples"]
+        }
+    })
+    write_json_atomic(manifest_file, manifest)
+    return manifest
+
+def export_conversations(
+    db,
+    collection_name: str,
+    min_quality: float,
+    max_conversations: int,
+    output_file: str,
+    page_size: int,
+    checkpoint_file: str,
+    workers: int = 1,
+    end_time_after: Optional[datetime.datetime] = None,
+    watermark_id: Optional[str] = None,
+    append: bool = False,
+    deduplicator: Optional[Deduplicator] = None,
+    assistant_role: str = ASSISTANT_ROLE,
+    compression: str = "none",
+    windower: Optional[Windower] = None,
+    scorer: Optional[QualityScorer] = None,
+    scrubber: Optional[PIIScrubber] = None,
+    sampler: Optional[ConversationSampler] = None
+) -> Dict:
+    """
+    Exporta conversaciones a JSONL en streaming, con checkpoint por página
+
+    Tras escribir cada página se guarda el cursor (ID del último documento) y
+    el tamaño del archivo de salida. Si la exportación falla, la siguiente
+    ejecución trunca el archivo a ese tamaño y continúa desde esa página.
+
+    Args:
+        db: Cliente de Firestore
+        collection_name: Nombre de la colección
+        min_quality: Puntuación mínima de calidad
+        max_conversations: Número máximo de conversaciones
+        output_file: Ruta del archivo de salida
+        page_size: Número de documentos por página
+        checkpoint_file: Ruta del archivo de checkpoint
+        workers: Número de particiones leídas en paralelo (1 = lectura en serie)
+        end_time_after: Leer solo conversaciones con endTime posterior (modo incremental)
+        watermark_id: ID de la última conversación exportada con ese endTime (modo incremental)
+        append: Añadir al archivo de salida en lugar de sobrescribirlo
+        deduplicator: Etapa de deduplicación (None = no eliminar duplicados)
+        assistant_role: Rol de las respuestas (MODEL_ROLE escribe el formato de Vertex AI)
+        compression: Compresión de la salida ("none", "gzip" o "zstd")
+        windower: División en ventanas de las conversaciones largas (None = no dividir)
+        scorer: Puntuación de calidad local (None = no filtrar por calidad)
+        scrubber: Sustitución de datos personales (None = conservarlos)
+        sampler: Muestreo de la colección (None = las primeras `max_conversations`)
+
+    Returns:
+        Estado final: documentos leídos, ejemplos escritos, tamaño de la salida
+        y marca de agua (endTime e ID de la última conversación en modo incremental)
+    """
+    since = {"endTime": end_time_after.isoformat(), "id": watermark_id} if end_time_after else None
+    sample = sampler.config() if sampler is not None else None
+
+    state = load_checkpoint(checkpoint_file)
+    if state and (
+        state.get("collection") != collection_name
+        or state.get("min_quality") != min_quality
+        or state.get("since") != since
+        or state.get("sample") != sample
+        or not os.path.exists(output_file)
+    ):
+        print("El checkpoint no corresponde a esta exportación, se ignora")
+        state = None
+
+    if state:
+        print(f"Reanudando exportación después del documento {state['cursor']}...")
+        with open(output_file, 'r+b') as f:
+            f.truncate(state["output_bytes"])
+        mode = 'ab'
+    else:
+        append = append and os.path.exists(output_file)
+        state = {
+            "collection": collection_name,
+            "min_quality": min_quality,
+            "since": since,
+            "sample": sample,
+            "cursor": None,
+            "watermark": None,
+            "documents": 0,
+            "examples": 0,
+            "output_bytes": os.path.getsize(output_file) if append else 0
+        }
+        mode = 'ab' if append else 'wb'
+
+    print(f"Obteniendo conversaciones desde la colección {collection_name}...")
+
+    pages = open_conversation_pages(
+        db,
+        collection_name,
+        min_quality,
+        max_conversations - state["documents"],
+        page_size,
+        state["cursor"],
+        workers,
+        end_time_after,
+        watermark_id,
+        sampler
+    )
+
+    with open(output_file, mode) as f:
+        # El tiempo de espera de cada página se mide aparte del procesamiento
+        for page in metrics().timed_iter(pages, "fetch"):
+            with metrics().timer("process"):
+                examples = write_jsonl(
+                    f,
+                    process_conversations(page, deduplicator, assistant_role, windower, scorer, scrubber),
+                    compression=compression
+                )
+            state["examples"] += examples
+            state["documents"] += len(page)
+            state["cursor"] = page[-1]["id"]
+            if end_time_after is not None:
+                state["watermark"] = conversation_watermark(sampler.last_seen if sampler is not None else page[-1])
+
+            f.flush()
+            metrics().inc("bytes_written", f.tell() - state["output_bytes"])
+            metrics().inc("documents_read", len(page))
+            metrics().inc("examples_written", examples)
+            state["output_bytes"] = f.tell()
+            with metrics().timer("checkpoint"):
+                save_checkpoint(checkpoint_file, state)
+
+            print(f"Leídas {state['documents']} conversaciones, {state['examples']} ejemplos escritos")
 
-def create_firestore_schema():
+    # La exportación terminó correctamente: el checkpoint ya no es necesario
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    print(f"Se encontraron {state['documents']} conversaciones")
+    print(f"Se guardaron {state['examples']} ejemplos en {output_file}")
+    return state
+
+def export_conversation_store(
+    db,
+    collection_name: str,
+    min_quality: float,
+    max_conversations: int,
+    output_dir: str,
+    page_size: int,
+    checkpoint_file: str,
+    store_format: str = "parquet",
+    workers: int = 1,
+    end_time_after: Optional[datetime.datetime] = None,
+    watermark_id: Optional[str] = None,
+    append: bool = False,
+    scorer: Optional[QualityScorer] = None,
+    rows_per_part: int = 1_000_000,
+    scrubber: Optional[PIIScrubber] = None,
+    sampler: Optional[ConversationSampler] = None
+) -> Dict:
+    """
+    Exporta conversaciones a un almacén columnar (ver conversation_store.py)
+
+    Las páginas se acumulan en la parte actual del almacén; cuando tiene
+    `rows_per_part` filas se cierra y se guarda el checkpoint. Si la
+    exportación falla, la parte a medio escribir se descarta y la siguiente
+    ejecución continúa desde la última parte cerrada.
+
+    Args:
+        db: Cliente de Firestore
+        collection_name: Nombre de la colección
+        min_quality: Puntuación mínima de calidad de la consulta
+        max_conversations: Número máximo de conversaciones
+        output_dir: Directorio del almacén
+        page_size: Número de documentos por página
+        checkpoint_file: Ruta del archivo de checkpoint
+        store_format: "parquet" o "arrow"
+        workers: Número de particiones leídas en paralelo (1 = lectura en serie)
+        end_time_after: Leer solo conversaciones con endTime posterior (modo incremental)
+        watermark_id: ID de la última conversación exportada con ese endTime (modo incremental)
+        append: Añadir partes al almacén en lugar de vaciarlo
+        scorer: Puntuación de calidad local que se guarda en la columna quality
+        rows_per_part: Conversaciones por archivo del almacén
+        scrubber: Sustitución de datos personales (None = conservarlos)
+        sampler: Muestreo de la colección (None = las primeras `max_conversations`)
+
+    Returns:
+        Estado final: documentos leídos, conversaciones escritas, tamaño del
+        almacén y marca de agua (modo incremental)
+    """
+    from conversation_store import ConversationStoreWriter, store_parts
+
+    since = {"endTime": end_time_after.isoformat(), "id": watermark_id} if end_time_after else None
+    sample = sampler.config() if sampler is not None else None
+
+    state = load_checkpoint(checkpoint_file)
+    if state and (
+        state.get("collection") != collection_name
+        or state.get("min_quality") != min_quality
+        or state.get("since") != since
+        or state.get("sample") != sample
+        or state.get("format") != store_format
+        or not os.path.isdir(output_dir)
+    ):
+        print("El checkpoint no corresponde a esta exportación, se ignora")
+        state = None
+
+    if state:
+        print(f"Reanudando exportación después del documento {state['cursor']}...")
+        append = True
+    else:
+        append = append and os.path.isdir(output_dir)
+        state = {
+            "collection": collection_name,
+            "min_quality": min_quality,
+            "since": since,
+            "sample": sample,
+            "format": store_format,
+            "cursor": None,
+            "watermark": None,
+            "documents": 0,
+            "examples": 0,
+            "output_bytes": 0
+        }
+
+    writer = ConversationStoreWriter(output_dir, store_format, append=append)
+
+    def commit():
+        with metrics().timer("checkpoint"):
+            writer.commit()
+            state["output_bytes"] = sum(os.path.getsize(part) for part in store_parts(output_dir))
+            save_checkpoint(checkpoint_file, state)
+
+    print(f"Obteniendo conversaciones desde la colección {collection_name}...")
+
+    pages = open_conversation_pages(
+        db,
+        collection_name,
+        min_quality,
+        max_conversations - state["documents"],
+        page_size,
+        state["cursor"],
+        workers,
+        end_time_after,
+        watermark_id,
+        sampler
+    )
+
+    for page in metrics().timed_iter(pages, "fetch"):
+        with metrics().timer("process"):
+            examples = writer.write(conversation_rows(page, scorer, scrubber))
+        state["examples"] += examples
+        state["documents"] += len(page)
+        state["cursor"] = page[-1]["id"]
+        if end_time_after is not None:
+            state["watermark"] = conversation_watermark(sampler.last_seen if sampler is not None else page[-1])
+        metrics().inc("documents_read", len(page))
+        metrics().inc("examples_written", examples)
+
+        if writer.pending_rows >= rows_per_part:
+            commit()
+
+        print(f"Leídas {state['documents']} conversaciones, {state['examples']} guardadas en el almacén")
+
+    commit()
+    metrics().inc("bytes_written", writer.bytes_written)
+
+    # La exportación terminó correctamente: el checkpoint ya no es necesario
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    print(f"Se encontraron {state['documents']} conversaciones")
+    print(f"Se guardaron {state['examples']} conversaciones en {output_dir} ({store_format}, {len(store_parts(output_dir))} archivos)")
+    return state
+
+def create_sample_conversations() -> List[Dict]:
+    """
+    Crea conversaciones de ejemplo para cuando no hay datos en Firestore
+
+    Returns:
+        Lista de conversaciones de ejemplo
+    """
+    current_time = datetime.datetime.now()
+    return [
+        {
+            "id": "example1",
+            "userId": "user123",
+            "startTime": current_time,
+            "endTime": current_time + datetime.timedelta(minutes=5),
+            "quality": 0.9,
+            "messages": [
+                {"sender": "user", "text": "¿Qué es CognIA?", "timestamp": current_time},
+                {"sender": "ai", "text": "CognIA es una plataforma educativa avanzada que utiliza inteligencia artificial para personalizar el aprendizaje. Ofrecemos cursos adaptativos que se ajustan a las necesidades individuales de cada estudiante.", "timestamp": current_time + datetime.timedelta(seconds=30)}
+            ]
+        },
+        {
+            "id": "example2",
+            "userId": "user456",
+            "startTime": current_time,
+            "endTime": current_time + datetime.timedelta(minutes=10),
+            "quality": 0.85,
+            "messages": [
+                {"sender": "user", "text": "¿Cómo puedo acceder a mis cursos?", "timestamp": current_time},
+                {"sender": "ai", "text": "Puedes acceder a tus cursos iniciando sesión en la plataforma y yendo a la sección 'Mis Cursos'. Allí encontrarás todos los cursos en los que estás inscrito.", "timestamp": current_time + datetime.timedelta(seconds=30)},
+                {"sender": "user", "text": "¿Y si olvido mi contraseña?", "timestamp": current_time + datetime.timedelta(minutes=1)},
+                {"sender": "ai", "text": "Si olvidas tu contraseña, puedes usar la opción 'Olvidé mi contraseña' en la página de inicio de sesión. Te enviaremos un enlace a tu correo electrónico para restablecerla.", "timestamp": current_time + datetime.timedelta(minutes=1, seconds=30)}
+            ]
+        }
+    ]
+
+def create_firestore_schema(schema_file: str = "firestore_schema.json"):
     """
     Crea un archivo de ejemplo con la estructura de Firestore para conversaciones
+
+    Args:
+        schema_file: Ruta del archivo del esquema
     """
     schema = {
         "collections": [
@@ -189,7 +1071,6 @@ def create_firestore_schema():
         ]
     }
     
-    schema_file = "firestore_schema.json"
     with open(schema_file, 'w', encoding='utf-8') as f:
         json.dump(schema, f, indent=2)
     
@@ -197,66 +1078,200 @@ def create_firestore_schema():
 
 def main():
     args = parser.parse_args()
+    checkpoint_file = args.checkpoint or f"{args.output}.checkpoint.json"
+    manifest_file = args.manifest or f"{args.output}.manifest.json"
+    compression = args.compression or compression_for_path(args.output)
+    output_format = args.format or next(
+        (name for name in ("parquet", "arrow") if args.output.rstrip("/\\").endswith(f".{name}")),
+        "jsonl"
+    )
+    columnar = output_format != "jsonl"
+    if args.sample_by != "none" and args.sampling != "reservoir":
+        parser.error("--sample-by requiere --sampling reservoir")
+    if args.sample_by != "none" and not args.sample_per_stratum:
+        parser.error("--sample-by requiere --sample-per-stratum")
+    scorer = None
+    scrubber = None
+    sampler = None
+    codec = set_default_codec(args.codec)
+    print(f"Serializador JSON: {codec.name}")
+    metrics().configure("collect-training-data", args.metrics_json, args.metrics_prom, args.profile, args.profile_output)
+    success = False
     
-    # Crear esquema de ejemplo
-    create_firestore_schema()
+    # Crear esquema de ejemplo (solo si se pide)
+    if args.schema_output:
+        create_firestore_schema(args.schema_output)
     
     try:
         # Inicializar Firestore
         db = initialize_firestore(args.project)
         
-        # Obtener conversaciones
-        conversations = fetch_conversations(
-            db,
-            args.collection,
-            args.min_quality,
-            args.max_conversations
-        )
+        # En modo incremental, continuar desde la marca de agua del manifiesto
+        manifest = None
+        end_time_after = None
+        watermark_id = None
+        if args.incremental:
+            manifest = load_manifest(manifest_file)
+            if manifest and isinstance(manifest.get("watermark"), str):
+                # Manifiestos anteriores: solo endTime, ya exportado por completo
+                manifest["watermark"] = {"endTime": manifest["watermark"], "id": None}
+            if manifest and manifest.get("watermark"):
+                end_time_after = datetime.datetime.fromisoformat(manifest["watermark"]["endTime"])
+                watermark_id = manifest["watermark"]["id"]
+                print(f"Exportación incremental: conversaciones posteriores a {format_watermark(manifest['watermark'])}")
+            else:
+                end_time_after = INITIAL_WATERMARK
+                print("No hay manifiesto previo: la exportación incremental empieza desde el principio")
         
-        if not conversations:
-            print("No se encontraron conversaciones. Creando datos de ejemplo...")
-            # Simular algunos datos de ejemplo
-            current_time = datetime.datetime.now()
-            conversations = [
-                {
-                    "id": "example1",
-                    "userId": "user123",
-                    "startTime": current_time,
-                    "endTime": current_time + datetime.timedelta(minutes=5),
-                    "quality": 0.9,
-                    "messages": [
-                        {"sender": "user", "text": "¿Qué es CognIA?", "timestamp": current_time},
-                        {"sender": "ai", "text": "CognIA es una plataforma educativa avanzada que utiliza inteligencia artificial para personalizar el aprendizaje. Ofrecemos cursos adaptativos que se ajustan a las necesidades individuales de cada estudiante.", "timestamp": current_time + datetime.timedelta(seconds=30)}
-                    ]
-                },
-                {
-                    "id": "example2",
-                    "userId": "user456",
-                    "startTime": current_time,
-                    "endTime": current_time + datetime.timedelta(minutes=10),
-                    "quality": 0.85,
-                    "messages": [
-                        {"sender": "user", "text": "¿Cómo puedo acceder a mis cursos?", "timestamp": current_time},
-                        {"sender": "ai", "text": "Puedes acceder a tus cursos iniciando sesión en la plataforma y yendo a la sección 'Mis Cursos'. Allí encontrarás todos los cursos en los que estás inscrito.", "timestamp": current_time + datetime.timedelta(seconds=30)},
-                        {"sender": "user", "text": "¿Y si olvido mi contraseña?", "timestamp": current_time + datetime.timedelta(minutes=1)},
-                        {"sender": "ai", "text": "Si olvidas tu contraseña, puedes usar la opción 'Olvidé mi contraseña' en la página de inicio de sesión. Te enviaremos un enlace a tu correo electrónico para restablecerla.", "timestamp": current_time + datetime.timedelta(minutes=1, seconds=30)}
-                    ]
-                }
-            ]
+        deduplicator = None
+        if args.dedup != "none":
+            deduplicator = Deduplicator(
+                threshold=args.dedup_threshold,
+                window=args.dedup_window,
+                near=args.dedup == "near"
+            )
         
-        # Procesar conversaciones
-        training_examples = process_conversations(conversations)
+        windower = Windower(args.max_tokens, args.window_overlap) if args.max_tokens else None
         
-        # Guardar datos de entrenamiento
-        save_training_data(training_examples, args.output)
+        if args.pii == "scrub":
+            scrubber = PIIScrubber(
+                [category.strip().upper() for category in args.pii_categories.split(",") if category.strip()],
+                salt=args.pii_salt,
+                workers=args.pii_workers
+            )
+        
+        if args.sampling == "reservoir":
+            sampler = ConversationSampler(
+                args.max_conversations,
+                seed=args.sample_seed,
+                stratify=None if args.sample_by == "none" else args.sample_by,
+                per_stratum=args.sample_per_stratum
+            )
+            print(f"Se tomará una muestra de {args.max_conversations} conversaciones de toda la colección (se lee la consulta completa)")
+        
+        # Con la calidad local, la consulta no filtra por el campo quality
+        query_min_quality = args.min_quality
+        if args.quality_source == "local":
+            query_min_quality = 0
+            if args.min_quality > 0 or columnar:
+                scorer = QualityScorer(
+                    args.min_quality,
+                    args.quality_workers,
+                    languages=args.languages.split(","),
+                    page_size=args.page_size
+                )
+        
+        if columnar:
+            # El almacén guarda todas las conversaciones con su calidad: el
+            # filtro, la deduplicación y las ventanas se aplican al generar el
+            # JSONL con query-conversations.py
+            print("Formato columnar: la calidad, la deduplicación y las ventanas se aplican después con query-conversations.py")
+            deduplicator = None
+            windower = None
+            state = export_conversation_store(
+                db,
+                args.collection,
+                0,
+                args.max_conversations,
+                args.output,
+                args.page_size,
+                checkpoint_file,
+                store_format=output_format,
+                workers=args.workers,
+                end_time_after=end_time_after,
+                watermark_id=watermark_id,
+                append=manifest is not None,
+                scorer=scorer,
+                rows_per_part=args.rows_per_part,
+                scrubber=scrubber,
+                sampler=sampler
+            )
+        else:
+            # Obtener, procesar y guardar conversaciones en streaming
+            state = export_conversations(
+                db,
+                args.collection,
+                query_min_quality,
+                args.max_conversations,
+                args.output,
+                args.page_size,
+                checkpoint_file,
+                workers=args.workers,
+                end_time_after=end_time_after,
+                watermark_id=watermark_id,
+                append=manifest is not None,
+                deduplicator=deduplicator,
+                assistant_role=MODEL_ROLE if args.vertex else ASSISTANT_ROLE,
+                compression=compression,
+                windower=windower,
+                scorer=scorer,
+                scrubber=scrubber,
+                sampler=sampler
+            )
+        
+        if sampler is not None:
+            metrics().inc("documents_scanned", sampler.seen)
+            metrics().inc("sample_capped", sampler.capped)
+            print(sampler.summary())
+        if scorer is not None and not columnar:
+            metrics().inc("quality_rejected", scorer.rejected)
+            print(scorer.summary())
+        if scrubber is not None:
+            for category, count in scrubber.counts.items():
+                metrics().inc(f"pii_{category.lower()}", count)
+            print(scrubber.summary())
+        if deduplicator is not None:
+            metrics().inc("exact_duplicates", deduplicator.exact_duplicates)
+            metrics().inc("near_duplicates", deduplicator.near_duplicates)
+            print(deduplicator.summary())
+        if windower is not None:
+            metrics().inc("conversations_split", windower.split)
+            metrics().inc("windows_written", windower.windows)
+            print(windower.summary())
+        
+        if args.incremental:
+            manifest = update_manifest(manifest_file, manifest, args.collection, args.output, state)
+            print(f"Manifiesto actualizado en {manifest_file} (marca de agua: {format_watermark(manifest['watermark'])}, total: {manifest['total_examples']} ejemplos)")
+        elif state["documents"] == 0 and columnar:
+            print("No se encontraron conversaciones. Creando datos de ejemplo...")
+            from conversation_store import ConversationStoreWriter
+            writer = ConversationStoreWriter(args.output, output_format)
+            writer.write(conversation_rows(create_sample_conversations(), scorer, scrubber))
+            writer.commit()
+        elif state["documents"] == 0:
+            print("No se encontraron conversaciones. Creando datos de ejemplo...")
+            save_training_data(
+                process_conversations(
+                    create_sample_conversations(),
+                    assistant_role=MODEL_ROLE if args.vertex else ASSISTANT_ROLE,
+                    scrubber=scrubber
+                ),
+                args.output,
+                compression
+            )
         
         print("\nPróximos pasos:")
-        print("1. Revisa y refina los datos de entrenamiento en:", os.path.abspath(args.output))
-        print("2. Usa estos datos para entrenar tu modelo con el script train-gemini-model.py")
-        print(f"   python train-gemini-model.py --project={args.project} --data-file={args.output}")
+        if columnar:
+            print("1. Filtra el almacén y genera el JSONL de entrenamiento con query-conversations.py")
+            print(f"   python query-conversations.py --store={args.output} --min-quality={args.min_quality} --output=training_data.jsonl")
+            print("2. Entrena tu modelo con el script train-gemini-model.py")
+        else:
+            print("1. Revisa y refina los datos de entrenamiento en:", os.path.abspath(args.output))
+            print("2. Usa estos datos para entrenar tu modelo con el script train-gemini-model.py")
+            print(f"   python train-gemini-model.py --project={args.project} --data-file={args.output}")
+        success = True
     
     except Exception as e:
         print(f"Error en la ejecución: {e}")
+        if os.path.exists(checkpoint_file):
+            print(f"Vuelve a ejecutar el script para reanudar desde el checkpoint {checkpoint_file}")
+    
+    finally:
+        if scorer is not None:
+            scorer.close()
+        if scrubber is not None:
+            scrubber.close()
+        metrics().finish(success)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,263 @@
+"""
+Muestreo de conversaciones en una sola pasada con memoria acotada
+
+Con `query.limit(N)` la exportación devuelve siempre los N primeros
+documentos en el orden del índice, que no son representativos de la
+colección. ConversationSampler recorre la consulta completa y conserva una
+muestra uniforme de K conversaciones (muestreo de reservorio) sin guardar
+nunca más de K en memoria:
+
+- Cada conversación recibe una clave pseudoaleatoria en [0, 1): un hash del
+  ID del documento con la semilla (`seed`) como clave. La muestra son las K
+  conversaciones con las claves más pequeñas, así que es la misma con
+  cualquier orden de lectura, número de particiones o reanudación.
+- Con estratos (`stratify`: "user" por userId, "month" por mes de startTime)
+  cada estrato aporta como máximo `per_stratum` conversaciones, elegidas al
+  azar dentro del estrato, y de ellas se toman las K de clave más pequeña.
+  Un usuario muy activo o un mes con mucho tráfico no domina la muestra.
+
+Las claves son independientes de los estratos: una conversación que queda
+fuera del reservorio nunca vuelve a entrar, así que el estado son solo las
+conversaciones de la muestra (y un montículo por estrato presente en ella).
+
+Uso:
+    from conversation_sampler import ConversationSampler, sample_pages
+    sampler = ConversationSampler(1000, seed="2024", stratify="user", per_stratum=5)
+    pages = sample_pages(pages, sampler, page_size=500)
+"""
+
+import datetime
+import heapq
+from hashlib import blake2b
+from itertools import count
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Criterios de estratificación
+SAMPLE_STRATA = ("user", "month")
+
+_KEY_SCALE = 2.0 ** -64
+
+def sample_key(doc_id: str, seed: str = "") -> float:
+    """
+    Clave pseudoaleatoria y determinista de un documento
+
+    Args:
+        doc_id: ID del documento
+        seed: Semilla del muestreo (la misma semilla da la misma muestra)
+
+    Returns:
+        Clave en [0, 1)
+    """
+    digest = blake2b(doc_id.encode("utf-8"), digest_size=8, key=seed.encode("utf-8")[:64])
+    return int.from_bytes(digest.digest(), "big") * _KEY_SCALE
+
+def conversation_stratum(conversation: Dict, stratify: str) -> Optional[str]:
+    """
+    Estrato de una conversación
+
+    Args:
+        conversation: Conversación de Firestore
+        stratify: "user" (userId) o "month" (mes de startTime, "AAAA-MM")
+
+    Returns:
+        Estrato (None si falta el campo)
+    """
+    if stratify == "user":
+        return conversation.get("userId")
+    start = conversation.get("startTime")
+    if isinstance(start, (datetime.date, datetime.datetime)):
+        return f"{start.year:04d}-{start.month:02d}"
+    if isinstance(start, str):
+        return start[:7]
+    return None
+
+class ConversationSampler:
+    """
+    Muestra uniforme (o estratificada) de K conversaciones en una pasada
+
+    La muestra es un montículo de máximos con las K claves más pequeñas; cada
+    estrato tiene su propio montículo con las claves de sus conversaciones en
+    la muestra. Las entradas que un estrato expulsa quedan marcadas en el
+    montículo global y se descartan al llegar a la cima (o al compactarlo).
+    """
+
+    def __init__(
+        self,
+        size: int,
+        seed: str = "",
+        stratify: Optional[str] = None,
+        per_stratum: Optional[int] = None
+    ):
+        """
+        Args:
+            size: Tamaño de la muestra (K)
+            seed: Semilla del muestreo
+            stratify: None, "user" o "month"
+            per_stratum: Conversaciones máximas por estrato (obligatorio con `stratify`)
+        """
+        if size <= 0:
+            raise ValueError("El tamaño de la muestra debe ser positivo")
+        if stratify is not None and stratify not in SAMPLE_STRATA:
+            raise ValueError(f"Estratificación desconocida: {stratify} (disponibles: {', '.join(SAMPLE_STRATA)})")
+        if stratify is not None and (per_stratum is None or per_stratum <= 0):
+            raise ValueError("La estratificación requiere un máximo positivo de conversaciones por estrato")
+
+        self.size = size
+        self.seed = seed
+        self.stratify = stratify
+        self.per_stratum = per_stratum if stratify is not None else None
+
+        self._heap: List = []  # (-clave, orden), montículo de máximos
+        self._items: Dict[int, tuple] = {}  # orden -> (clave, estrato, conversación)
+        self._strata: Dict[Optional[str], List] = {}
+        self._order = count()
+
+        self.seen = 0
+        self.capped = 0  # Conversaciones rechazadas por el máximo de su estrato
+        self.last_seen: Optional[Dict] = None  # Última conversación leída (marca de agua)
+
+    def _top(self):
+        """
+        Entrada viva con la clave más grande de la muestra
+        """
+        heap = self._heap
+        while heap[0][1] not in self._items:
+            heapq.heappop(heap)
+        return heap[0]
+
+    def _compact(self):
+        """
+        Reconstruye el montículo global sin las entradas expulsadas
+        """
+        self._heap = [(-key, order) for order, (key, _, _) in self._items.items()]
+        heapq.heapify(self._heap)
+
+    def add(self, conversation: Dict) -> bool:
+        """
+        Ofrece una conversación a la muestra
+
+        Args:
+            conversation: Conversación con "id"
+
+        Returns:
+            True si entra (por ahora) en la muestra
+        """
+        self.seen += 1
+        self.last_seen = conversation
+        key = sample_key(str(conversation.get("id")), self.seed)
+        items = self._items
+        if len(items) >= self.size and key >= -self._top()[0]:
+            return False
+
+        order = next(self._order)
+        if self.stratify is None:
+            items[order] = (key, None, conversation)
+            heapq.heappush(self._heap, (-key, order))
+            if len(items) > self.size:
+                _, evicted = heapq.heappop(self._heap)
+                del items[evicted]
+            return True
+
+        stratum = conversation_stratum(conversation, self.stratify)
+        members = self._strata.get(stratum)
+        if members is None:
+            members = self._strata[stratum] = []
+        elif len(members) >= self.per_stratum and key >= -members[0][0]:
+            self.capped += 1
+            return False
+
+        items[order] = (key, stratum, conversation)
+        heapq.heappush(self._heap, (-key, order))
+        heapq.heappush(members, (-key, order))
+        if len(members) > self.per_stratum:
+            # El estrato supera su máximo: sale su conversación de clave más grande
+            _, evicted = heapq.heappop(members)
+            del items[evicted]
+            self.capped += 1
+            if len(self._heap) > 2 * self.size + 64:
+                self._compact()
+        elif len(items) > self.size:
+            # La clave más grande de la muestra es también la más grande de su estrato
+            _, evicted = self._top()
+            heapq.heappop(self._heap)
+            evicted_stratum = items.pop(evicted)[1]
+            evicted_members = self._strata[evicted_stratum]
+            heapq.heappop(evicted_members)
+            if not evicted_members:
+                del self._strata[evicted_stratum]
+        return True
+
+    def extend(self, conversations: Iterable[Dict]):
+        """
+        Ofrece varias conversaciones a la muestra
+        """
+        for conversation in conversations:
+            self.add(conversation)
+
+    def sample(self) -> List[Dict]:
+        """
+        Conversaciones de la muestra, en el orden en que se leyeron
+        """
+        return [self._items[order][2] for order in sorted(self._items)]
+
+    def config(self) -> Dict:
+        """
+        Parámetros del muestreo (para comprobar el checkpoint)
+        """
+        return {
+            "size": self.size,
+            "seed": self.seed,
+            "stratify": self.stratify,
+            "per_stratum": self.per_stratum,
+        }
+
+    def summary(self) -> str:
+        """
+        Resumen del muestreo
+        """
+        line = f"Muestreo: {len(self._items)} de {self.seen} conversaciones"
+        if self.stratify is not None:
+            criterion = "usuario" if self.stratify == "user" else "mes"
+            line += (
+                f" (por {criterion}, máximo {self.per_stratum} por estrato; "
+                f"{len(self._strata)} estratos en la muestra, {self.capped} descartadas por el máximo)"
+            )
+        return line
+
+def sample_pages(
+    pages: Iterable[List[Dict]],
+    sampler: ConversationSampler,
+    page_size: int,
+    start_after_id: Optional[str] = None
+) -> Iterator[List[Dict]]:
+    """
+    Recorre todas las páginas y devuelve la muestra en páginas
+
+    Como la muestra no depende del orden de lectura, al reanudar una
+    exportación se vuelve a recorrer la consulta y se continúa después de la
+    última conversación de la muestra que ya se escribió.
+
+    Args:
+        pages: Páginas de la consulta completa
+        sampler: Estado del muestreo
+        page_size: Conversaciones por página de la muestra
+        start_after_id: ID de la última conversación ya exportada (checkpoint)
+
+    Returns:
+        Iterador de páginas de la muestra (tras leer la última página de entrada)
+    """
+    for page in pages:
+        sampler.extend(page)
+    sample = sampler.sample()
+
+    start = 0
+    if start_after_id is not None:
+        ids = [conversation.get("id") for conversation in sample]
+        if start_after_id not in ids:
+            raise ValueError(
+                f"El documento del checkpoint ({start_after_id}) ya no está en la muestra; "
+                "elimina el checkpoint para reiniciar la exportación"
+            )
+        start = ids.index(start_after_id) + 1
+    for offset in range(start, len(sample), page_size):
+        yield sample[offset:offset + page_size]
@@ -0,0 +1,342 @@
+"""
+Almacén columnar de conversaciones (Parquet o Arrow IPC)
+
+Formato intermedio entre la exportación de Firestore y el JSONL final para
+Vertex AI. Cada conversación es una fila con columnas id, userId, quality,
+startTime, endTime y messages (lista de {role, content}). Como los datos
+están por columnas, filtrar por calidad o por fechas solo lee esas columnas
+(proyección) y salta los grupos de filas cuyas estadísticas min/max no
+cumplen el filtro (predicate pushdown), sin analizar el texto de los mensajes.
+
+El almacén es un directorio de archivos part-NNNNN.parquet (comprimidos con
+zstd) o part-NNNNN.arrow (sin comprimir, se leen con memory map). Cada parte
+se escribe en un temporal y se renombra al cerrarla, así que una parte
+visible siempre está completa: la exportación incremental añade partes
+nuevas y una exportación interrumpida descarta la parte a medio escribir.
+
+Requiere pyarrow (pip install pyarrow).
+
+Uso:
+    from conversation_store import count_conversations, iter_store_examples
+    count_conversations("conversations", min_quality=0.7, since=datetime.datetime(2024, 1, 1))
+    save_jsonl(iter_store_examples("conversations", min_quality=0.7), "training_data.jsonl")
+"""
+
+import datetime
+import glob
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Optional
+
+STORE_FORMATS = ("parquet", "arrow")
+PART_PATTERN = re.compile(r"part-(\d{5})\.(parquet|arrow)$")
+COLUMNS = ("id", "userId", "quality", "startTime", "endTime", "messages")
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("El almacén columnar requiere el paquete pyarrow (pip install pyarrow)")
+    return pyarrow
+
+def conversation_schema():
+    """
+    Esquema Arrow de las conversaciones
+    """
+    pa = _pyarrow()
+    timestamp = pa.timestamp("us", tz="UTC")
+    return pa.schema([
+        ("id", pa.string()),
+        ("userId", pa.string()),
+        ("quality", pa.float64()),
+        ("startTime", timestamp),
+        ("endTime", timestamp),
+        ("messages", pa.list_(pa.struct([("role", pa.string()), ("content", pa.string())]))),
+    ])
+
+def store_parts(path: str) -> List[str]:
+    """
+    Partes completas del almacén, en orden
+
+    Args:
+        path: Directorio del almacén
+
+    Returns:
+        Rutas de las partes
+    """
+    parts = [p for p in glob.glob(os.path.join(path, "part-*")) if PART_PATTERN.search(os.path.basename(p))]
+    return sorted(parts)
+
+def store_format(path: str) -> str:
+    """
+    Formato de un almacén existente ("parquet" o "arrow")
+    """
+    parts = store_parts(path)
+    if not parts:
+        raise FileNotFoundError(f"No hay partes en el almacén {path}")
+    return PART_PATTERN.search(os.path.basename(parts[0])).group(2)
+
+class ConversationStoreWriter:
+    """
+    Escribe conversaciones en partes Parquet o Arrow IPC
+
+    Las filas se acumulan en memoria hasta `row_group_size` y se escriben
+    como un grupo de filas de la parte actual; commit() cierra la parte y la
+    hace visible. Quien escribe decide cuándo cerrar cada parte (por ejemplo,
+    en el límite de una página de Firestore, para que el checkpoint coincida
+    con las partes visibles).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        store_format: str = "parquet",
+        append: bool = False,
+        row_group_size: int = 16 * 1024
+    ):
+        """
+        Args:
+            path: Directorio del almacén
+            store_format: "parquet" o "arrow"
+            append: Añadir partes a un almacén existente (si no, se vacía)
+            row_group_size: Filas por grupo de filas (unidad del predicate pushdown)
+        """
+        if store_format not in STORE_FORMATS:
+            raise ValueError(f"Formato desconocido: {store_format}")
+        self.pa = _pyarrow()
+        self.schema = conversation_schema()
+        self.path = path
+        self.store_format = store_format
+        self.row_group_size = row_group_size
+
+        os.makedirs(path, exist_ok=True)
+        for tmp_file in glob.glob(os.path.join(path, "part-*.tmp")):
+            os.remove(tmp_file)
+        existing = store_parts(path)
+        if not append:
+            for part in existing:
+                os.remove(part)
+            existing = []
+        self._next_part = max((int(PART_PATTERN.search(os.path.basename(p)).group(1)) for p in existing), default=-1) + 1
+
+        self._columns = {name: [] for name in COLUMNS}
+        self._buffered = 0
+        self._writer = None
+        self._sink = None
+        self._tmp_file = None
+        self.part_rows = 0
+        self.rows = 0
+        self.parts: List[str] = []
+        self.bytes_written = 0
+
+    def write(self, rows: Iterable[Dict]) -> int:
+        """
+        Añade conversaciones (diccionarios con las columnas del esquema)
+
+        Returns:
+            Número de filas añadidas
+        """
+        count = 0
+        columns = self._columns
+        for row in rows:
+            for name in COLUMNS:
+                columns[name].append(row.get(name))
+            self._buffered += 1
+            count += 1
+            if self._buffered >= self.row_group_size:
+                self._write_row_group()
+        self.rows += count
+        return count
+
+    @property
+    def pending_rows(self) -> int:
+        """
+        Filas de la parte actual que aún no son visibles
+        """
+        return self.part_rows + self._buffered
+
+    def _open_part(self):
+        final = os.path.join(self.path, f"part-{self._next_part:05d}.{self.store_format}")
+        self._tmp_file = f"{final}.tmp"
+        if self.store_format == "parquet":
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(self._tmp_file, self.schema, compression="zstd")
+        else:
+            self._sink = self.pa.OSFile(self._tmp_file, "wb")
+            self._writer = self.pa.ipc.new_file(self._sink, self.schema)
+
+    def _write_row_group(self):
+        if not self._buffered:
+            return
+        if self._writer is None:
+            self._open_part()
+        table = self.pa.Table.from_pydict(self._columns, schema=self.schema)
+        if self.store_format == "parquet":
+            self._writer.write_table(table, row_group_size=self._buffered)
+        else:
+            self._writer.write_table(table)
+        self.part_rows += self._buffered
+        self._columns = {name: [] for name in COLUMNS}
+        self._buffered = 0
+
+    def commit(self) -> Optional[str]:
+        """
+        Escribe las filas pendientes, cierra la parte actual y la hace visible
+
+        Returns:
+            Ruta de la parte cerrada (None si no había filas)
+        """
+        self._write_row_group()
+        if self._writer is None:
+            return None
+
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+        final = self._tmp_file[:-len(".tmp")]
+        os.replace(self._tmp_file, final)
+        self.bytes_written += os.path.getsize(final)
+        self.parts.append(final)
+        self._writer = None
+        self._tmp_file = None
+        self.part_rows = 0
+        self._next_part += 1
+        return final
+
+    def close(self):
+        """
+        Cierra la parte actual (equivale a commit)
+        """
+        self.commit()
+
+def _as_utc(value: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+def store_filter(
+    min_quality: Optional[float] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    user_ids: Optional[List[str]] = None
+):
+    """
+    Construye la expresión de filtro de pyarrow.dataset
+
+    Args:
+        min_quality: Calidad mínima (inclusive)
+        since: endTime mínimo (inclusive; sin zona horaria = UTC)
+        until: endTime máximo (exclusivo; sin zona horaria = UTC)
+        user_ids: Solo conversaciones de estos usuarios
+
+    Returns:
+        Expresión o None si no hay filtros
+    """
+    _pyarrow()
+    import pyarrow.dataset as ds
+
+    conditions = []
+    if min_quality is not None:
+        conditions.append(ds.field("quality") >= min_quality)
+    if since is not None:
+        conditions.append(ds.field("endTime") >= _as_utc(since))
+    if until is not None:
+        conditions.append(ds.field("endTime") < _as_utc(until))
+    if user_ids:
+        conditions.append(ds.field("userId").isin(user_ids))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def open_store(path: str):
+    """
+    Abre el almacén como un dataset de pyarrow
+
+    Las partes Arrow IPC se leen con memory map (sin copiar a memoria); las
+    Parquet se leen por columnas y grupos de filas.
+    """
+    _pyarrow()
+    import pyarrow.dataset as ds
+    import pyarrow.fs as fs
+
+    file_format = store_format(path)
+    return ds.dataset(
+        store_parts(path),
+        schema=conversation_schema(),
+        format="ipc" if file_format == "arrow" else "parquet",
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+def count_conversations(path: str, **filters) -> int:
+    """
+    Cuenta las conversaciones que cumplen los filtros (ver store_filter)
+
+    Solo se leen las columnas de los filtros.
+    """
+    return open_store(path).count_rows(filter=store_filter(**filters))
+
+def scan_conversations(
+    path: str,
+    columns: Optional[List[str]] = None,
+    batch_size: int = 16 * 1024,
+    **filters
+) -> Iterator:
+    """
+    Recorre el almacén por lotes con proyección de columnas y filtros
+
+    Args:
+        path: Directorio del almacén
+        columns: Columnas a leer (None = todas)
+        batch_size: Filas máximas por lote
+        filters: Filtros de store_filter
+
+    Returns:
+        Iterador de pyarrow.RecordBatch
+    """
+    dataset = open_store(path)
+    yield from dataset.to_batches(columns=columns, filter=store_filter(**filters), batch_size=batch_size)
+
+def iter_store_examples(path: str, **filters) -> Iterator[Dict]:
+    """
+    Lee los ejemplos (columnas messages y userId) de las conversaciones que cumplen los filtros
+
+    Args:
+        path: Directorio del almacén
+        filters: Filtros de store_filter
+
+    Returns:
+        Iterador de ejemplos {"messages": [...], "userId": ...}
+    """
+    for batch in scan_conversations(path, columns=["messages", "userId"], **filters):
+        for messages, user_id in zip(batch.column(0).to_pylist(), batch.column(1).to_pylist()):
+            example = {"messages": messages}
+            if user_id is not None:
+                example["userId"] = user_id
+            yield example
+
+def store_summary(path: str, **filters) -> Dict:
+    """
+    Estadísticas de las conversaciones que cumplen los filtros, sin leer los mensajes
+
+    Returns:
+        Conversaciones, usuarios distintos, calidad media y rango de endTime
+    """
+    _pyarrow()
+    import pyarrow.compute as pc
+
+    table = open_store(path).to_table(columns=["userId", "quality", "endTime"], filter=store_filter(**filters))
+    if table.num_rows == 0:
+        return {"conversations": 0}
+    end_times = pc.min_max(table.column("endTime"))
+    quality = pc.mean(table.column("quality")).as_py()
+    return {
+        "conversations": table.num_rows,
+        "users": pc.count_distinct(table.column("userId")).as_py(),
+        "mean_quality": quality,
+        "first_end_time": end_times["min"].as_py().isoformat() if end_times["min"].is_valid else None,
+        "last_end_time": end_times["max"].as_py().isoformat() if end_times["max"].is_valid else None,
+        "bytes": sum(os.path.getsize(p) for p in store_parts(path)),
+    }
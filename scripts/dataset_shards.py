@@ -0,0 +1,215 @@
+"""
+Preparación de datos de entrenamiento en shards con un pool de procesos
+
+El JSONL de entrada se divide en N rangos de bytes alineados a inicios de
+línea. Cada rango se transforma y se valida (dataset_validator.py) en un
+proceso distinto y se escribe en su propio shard; al final se guarda un
+manifiesto con el número de ejemplos, el tamaño y el SHA-256 de cada shard,
+y los ejemplos no válidos de todos los shards se unen en una cuarentena.
+
+Las funciones que se ejecutan en los procesos hijos están en este módulo (y
+no en el script) para que se puedan importar también con el método de
+arranque "spawn" de Windows.
+"""
+
+import hashlib
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from dataset_validator import DatasetValidator, check_structure, merge_quarantine, validate_examples
+from jsonl_codec import GZIP_MAGIC, ZSTD_MAGIC, JsonlWriter, get_codec
+from training_pipeline import MODEL_ROLE, normalize_roles, run_pipeline, split_holdout, strip_metadata
+
+class HashingFile:
+    """
+    Envoltorio de un archivo binario que calcula el SHA-256 de lo escrito
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+def is_compressed(path: str) -> bool:
+    """
+    Indica si un archivo está comprimido con gzip o zstd
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    return magic.startswith(GZIP_MAGIC) or magic == ZSTD_MAGIC
+
+def partition_byte_ranges(path: str, partitions: int) -> List[Tuple[int, int]]:
+    """
+    Divide un archivo JSONL en rangos de bytes que empiezan en inicio de línea
+
+    Args:
+        path: Ruta del archivo (sin comprimir)
+        partitions: Número de rangos deseado
+
+    Returns:
+        Lista de rangos (inicio, fin) no vacíos, con fin exclusivo
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, partitions):
+            target = size * i // partitions
+            if target <= bounds[-1]:
+                continue
+            # Avanzar hasta el inicio de la siguiente línea (si target ya es
+            # inicio de línea, readline solo consume el "\n" anterior)
+            f.seek(target - 1)
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def iter_lines_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    """
+    Lee las líneas que empiezan dentro de [start, end)
+
+    Args:
+        path: Ruta del archivo
+        start: Byte inicial (inicio de línea)
+        end: Byte final (exclusivo)
+
+    Returns:
+        Iterador de líneas
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        position = start
+        for line in f:
+            if position >= end:
+                break
+            position += len(line)
+            yield line
+
+def prepare_range(
+    data_file: str,
+    start: int,
+    end: int,
+    output_file: str,
+    assistant_role: str = MODEL_ROLE,
+    codec_name: str = "auto",
+    holdout_fraction: float = 0.0,
+    quarantine_file: Optional[str] = None
+) -> Dict:
+    """
+    Transforma y valida un rango de bytes del JSONL y lo escribe en un shard
+
+    Se ejecuta en un proceso hijo.
+
+    Args:
+        data_file: Ruta del JSONL de entrada
+        start: Byte inicial del rango
+        end: Byte final del rango (exclusivo)
+        output_file: Ruta del shard de salida
+        assistant_role: Rol de las respuestas en la salida
+        codec_name: Codec JSON
+        holdout_fraction: Proporción de ejemplos reservada para evaluación (se excluye)
+        quarantine_file: Cuarentena de los ejemplos no válidos de este shard
+
+    Returns:
+        Entrada del manifiesto para el shard
+    """
+    codec = get_codec(codec_name)
+    validator = DatasetValidator(quarantine_file, codec)
+    try:
+        with open(output_file, 'wb') as out:
+            hashing_file = HashingFile(out)
+            writer = JsonlWriter(hashing_file, codec)
+            count = writer.write_many(run_pipeline(
+                validator.read(iter_lines_range(data_file, start, end)),
+                lambda examples: check_structure(examples, validator),
+                lambda examples: split_holdout(examples, holdout_fraction),
+                lambda examples: normalize_roles(examples, assistant_role),
+                strip_metadata,
+                lambda examples: validate_examples(examples, validator)
+            ))
+            writer.flush()
+    finally:
+        validator.close()
+
+    return {
+        "file": output_file,
+        "examples": count,
+        "bytes": hashing_file.size,
+        "sha256": hashing_file.sha256.hexdigest(),
+        "source_range": [start, end],
+        "validation": validator.to_dict()
+    }
+
+def prepare_shards(
+    data_file: str,
+    output_prefix: str,
+    shards: int,
+    workers: Optional[int] = None,
+    assistant_role: str = MODEL_ROLE,
+    codec_name: str = "auto",
+    holdout_fraction: float = 0.0
+) -> Dict:
+    """
+    Prepara un JSONL en varios shards en paralelo y guarda su manifiesto
+
+    Args:
+        data_file: Ruta del JSONL de entrada (sin comprimir)
+        output_prefix: Prefijo de los shards y del manifiesto
+        shards: Número de shards
+        workers: Número de procesos (None = uno por CPU)
+        assistant_role: Rol de las respuestas en la salida
+        codec_name: Codec JSON
+        holdout_fraction: Proporción de ejemplos reservada para evaluación (se excluye)
+
+    Returns:
+        Manifiesto con los shards, sus conteos y hashes, y la validación
+        (ejemplos no válidos en <output_prefix>.quarantine.jsonl)
+    """
+    if is_compressed(data_file):
+        raise ValueError("La preparación en shards necesita un JSONL sin comprimir (se divide por rangos de bytes)")
+
+    ranges = partition_byte_ranges(data_file, shards)
+    outputs = [f"{output_prefix}-{i:05d}-of-{len(ranges):05d}.jsonl" for i in range(len(ranges))]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(prepare_range, data_file, start, end, output, assistant_role, codec_name, holdout_fraction, f"{output}.quarantine.jsonl")
+            for (start, end), output in zip(ranges, outputs)
+        ]
+        entries = [future.result() for future in futures]
+
+    validations = [entry.pop("validation") for entry in entries]
+    reasons = Counter()
+    for validation in validations:
+        reasons.update(validation["reasons"])
+    quarantine_file = merge_quarantine([validation["quarantine"] for validation in validations], f"{output_prefix}.quarantine.jsonl")
+    for entry, validation in zip(entries, validations):
+        entry["invalid"] = validation["invalid"]
+
+    manifest = {
+        "source": data_file,
+        "holdout_fraction": holdout_fraction,
+        "total_examples": sum(entry["examples"] for entry in entries),
+        "total_bytes": sum(entry["bytes"] for entry in entries),
+        "validation": {
+            "validated": sum(validation["validated"] for validation in validations),
+            "invalid": sum(validation["invalid"] for validation in validations),
+            "reasons": dict(reasons),
+            "quarantine": quarantine_file,
+        },
+        "shards": entries
+    }
+    with open(f"{output_prefix}.manifest.json", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
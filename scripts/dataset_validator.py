@@ -0,0 +1,312 @@
+"""
+Validación previa de los datos de ajuste fino de Vertex AI
+
+Comprueba cada ejemplo con el esquema de chat de Gemini antes de subirlo,
+para que un ejemplo mal formado se detecte en la preparación y no horas
+después, cuando falla el trabajo de ajuste:
+
+- "messages" es una lista no vacía de objetos con "role" y "content".
+- Los roles son "user" y "model" (y, opcionalmente, "system" en el primer mensaje).
+- "content" es texto no vacío.
+- Los turnos alternan usuario y modelo, empiezan por el usuario y terminan en el modelo.
+
+La estructura (objetos, lista de mensajes y rol de cada mensaje) se comprueba
+sobre el ejemplo tal como se leyó, antes de normalizar los roles, porque esa
+etapa supone mensajes con forma de objeto y completaría un rol ausente.
+
+Los ejemplos que no cumplen el esquema (y las líneas que no son JSON válido)
+no se escriben en la salida: van a un archivo de cuarentena JSONL con los
+motivos, y al terminar se muestra un resumen por motivo. La validación es
+una etapa más de la preparación, así que con varios shards se ejecuta en
+paralelo sobre los rangos del archivo; cada shard tiene su cuarentena y al
+final se unen en una sola (merge_quarantine).
+
+Uso:
+    from dataset_validator import DatasetValidator, validate_examples
+    validator = DatasetValidator("processed.quarantine.jsonl")
+    examples = check_structure(validator.read(lines), validator)
+    examples = validate_examples(normalize_roles(examples), validator)
+"""
+
+import os
+import shutil
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from jsonl_codec import Codec, JsonlWriter, default_codec, open_jsonl_lines
+from training_pipeline import MODEL_ROLE
+
+USER_ROLE = "user"
+SYSTEM_ROLE = "system"
+
+# Motivos de cuarentena (el código es el prefijo de cada motivo, "código: detalle")
+REASONS = {
+    "json": "JSON no válido",
+    "messages": "sin lista de mensajes",
+    "message": "mensaje que no es un objeto",
+    "role": "rol ausente o desconocido",
+    "alternation": "turnos que no alternan usuario y modelo",
+    "content": "contenido vacío o que no es texto",
+    "last_turn": "no termina en una respuesta del modelo",
+}
+
+def validate_structure(example) -> List[str]:
+    """
+    Comprueba la estructura de un ejemplo sin normalizar
+
+    Args:
+        example: Ejemplo decodificado del archivo (puede no ser un objeto)
+
+    Returns:
+        Motivos por los que no es válido ("código: detalle"; vacía si es válido)
+    """
+    messages = example.get("messages") if isinstance(example, dict) else None
+    if not isinstance(messages, list) or not messages:
+        return ["messages: falta la lista de mensajes o está vacía"]
+
+    reasons = []
+    for i, message in enumerate(messages):
+        if not isinstance(message, dict):
+            reasons.append(f"message: el mensaje {i} no es un objeto")
+        elif not isinstance(message.get("role"), str) or not message["role"]:
+            reasons.append(f"role: el mensaje {i} no tiene rol")
+    return reasons
+
+def validate_example(example: Dict) -> List[str]:
+    """
+    Comprueba un ejemplo con el esquema de chat de Gemini
+
+    Args:
+        example: Ejemplo {"messages": [{"role", "content"}, ...]}
+
+    Returns:
+        Motivos por los que no es válido ("código: detalle"; vacía si es válido)
+    """
+    messages = example.get("messages") if isinstance(example, dict) else None
+    if not isinstance(messages, list) or not messages:
+        return ["messages: falta la lista de mensajes o está vacía"]
+
+    reasons = []
+    expected = USER_ROLE
+    role = None
+    for i, message in enumerate(messages):
+        if not isinstance(message, dict):
+            reasons.append(f"message: el mensaje {i} no es un objeto")
+            role = None
+            continue
+        role = message.get("role")
+        content = message.get("content")
+        if not isinstance(content, str) or not content.strip():
+            reasons.append(f"content: el mensaje {i} no tiene texto")
+        if role == SYSTEM_ROLE and i == 0:
+            continue
+        if role not in (USER_ROLE, MODEL_ROLE):
+            reasons.append(f"role: rol desconocido {role!r} en el mensaje {i}")
+        elif role != expected:
+            reasons.append(f"alternation: el mensaje {i} es de '{role}' y se esperaba '{expected}'")
+        expected = USER_ROLE if expected == MODEL_ROLE else MODEL_ROLE
+
+    if role != MODEL_ROLE:
+        reasons.append(f"last_turn: el último mensaje es de {role!r}")
+    return reasons
+
+class DatasetValidator:
+    """
+    Valida ejemplos y guarda los no válidos en un archivo de cuarentena
+
+    El archivo de cuarentena se crea con el primer ejemplo no válido (si ya
+    existía de una ejecución anterior, se elimina al empezar).
+    """
+
+    def __init__(self, quarantine_file: Optional[str] = None, codec: Optional[Codec] = None):
+        """
+        Args:
+            quarantine_file: Archivo JSONL de cuarentena (None = solo contar)
+            codec: Codec JSON (None = el codec por defecto)
+        """
+        self.quarantine_file = quarantine_file
+        self.codec = codec or default_codec()
+        self._file = None
+        self._writer: Optional[JsonlWriter] = None
+        if quarantine_file and os.path.exists(quarantine_file):
+            os.remove(quarantine_file)
+
+        self.seen = 0
+        self.invalid = 0
+        self.reasons: Counter = Counter()
+
+    def quarantine(self, record: Dict, reasons: List[str]):
+        """
+        Registra un ejemplo (o una línea) no válido con sus motivos
+        """
+        self.invalid += 1
+        self.reasons.update({reason.split(":", 1)[0] for reason in reasons})
+        if not self.quarantine_file:
+            return
+        if self._writer is None:
+            self._file = open(self.quarantine_file, 'wb')
+            self._writer = JsonlWriter(self._file, self.codec)
+        self._writer.write(dict(record, reasons=reasons))
+
+    def read(self, lines: Iterable[bytes]) -> Iterator[Dict]:
+        """
+        Decodifica líneas JSONL; las que no son JSON válido van a la cuarentena
+
+        Args:
+            lines: Líneas del archivo
+
+        Returns:
+            Iterador de ejemplos
+        """
+        loads = self.codec.loads
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                yield loads(line)
+            except Exception as e:
+                self.seen += 1
+                self.quarantine({"line": line.decode("utf-8", "replace").rstrip("\n")}, [f"json: {e}"])
+
+    def filter_structure(self, examples: Iterable) -> Iterator[Dict]:
+        """
+        Deja pasar los ejemplos con estructura válida y pone en cuarentena el resto
+
+        Los ejemplos que pasan se cuentan después en filter().
+
+        Args:
+            examples: Iterable de ejemplos sin normalizar
+
+        Returns:
+            Iterador de ejemplos con estructura válida
+        """
+        for example in examples:
+            reasons = validate_structure(example)
+            if reasons:
+                self.seen += 1
+                self.quarantine({"example": example}, reasons)
+            else:
+                yield example
+
+    def filter(self, examples: Iterable[Dict]) -> Iterator[Dict]:
+        """
+        Deja pasar los ejemplos válidos y pone en cuarentena el resto
+
+        Args:
+            examples: Iterable de ejemplos
+
+        Returns:
+            Iterador de ejemplos válidos
+        """
+        for example in examples:
+            self.seen += 1
+            reasons = validate_example(example)
+            if reasons:
+                self.quarantine({"example": example}, reasons)
+            else:
+                yield example
+
+    def close(self):
+        """
+        Cierra el archivo de cuarentena
+        """
+        if self._writer is not None:
+            self._writer.flush()
+            self._file.close()
+            self._writer = None
+            self._file = None
+
+    def to_dict(self) -> Dict:
+        """
+        Conteos de la validación (para el manifiesto de los shards)
+        """
+        return {
+            "validated": self.seen,
+            "invalid": self.invalid,
+            "reasons": dict(self.reasons),
+            "quarantine": self.quarantine_file if self.invalid else None,
+        }
+
+    def summary(self) -> str:
+        """
+        Resumen de la validación
+        """
+        return format_validation(self.to_dict())
+
+def format_validation(result: Dict) -> str:
+    """
+    Resumen legible de los conteos de una validación (DatasetValidator.to_dict)
+    """
+    line = f"Validación: {result['invalid']} de {result['validated']} ejemplos en cuarentena"
+    if result["invalid"]:
+        details = ", ".join(
+            f"{REASONS.get(code, code)} {count}"
+            for code, count in sorted(result["reasons"].items(), key=lambda item: -item[1])
+        )
+        line += f" ({details})"
+        if result.get("quarantine"):
+            line += f" → {result['quarantine']}"
+    return line
+
+def merge_quarantine(parts: List[Optional[str]], quarantine_file: str) -> Optional[str]:
+    """
+    Une los archivos de cuarentena de los shards en uno solo
+
+    Args:
+        parts: Archivos de cuarentena de cada shard (None si el shard no tuvo ninguno)
+        quarantine_file: Archivo de cuarentena final
+
+    Returns:
+        Ruta del archivo final (None si no hubo ejemplos no válidos)
+    """
+    parts = [part for part in parts if part]
+    if os.path.exists(quarantine_file):
+        os.remove(quarantine_file)
+    if not parts:
+        return None
+    with open(quarantine_file, 'wb') as out:
+        for part in parts:
+            with open(part, 'rb') as f:
+                shutil.copyfileobj(f, out)
+            os.remove(part)
+    return quarantine_file
+
+def read_validated_jsonl(path: str, validator: DatasetValidator) -> Iterator[Dict]:
+    """
+    Lee un archivo JSONL (comprimido o no) apartando las líneas que no son JSON válido
+
+    Args:
+        path: Ruta del archivo
+        validator: Validación que recibe las líneas no válidas
+
+    Returns:
+        Iterador de ejemplos
+    """
+    with open_jsonl_lines(path) as f:
+        yield from validator.read(f)
+
+def check_structure(examples: Iterable, validator: DatasetValidator) -> Iterator[Dict]:
+    """
+    Aparta los ejemplos sin estructura de chat antes de transformarlos
+
+    Args:
+        examples: Iterable de ejemplos tal como se leyeron
+        validator: Estado de la validación (conserva los conteos y la cuarentena)
+
+    Returns:
+        Iterador de ejemplos con lista de mensajes y rol en cada mensaje
+    """
+    return validator.filter_structure(examples)
+
+def validate_examples(examples: Iterable[Dict], validator: DatasetValidator) -> Iterator[Dict]:
+    """
+    Comprueba el esquema de Vertex AI y aparta los ejemplos no válidos
+
+    Args:
+        examples: Iterable de ejemplos
+        validator: Estado de la validación (conserva los conteos y la cuarentena)
+
+    Returns:
+        Iterador de ejemplos válidos
+    """
+    return validator.filter(examples)
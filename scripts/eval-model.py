@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Script para evaluar modelos Gemini con los ejemplos reservados del entrenamiento
+Compara el modelo base con los modelos ajustados (cognia-assistant-*) en
+calidad de las respuestas y latencia, con métricas locales.
+
+Los ejemplos reservados son los mismos que excluye train-gemini-model.py con
+--holdout-fraction (la elección depende solo del contenido de cada ejemplo),
+así que hay que usar el mismo archivo de datos y la misma proporción.
+
+La evaluación se puede interrumpir: al volver a ejecutar el mismo comando se
+continúa desde los resultados ya guardados en --results.
+
+Uso:
+python eval-model.py --project=cogniaintellilearn-ebdb3 --holdout-fraction=0.1 \
+    --models=gemini-2.5-flash-preview-05-20,projects/.../endpoints/...
+python eval-model.py --backend=mock --data-file=training_data.jsonl --holdout-fraction=0.1
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+
+from gemini_backends import DEFAULT_CONFIG, DEFAULT_MODEL, create_backend
+from instrumentation import add_metrics_arguments, metrics
+from jsonl_codec import set_default_codec
+from model_eval import EvalRunner, build_report, eval_items, format_report
+from response_cache import add_cache_arguments, cache_from_args
+from training_pipeline import read_jsonl, run_pipeline, split_holdout
+
+# Configuración de argumentos
+parser = argparse.ArgumentParser(description="Evaluar modelos Gemini con los ejemplos reservados")
+parser.add_argument("--data-file", type=str, default="training_data.jsonl", help="Archivo de datos de entrenamiento (el mismo que se usó para entrenar)")
+parser.add_argument("--holdout-fraction", type=float, default=0.1, help="Proporción reservada para evaluación (la misma que en train-gemini-model.py)")
+parser.add_argument("--models", type=str, default=DEFAULT_MODEL, help="Modelos separados por comas; el primero es la referencia de la comparación")
+parser.add_argument("--backend", type=str, default="vertex", choices=["vertex", "mock"], help="Backend: Vertex AI o simulación local sin red")
+parser.add_argument("--project", type=str, default="cogniaintellilearn-ebdb3", help="ID del proyecto de Google Cloud")
+parser.add_argument("--location", type=str, default="global", help="Región de Vertex AI")
+parser.add_argument("--turns", type=str, default="all", choices=["all", "last"], help="Evaluar todas las respuestas de cada conversación o solo la última")
+parser.add_argument("--limit", type=int, default=None, help="Evaluar como máximo N casos")
+parser.add_argument("--concurrency", type=int, default=8, help="Máximo de peticiones en curso")
+parser.add_argument("--max-retries", type=int, default=5, help="Reintentos por petición ante límites de peticiones (429)")
+parser.add_argument("--backoff-seconds", type=float, default=1.0, help="Espera inicial antes de reintentar (se duplica en cada reintento)")
+parser.add_argument("--max-output-tokens", type=int, default=DEFAULT_CONFIG["max_output_tokens"], help="Máximo de tokens por respuesta")
+parser.add_argument("--results", type=str, default="eval_results.jsonl", help="JSONL de resultados; también es el checkpoint para reanudar")
+parser.add_argument("--report", type=str, default="eval_report.json", help="Archivo JSON del informe final")
+parser.add_argument("--mock-ttft-ms", type=float, default=300.0, help="Backend mock: tiempo medio hasta el primer token en ms")
+parser.add_argument("--mock-tokens-per-second", type=float, default=80.0, help="Backend mock: velocidad de generación")
+parser.add_argument("--mock-error-rate", type=float, default=0.0, help="Backend mock: proporción de peticiones que fallan con 429")
+parser.add_argument("--codec", type=str, default="auto", choices=["auto", "orjson", "msgspec", "json"], help="Serializador JSON (auto = el más rápido instalado)")
+add_cache_arguments(parser)
+add_metrics_arguments(parser)
+
+def main():
+    args = parser.parse_args()
+    set_default_codec(args.codec)
+
+    metrics().configure("eval-model", args.metrics_json, args.metrics_prom, args.profile, args.profile_output)
+    success = False
+
+    try:
+        models = [model.strip() for model in args.models.split(",") if model.strip()]
+        if args.backend == "mock":
+            backend = create_backend(
+                "mock",
+                ttft_ms=args.mock_ttft_ms,
+                tokens_per_second=args.mock_tokens_per_second,
+                error_rate=args.mock_error_rate,
+            )
+        else:
+            backend = create_backend("vertex", project=args.project, location=args.location)
+        backend, cache = cache_from_args(backend, args)
+
+        items = eval_items(
+            run_pipeline(read_jsonl(args.data_file), lambda examples: split_holdout(examples, args.holdout_fraction, holdout=True)),
+            args.turns
+        )
+        if args.limit:
+            items = itertools.islice(items, args.limit)
+
+        runner = EvalRunner(
+            backend,
+            models,
+            concurrency=args.concurrency,
+            max_retries=args.max_retries,
+            backoff_seconds=args.backoff_seconds,
+            config=dict(DEFAULT_CONFIG, max_output_tokens=args.max_output_tokens),
+        )
+
+        print(f"Evaluando {', '.join(models)} con el {args.holdout_fraction:.0%} reservado de {args.data_file} (backend {args.backend})...")
+        try:
+            with metrics().timer("eval"):
+                asyncio.run(runner.run(items, args.results))
+        except KeyboardInterrupt:
+            print(f"\nEvaluación interrumpida. Vuelve a ejecutar el script para continuar desde {args.results}")
+            raise
+        finally:
+            print(runner.summary())
+            if cache:
+                print(cache.summary())
+                cache.close()
+
+        report = build_report(args.results, models)
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+        print()
+        print(format_report(report))
+        print(f"\nInforme guardado en {args.report} (resultados por caso en {args.results})")
+        success = True
+    finally:
+        metrics().finish(success)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Subida de archivos a Google Cloud Storage direccionada por contenido
+
+- El objeto se nombra con el SHA-256 de su contenido: si ya existe, la subida
+  se omite por completo.
+- Los archivos grandes se dividen en partes que se suben en paralelo y se
+  unen con compose de GCS. Las partes se nombran con el hash del archivo y su
+  índice, así que una subida interrumpida continúa con las partes que faltan.
+- Se informa del volumen subido y del rendimiento (MB/s).
+
+Backends:
+- GCSBackend: google-cloud-storage (respeta STORAGE_EMULATOR_HOST, por
+  ejemplo para probar con fake-gcs-server).
+- LocalBackend: directorio local que hace de bucket, para pruebas sin red.
+"""
+
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+# Tamaño de cada parte en las subidas compuestas
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Máximo de objetos de origen por llamada a compose en GCS
+MAX_COMPOSE_SOURCES = 32
+
+class UploadResult(NamedTuple):
+    """
+    Resultado de una subida
+    """
+    uri: str
+    sha256: str
+    size: int
+    bytes_uploaded: int
+    seconds: float
+    skipped: bool
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes_uploaded / (1024 * 1024) / self.seconds if self.seconds > 0 else 0.0
+
+class GCSBackend:
+    """
+    Backend de Google Cloud Storage
+    """
+
+    scheme = "gs"
+
+    def __init__(self, project_id: str):
+        """
+        Args:
+            project_id: ID del proyecto de Google Cloud
+        """
+        from google.cloud import storage
+        self.client = storage.Client(project=project_id)
+
+    def ensure_bucket(self, bucket: str, location: str):
+        if self.client.lookup_bucket(bucket) is None:
+            print(f"Creando bucket {bucket} en {location}...")
+            self.client.create_bucket(bucket, location=location)
+
+    def object_size(self, bucket: str, name: str) -> Optional[int]:
+        blob = self.client.bucket(bucket).get_blob(name)
+        return blob.size if blob is not None else None
+
+    def list_sizes(self, bucket: str, prefix: str) -> Dict[str, int]:
+        return {blob.name: blob.size for blob in self.client.list_blobs(bucket, prefix=prefix)}
+
+    def upload_range(self, bucket: str, name: str, path: str, offset: int, length: int):
+        blob = self.client.bucket(bucket).blob(name)
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            blob.upload_from_file(f, size=length, rewind=False)
+
+    def compose(self, bucket: str, sources: List[str], destination: str):
+        gcs_bucket = self.client.bucket(bucket)
+        gcs_bucket.blob(destination).compose([gcs_bucket.blob(name) for name in sources])
+
+    def delete(self, bucket: str, names: List[str]):
+        self.client.bucket(bucket).delete_blobs([self.client.bucket(bucket).blob(name) for name in names])
+
+class LocalBackend:
+    """
+    Backend sobre el sistema de archivos: cada bucket es un directorio de `root`
+    """
+
+    scheme = "file"
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root: Directorio raíz que contiene los buckets
+        """
+        self.root = root
+
+    def _path(self, bucket: str, name: str) -> str:
+        return os.path.join(self.root, bucket, *name.split("/"))
+
+    def ensure_bucket(self, bucket: str, location: str):
+        os.makedirs(os.path.join(self.root, bucket), exist_ok=True)
+
+    def object_size(self, bucket: str, name: str) -> Optional[int]:
+        path = self._path(bucket, name)
+        return os.path.getsize(path) if os.path.isfile(path) else None
+
+    def list_sizes(self, bucket: str, prefix: str) -> Dict[str, int]:
+        bucket_root = os.path.join(self.root, bucket)
+        sizes = {}
+        for directory, _, files in os.walk(bucket_root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, bucket_root).replace(os.sep, "/")
+                if name.startswith(prefix) and not filename.endswith(".tmp"):
+                    sizes[name] = os.path.getsize(path)
+        return sizes
+
+    def _write(self, bucket: str, name: str, chunks):
+        # Escribir a un temporal y renombrar: un objeto nunca queda a medias
+        path = self._path(bucket, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as out:
+            for chunk in chunks:
+                out.write(chunk)
+        os.replace(tmp_path, path)
+
+    def upload_range(self, bucket: str, name: str, path: str, offset: int, length: int):
+        def chunks():
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                remaining = length
+                while remaining > 0:
+                    chunk = f.read(min(remaining, 1 << 20))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+        self._write(bucket, name, chunks())
+
+    def compose(self, bucket: str, sources: List[str], destination: str):
+        def chunks():
+            for name in sources:
+                with open(self._path(bucket, name), 'rb') as f:
+                    while True:
+                        chunk = f.read(1 << 20)
+                        if not chunk:
+                            break
+                        yield chunk
+        self._write(bucket, destination, chunks())
+
+    def delete(self, bucket: str, names: List[str]):
+        for name in names:
+            path = self._path(bucket, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+        # Eliminar los directorios que quedaron vacíos (GCS no tiene directorios)
+        bucket_root = os.path.join(self.root, bucket)
+        for directory in sorted({os.path.dirname(self._path(bucket, name)) for name in names}, reverse=True):
+            while directory != bucket_root and os.path.isdir(directory) and not os.listdir(directory):
+                os.rmdir(directory)
+                directory = os.path.dirname(directory)
+
+def file_sha256(path: str, block_size: int = 4 * 1024 * 1024) -> str:
+    """
+    Calcula el SHA-256 de un archivo leyéndolo por bloques
+
+    Args:
+        path: Ruta del archivo
+        block_size: Tamaño de cada lectura
+
+    Returns:
+        Hash en hexadecimal
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+def content_object_name(path: str, sha256: str, prefix: str = "") -> str:
+    """
+    Nombre del objeto direccionado por contenido, conservando la extensión
+
+    Args:
+        path: Ruta del archivo local
+        sha256: Hash del contenido
+        prefix: Prefijo del objeto (por ejemplo "tuning-data/")
+
+    Returns:
+        Nombre del objeto
+    """
+    stem, extension = os.path.splitext(os.path.basename(path))
+    if extension in (".gz", ".zst"):
+        extension = os.path.splitext(stem)[1] + extension
+    return f"{prefix}{sha256}{extension}"
+
+def _compose_tree(backend, bucket: str, sources: List[str], destination: str, scratch_prefix: str) -> List[str]:
+    """
+    Une las partes en `destination`, en varios niveles si hay más de
+    MAX_COMPOSE_SOURCES, y devuelve los objetos intermedios creados
+    """
+    intermediates = []
+    level = 0
+    while len(sources) > MAX_COMPOSE_SOURCES:
+        next_sources = []
+        for i in range(0, len(sources), MAX_COMPOSE_SOURCES):
+            name = f"{scratch_prefix}compose-{level}-{i // MAX_COMPOSE_SOURCES:05d}"
+            backend.compose(bucket, sources[i:i + MAX_COMPOSE_SOURCES], name)
+            next_sources.append(name)
+        intermediates.extend(next_sources)
+        sources = next_sources
+        level += 1
+    backend.compose(bucket, sources, destination)
+    return intermediates
+
+def upload_file(
+    local_file: str,
+    bucket: str,
+    backend,
+    prefix: str = "",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = 8
+) -> UploadResult:
+    """
+    Sube un archivo con nombre direccionado por contenido
+
+    Args:
+        local_file: Ruta al archivo local
+        bucket: Nombre del bucket
+        backend: GCSBackend o LocalBackend
+        prefix: Prefijo de los objetos en el bucket
+        chunk_size: Tamaño de cada parte en subidas compuestas
+        workers: Número de partes que se suben en paralelo
+
+    Returns:
+        Resultado de la subida (URI, hash, bytes subidos, tiempo)
+    """
+    start = time.perf_counter()
+    size = os.path.getsize(local_file)
+    sha256 = file_sha256(local_file)
+    name = content_object_name(local_file, sha256, prefix)
+    uri = f"{backend.scheme}://{bucket}/{name}"
+
+    # Mismo contenido ya subido: no hay nada que hacer
+    if backend.object_size(bucket, name) == size:
+        print(f"{uri} ya existe, se omite la subida")
+        return UploadResult(uri, sha256, size, 0, time.perf_counter() - start, True)
+
+    if size <= chunk_size:
+        backend.upload_range(bucket, name, local_file, 0, size)
+        bytes_uploaded = size
+    else:
+        # Partes del archivo: las que ya existen con el tamaño correcto son de
+        # una subida anterior interrumpida y no se vuelven a subir
+        scratch_prefix = f"{prefix}.parts/{sha256}/"
+        parts = []
+        for index, offset in enumerate(range(0, size, chunk_size)):
+            parts.append((f"{scratch_prefix}{index:05d}", offset, min(chunk_size, size - offset)))
+
+        existing = backend.list_sizes(bucket, scratch_prefix)
+        missing = [part for part in parts if existing.get(part[0]) != part[2]]
+        if len(missing) < len(parts):
+            print(f"Reanudando subida: {len(parts) - len(missing)} de {len(parts)} partes ya subidas")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(backend.upload_range, bucket, part_name, local_file, offset, length)
+                for part_name, offset, length in missing
+            ]
+            for future in futures:
+                future.result()
+        bytes_uploaded = sum(length for _, _, length in missing)
+
+        part_names = [part_name for part_name, _, _ in parts]
+        intermediates = _compose_tree(backend, bucket, part_names, name, scratch_prefix)
+        backend.delete(bucket, intermediates + part_names)
+
+    uploaded_size = backend.object_size(bucket, name)
+    if uploaded_size != size:
+        raise RuntimeError(f"El objeto {uri} tiene {uploaded_size} bytes, se esperaban {size}")
+
+    result = UploadResult(uri, sha256, size, bytes_uploaded, time.perf_counter() - start, False)
+    print(f"Subidos {bytes_uploaded / (1024 * 1024):.1f} MB a {uri} en {result.seconds:.1f}s ({result.mb_per_second:.1f} MB/s)")
+    return result
+
+def upload_files(
+    local_files: List[str],
+    bucket: str,
+    backend,
+    prefix: str = "",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = 8
+) -> UploadResult:
+    """
+    Sube varios archivos (por ejemplo, shards) en paralelo y los une en un objeto
+
+    Cada archivo se sube direccionado por contenido, así que los shards que
+    no cambiaron no se vuelven a subir. El objeto final se nombra con el
+    SHA-256 de la lista de hashes de los archivos, en orden.
+
+    Args:
+        local_files: Rutas de los archivos, en el orden en que se unen
+        bucket: Nombre del bucket
+        backend: GCSBackend o LocalBackend
+        prefix: Prefijo de los objetos en el bucket
+        chunk_size: Tamaño de cada parte en subidas compuestas
+        workers: Número de subidas en paralelo
+
+    Returns:
+        Resultado de la subida del objeto unido
+    """
+    start = time.perf_counter()
+    scratch_prefix = f"{prefix}.shards/"
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(upload_file, local_file, bucket, backend, scratch_prefix, chunk_size, 1)
+            for local_file in local_files
+        ]
+        results = [future.result() for future in futures]
+
+    sha256 = hashlib.sha256("\n".join(result.sha256 for result in results).encode("ascii")).hexdigest()
+    name = content_object_name(local_files[0], sha256, prefix)
+    uri = f"{backend.scheme}://{bucket}/{name}"
+    size = sum(result.size for result in results)
+    bytes_uploaded = sum(result.bytes_uploaded for result in results)
+
+    if backend.object_size(bucket, name) != size:
+        sources = [result.uri.split(f"://{bucket}/", 1)[1] for result in results]
+        intermediates = _compose_tree(backend, bucket, sources, name, f"{prefix}.parts/{sha256}/")
+        if intermediates:
+            backend.delete(bucket, intermediates)
+
+    result = UploadResult(uri, sha256, size, bytes_uploaded, time.perf_counter() - start, bytes_uploaded == 0)
+    print(f"{len(local_files)} archivos unidos en {uri}: {bytes_uploaded / (1024 * 1024):.1f} MB subidos en {result.seconds:.1f}s ({result.mb_per_second:.1f} MB/s)")
+    return result
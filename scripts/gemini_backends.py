@@ -0,0 +1,222 @@
+"""
+Backends para llamar a modelos Gemini desde las herramientas de Python
+
+Todos los backends exponen la misma interfaz asíncrona:
+
+    async for text in backend.stream(model, contents, config):
+        ...
+
+donde `contents` es una lista de mensajes {"role": "user" | "model", "text": ...}
+y `config` un diccionario con la configuración de generación (DEFAULT_CONFIG).
+
+- VertexBackend: cliente asíncrono de google-genai contra Vertex AI.
+- MockBackend: simula localmente la latencia de un stream (tiempo hasta el
+  primer token, tokens por segundo y errores), para probar las herramientas
+  sin red ni coste.
+"""
+
+import asyncio
+import hashlib
+import random
+from typing import AsyncIterator, Dict, List, Optional
+
+# Modelo base con el que se comparan los modelos ajustados
+DEFAULT_MODEL = "gemini-2.5-flash-preview-05-20"
+
+# Configuración de generación por defecto (la de test-gemini.py)
+DEFAULT_CONFIG = {
+    "temperature": 1.0,
+    "top_p": 0.95,
+    "max_output_tokens": 8192,
+    "safety_off": True,
+}
+
+SAFETY_CATEGORIES = [
+    "HARM_CATEGORY_HATE_SPEECH",
+    "HARM_CATEGORY_DANGEROUS_CONTENT",
+    "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+    "HARM_CATEGORY_HARASSMENT",
+]
+
+class BackendError(Exception):
+    """
+    Error de una llamada a un backend
+
+    `retryable` indica si conviene reintentar (límite de peticiones o error
+    transitorio del servicio).
+    """
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Indica si un error es un límite de peticiones o un error transitorio (429/5xx)
+    """
+    if isinstance(error, BackendError):
+        return error.retryable
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code in (429, 500, 502, 503, 504):
+        return True
+    text = str(error)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or "UNAVAILABLE" in text
+
+def examples_to_contents(messages: List[Dict]) -> List[Dict]:
+    """
+    Convierte los mensajes de un ejemplo (role/content) en contenidos de Gemini
+
+    Args:
+        messages: Mensajes del ejemplo
+
+    Returns:
+        Lista de mensajes {"role": "user" | "model", "text": ...}
+    """
+    from training_pipeline import ASSISTANT_ROLES
+    return [
+        {
+            "role": "model" if message.get("role", "user") in ASSISTANT_ROLES else "user",
+            "text": message.get("content", "")
+        }
+        for message in messages
+    ]
+
+class VertexBackend:
+    """
+    Llamadas reales a Gemini en Vertex AI con el cliente asíncrono de google-genai
+    """
+
+    name = "vertex"
+
+    def __init__(self, project: str, location: str = "global"):
+        """
+        Args:
+            project: ID del proyecto de Google Cloud
+            location: Región de Vertex AI
+        """
+        from google import genai
+        from google.genai import types
+        self._types = types
+        self.client = genai.Client(vertexai=True, project=project, location=location)
+
+    def _config(self, config: Dict):
+        types = self._types
+        return types.GenerateContentConfig(
+            temperature=config.get("temperature"),
+            top_p=config.get("top_p"),
+            max_output_tokens=config.get("max_output_tokens"),
+            safety_settings=[
+                types.SafetySetting(category=category, threshold="OFF")
+                for category in SAFETY_CATEGORIES
+            ] if config.get("safety_off") else None,
+        )
+
+    async def stream(self, model: str, contents: List[Dict], config: Optional[Dict] = None) -> AsyncIterator[str]:
+        """
+        Envía la petición y devuelve el texto de cada fragmento del stream
+        """
+        types = self._types
+        request = [
+            types.Content(role=message["role"], parts=[types.Part(text=message["text"])])
+            for message in contents
+        ]
+        response = await self.client.aio.models.generate_content_stream(
+            model=model,
+            contents=request,
+            config=self._config(config or DEFAULT_CONFIG),
+        )
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+class MockBackend:
+    """
+    Backend local que simula un stream de Gemini
+
+    El tiempo hasta el primer token sigue una distribución log-normal
+    alrededor de `ttft_ms`, y el texto se emite en fragmentos de
+    `chunk_tokens` tokens a `tokens_per_second`. Con `error_rate` una parte
+    de las peticiones falla con un error 429 simulado. Las respuestas son
+    deterministas para un mismo modelo, contenido y semilla; los errores
+    siguen su propia secuencia aleatoria.
+    """
+
+    name = "mock"
+
+    WORDS = (
+        "el curso incluye ejercicios resueltos y explicaciones paso a paso para que "
+        "puedas repasar cada concepto a tu ritmo con ejemplos prácticos y evaluaciones"
+    ).split()
+
+    def __init__(
+        self,
+        ttft_ms: float = 300.0,
+        tokens_per_second: float = 80.0,
+        response_tokens: int = 200,
+        chunk_tokens: int = 20,
+        error_rate: float = 0.0,
+        seed: int = 0
+    ):
+        """
+        Args:
+            ttft_ms: Tiempo medio hasta el primer token (ms)
+            tokens_per_second: Velocidad de generación
+            response_tokens: Longitud media de la respuesta (tokens)
+            chunk_tokens: Tokens por fragmento del stream
+            error_rate: Proporción de peticiones que fallan (0-1)
+            seed: Semilla de la simulación
+        """
+        self.ttft_ms = ttft_ms
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.chunk_tokens = chunk_tokens
+        self.error_rate = error_rate
+        self.seed = seed
+        self.calls = 0
+        # Los errores no dependen del contenido, para que un reintento pueda salir bien
+        self._error_rng = random.Random(seed)
+
+    def _rng(self, model: str, contents: List[Dict]) -> random.Random:
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(f"{self.seed}\x00{model}".encode("utf-8"))
+        for message in contents:
+            digest.update(f"\x00{message['role']}\x00{message['text']}".encode("utf-8"))
+        return random.Random(int.from_bytes(digest.digest(), "big"))
+
+    async def stream(self, model: str, contents: List[Dict], config: Optional[Dict] = None) -> AsyncIterator[str]:
+        """
+        Simula el stream de la respuesta
+        """
+        self.calls += 1
+        rng = self._rng(model, contents)
+        max_tokens = (config or DEFAULT_CONFIG).get("max_output_tokens") or self.response_tokens
+        tokens = max(1, min(max_tokens, int(rng.gauss(self.response_tokens, self.response_tokens / 4))))
+
+        await asyncio.sleep(rng.lognormvariate(0, 0.3) * self.ttft_ms / 1000)
+        if self._error_rng.random() < self.error_rate:
+            raise BackendError("429 RESOURCE_EXHAUSTED (simulado)", retryable=True)
+
+        emitted = 0
+        while emitted < tokens:
+            count = min(self.chunk_tokens, tokens - emitted)
+            if emitted:
+                await asyncio.sleep(count / self.tokens_per_second)
+            yield " ".join(rng.choice(self.WORDS) for _ in range(count)) + " "
+            emitted += count
+
+def create_backend(name: str, **options):
+    """
+    Crea un backend por nombre
+
+    Args:
+        name: "vertex" o "mock"
+        options: Argumentos del constructor del backend
+
+    Returns:
+        Backend
+    """
+    if name == "vertex":
+        return VertexBackend(**options)
+    if name == "mock":
+        return MockBackend(**options)
+    raise ValueError(f"Backend desconocido: {name}")
@@ -0,0 +1,362 @@
+"""
+Instrumentación de los scripts de datos y entrenamiento
+
+Registro de métricas de una ejecución: contadores (documentos leídos,
+ejemplos escritos, bytes), valores (MB/s de la subida), tiempos por etapa y
+estadísticas del proceso (memoria máxima, volumen de lectura y escritura,
+CPU). Al terminar, las métricas se añaden como una línea JSON a un log
+estructurado y/o se escriben en un archivo de texto de Prometheus (textfile
+collector de node_exporter), para vigilar las ejecuciones nocturnas.
+
+Opcionalmente se perfila la ejecución con cProfile (CPU, solo el hilo
+principal) o tracemalloc (memoria).
+
+Uso:
+    from instrumentation import add_metrics_arguments, metrics
+    add_metrics_arguments(parser)
+    ...
+    metrics().configure("collect", args.metrics_json, args.metrics_prom, args.profile)
+    with metrics().timer("export"):
+        ...
+    metrics().inc("documents_read", len(page))
+    metrics().finish(success=True)
+"""
+
+import cProfile
+import datetime
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+
+# Prefijo de las métricas de Prometheus
+PROMETHEUS_PREFIX = "cognia"
+
+# Número de funciones o líneas que se guardan en el log al perfilar
+PROFILE_TOP = 20
+
+def peak_rss_bytes() -> Optional[int]:
+    """
+    Memoria residente máxima del proceso en bytes (None si no se puede medir)
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux informa en KB y macOS en bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss)
+    except ImportError:
+        return None
+
+def process_stats() -> Dict[str, float]:
+    """
+    Estadísticas del proceso actual: memoria máxima, CPU y volumen de E/S
+
+    io_read_bytes/io_write_bytes cuentan todas las lecturas y escrituras
+    (archivos y red); disk_read_bytes/disk_write_bytes, solo las que llegan
+    al disco. Cada valor se omite si el sistema no lo ofrece.
+    """
+    stats = {}
+    peak = peak_rss_bytes()
+    if peak is not None:
+        stats["peak_rss_bytes"] = peak
+
+    try:
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        stats["cpu_user_seconds"] = usage.ru_utime
+        stats["cpu_system_seconds"] = usage.ru_stime
+    except ImportError:
+        pass
+
+    io = {}
+    try:
+        # Linux
+        with open("/proc/self/io", 'r') as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                io[key] = int(value)
+        io = {
+            "io_read_bytes": io["rchar"],
+            "io_write_bytes": io["wchar"],
+            "disk_read_bytes": io["read_bytes"],
+            "disk_write_bytes": io["write_bytes"],
+        }
+    except (OSError, KeyError, ValueError):
+        try:
+            import psutil
+            counters = psutil.Process().io_counters()
+            io = {
+                "io_read_bytes": getattr(counters, "read_chars", counters.read_bytes),
+                "io_write_bytes": getattr(counters, "write_chars", counters.write_bytes),
+                "disk_read_bytes": counters.read_bytes,
+                "disk_write_bytes": counters.write_bytes,
+            }
+        except (ImportError, AttributeError):
+            io = {}
+    stats.update(io)
+    return stats
+
+def add_metrics_arguments(parser):
+    """
+    Añade a un parser de argparse las opciones de métricas y perfilado
+    """
+    parser.add_argument("--metrics-json", type=str, default=None, help="Añadir las métricas de la ejecución como una línea JSON a este archivo")
+    parser.add_argument("--metrics-prom", type=str, default=None, help="Escribir las métricas en este archivo de texto de Prometheus (textfile collector)")
+    parser.add_argument("--profile", type=str, default=None, choices=["cpu", "memory"], help="Perfilar la ejecución con cProfile (cpu) o tracemalloc (memory)")
+    parser.add_argument("--profile-output", type=str, default=None, help="Archivo del perfil (por defecto <script>.prof o <script>.tracemalloc)")
+
+class Metrics:
+    """
+    Métricas de una ejecución de un script
+    """
+
+    def __init__(self, job: str = "cognia"):
+        """
+        Args:
+            job: Nombre del script (etiqueta job en Prometheus)
+        """
+        self.job = job
+        self.json_log: Optional[str] = None
+        self.prometheus_file: Optional[str] = None
+        self.profile: Optional[str] = None
+        self.profile_output: Optional[str] = None
+        self.counters: Dict[str, float] = {}
+        self.values: Dict[str, float] = {}
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._profiler: Optional[cProfile.Profile] = None
+
+    def configure(
+        self,
+        job: str,
+        json_log: Optional[str] = None,
+        prometheus_file: Optional[str] = None,
+        profile: Optional[str] = None,
+        profile_output: Optional[str] = None
+    ) -> "Metrics":
+        """
+        Define el nombre del script, los destinos de las métricas y el perfilado
+
+        Args:
+            job: Nombre del script
+            json_log: Log JSON al que se añade una línea por ejecución
+            prometheus_file: Archivo de texto de Prometheus
+            profile: None, "cpu" (cProfile) o "memory" (tracemalloc)
+            profile_output: Archivo del perfil
+        """
+        self.job = job
+        self.json_log = json_log
+        self.prometheus_file = prometheus_file
+        self.profile = profile
+        self.profile_output = profile_output
+        self.started = time.time()
+        self._start = time.perf_counter()
+
+        if profile == "cpu":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif profile == "memory":
+            tracemalloc.start()
+        return self
+
+    def inc(self, name: str, value: float = 1):
+        """
+        Suma `value` a un contador
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name: str, value: float):
+        """
+        Fija el valor de una métrica (por ejemplo, una velocidad)
+        """
+        with self._lock:
+            self.values[name] = value
+
+    def _add_stage_time(self, stage: str, seconds: float, calls: int = 1):
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0})
+            entry["seconds"] += seconds
+            entry["calls"] += calls
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Mide el tiempo de un bloque y lo acumula en la etapa `stage`
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add_stage_time(stage, time.perf_counter() - start)
+
+    def timed_iter(self, iterable: Iterable, stage: str) -> Iterator:
+        """
+        Acumula en la etapa `stage` el tiempo que tarda en producirse cada elemento
+
+        Útil para separar el tiempo de lectura (por ejemplo, esperar la
+        siguiente página de Firestore) del tiempo de procesamiento.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._add_stage_time(stage, time.perf_counter() - start, 0)
+                return
+            self._add_stage_time(stage, time.perf_counter() - start)
+            yield item
+
+    def _profile_summary(self) -> Dict:
+        """
+        Detiene el perfilado, guarda el perfil y devuelve un resumen
+        """
+        if self._profiler is not None:
+            self._profiler.disable()
+            output = self.profile_output or f"{self.job}.prof"
+            self._profiler.dump_stats(output)
+            stats = pstats.Stats(self._profiler)
+            top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]
+            self._profiler = None
+            return {
+                "mode": "cpu",
+                "file": output,
+                "top_cumulative": [
+                    {
+                        "function": f"{filename}:{line}({function})",
+                        "calls": calls,
+                        "total_seconds": round(total, 6),
+                        "cumulative_seconds": round(cumulative, 6)
+                    }
+                    for (filename, line, function), (_, calls, total, cumulative, _) in top
+                ]
+            }
+
+        if self.profile == "memory" and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            output = self.profile_output or f"{self.job}.tracemalloc"
+            snapshot.dump(output)
+            return {
+                "mode": "memory",
+                "file": output,
+                "traced_current_bytes": current,
+                "traced_peak_bytes": peak,
+                "top_allocations": [
+                    {"location": str(stat.traceback), "bytes": stat.size, "blocks": stat.count}
+                    for stat in snapshot.statistics("lineno")[:PROFILE_TOP]
+                ]
+            }
+        return {}
+
+    def snapshot(self, success: Optional[bool] = None) -> Dict:
+        """
+        Métricas actuales como diccionario serializable
+        """
+        with self._lock:
+            record = {
+                "job": self.job,
+                "started": datetime.datetime.fromtimestamp(self.started, datetime.timezone.utc).isoformat(),
+                "duration_seconds": round(time.perf_counter() - self._start, 6),
+                "counters": dict(self.counters),
+                "values": dict(self.values),
+                "stages": {stage: dict(entry) for stage, entry in self.stages.items()},
+            }
+        if success is not None:
+            record["success"] = success
+        record["process"] = process_stats()
+        return record
+
+    def write_json(self, path: str, record: Dict):
+        """
+        Añade el registro como una línea al log JSON
+        """
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def write_prometheus(self, path: str, record: Dict):
+        """
+        Escribe el registro en formato de texto de Prometheus
+
+        El archivo se reemplaza de forma atómica para que node_exporter nunca
+        lea uno a medio escribir.
+        """
+        job = self.job.replace("\\", "\\\\").replace('"', '\\"')
+        lines = []
+
+        def metric(name: str, value: float, help_text: str, labels: str = ""):
+            name = f"{PROMETHEUS_PREFIX}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f'{name}{{job="{job}"{labels}}} {value}')
+
+        metric("last_run_timestamp_seconds", round(self.started, 3), "Inicio de la última ejecución")
+        metric("run_duration_seconds", record["duration_seconds"], "Duración de la última ejecución")
+        if "success" in record:
+            metric("run_success", int(record["success"]), "1 si la última ejecución terminó correctamente")
+        for name, value in record["counters"].items():
+            metric(name, value, f"Contador {name} de la última ejecución")
+        for name, value in record["values"].items():
+            metric(name, value, f"Valor {name} de la última ejecución")
+        for name, value in record["process"].items():
+            metric(f"process_{name}", value, f"Estadística del proceso {name}")
+
+        if record["stages"]:
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_stage_seconds Tiempo acumulado por etapa")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds gauge")
+            for stage, entry in record["stages"].items():
+                lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds{{job="{job}",stage="{stage}"}} {round(entry["seconds"], 6)}')
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_stage_calls Veces que se ejecutó cada etapa")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_stage_calls gauge")
+            for stage, entry in record["stages"].items():
+                lines.append(f'{PROMETHEUS_PREFIX}_stage_calls{{job="{job}",stage="{stage}"}} {entry["calls"]}')
+
+        temp_file = f"{path}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_file, path)
+
+    def finish(self, success: bool = True) -> Dict:
+        """
+        Termina el perfilado y escribe las métricas en los destinos configurados
+
+        Args:
+            success: Si la ejecución terminó correctamente
+
+        Returns:
+            Registro de la ejecución
+        """
+        profile = self._profile_summary()
+        record = self.snapshot(success)
+        if profile:
+            record["profile"] = profile
+
+        if self.json_log:
+            self.write_json(self.json_log, record)
+        if self.prometheus_file:
+            self.write_prometheus(self.prometheus_file, record)
+        return record
+
+_metrics = Metrics()
+
+def metrics() -> Metrics:
+    """
+    Devuelve el registro de métricas del proceso
+    """
+    return _metrics
@@ -0,0 +1,250 @@
+"""
+Codificación y compresión de archivos JSONL para los datos de entrenamiento
+
+- Codec: usa orjson o msgspec si están instalados y, si no, el módulo json de
+  la biblioteca estándar. Todos producen la misma salida: JSON compacto en
+  UTF-8 (sin espacios y sin escapar caracteres no ASCII), una línea por
+  ejemplo, que es el formato que acepta el ajuste fino de Vertex AI.
+- Escritura por bloques: las líneas se acumulan en un búfer y se escriben con
+  una sola llamada a write por bloque.
+- Compresión opcional (gzip o zstd): cada bloque se comprime como un miembro
+  gzip o un frame zstd independiente. La concatenación de bloques es un
+  archivo válido, así que se puede añadir al final y truncar en el límite de
+  un bloque (checkpoints y modo incremental).
+
+Uso:
+    with open("training_data.jsonl.gz", "wb") as f:
+        writer = JsonlWriter(f, compression="gzip")
+        writer.write_many(examples)
+        writer.flush()
+"""
+
+import gzip
+import io
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional
+
+# Tamaño del búfer de escritura (bytes sin comprimir)
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+COMPRESSIONS = ("none", "gzip", "zstd")
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+class Codec(NamedTuple):
+    """
+    Serializador JSON: dumps devuelve bytes UTF-8, loads acepta bytes o str
+    """
+    name: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[Any], Any]
+
+def _orjson_codec() -> Codec:
+    import orjson
+    return Codec("orjson", orjson.dumps, orjson.loads)
+
+def _msgspec_codec() -> Codec:
+    import msgspec
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+    return Codec("msgspec", encoder.encode, decoder.decode)
+
+def _json_codec() -> Codec:
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    return Codec("json", lambda obj: encoder.encode(obj).encode("utf-8"), json.loads)
+
+_CODECS = {
+    "orjson": _orjson_codec,
+    "msgspec": _msgspec_codec,
+    "json": _json_codec,
+}
+
+_default_codec: Optional[Codec] = None
+
+def get_codec(name: str = "auto") -> Codec:
+    """
+    Devuelve el codec pedido; "auto" elige el más rápido disponible
+
+    Args:
+        name: "auto", "orjson", "msgspec" o "json"
+
+    Returns:
+        Codec
+    """
+    if name != "auto":
+        return _CODECS[name]()
+    for candidate in ("orjson", "msgspec"):
+        try:
+            return _CODECS[candidate]()
+        except ImportError:
+            continue
+    return _json_codec()
+
+def set_default_codec(name: str = "auto") -> Codec:
+    """
+    Fija el codec que usan las funciones cuando no se indica uno
+
+    Args:
+        name: "auto", "orjson", "msgspec" o "json"
+
+    Returns:
+        Codec seleccionado
+    """
+    global _default_codec
+    _default_codec = get_codec(name)
+    return _default_codec
+
+def default_codec() -> Codec:
+    """
+    Devuelve el codec por defecto (el más rápido disponible si no se fijó otro)
+    """
+    return _default_codec or set_default_codec()
+
+def compression_for_path(path: str) -> str:
+    """
+    Deduce la compresión a partir de la extensión del archivo
+
+    Args:
+        path: Ruta del archivo
+
+    Returns:
+        "gzip", "zstd" o "none"
+    """
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".zst"):
+        return "zstd"
+    return "none"
+
+def _compressor(compression: str) -> Optional[Callable[[bytes], bytes]]:
+    if compression == "none":
+        return None
+    if compression == "gzip":
+        return lambda data: gzip.compress(data, compresslevel=6)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("La compresión zstd requiere el paquete zstandard (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=3).compress
+    raise ValueError(f"Compresión desconocida: {compression}")
+
+class JsonlWriter:
+    """
+    Escribe ejemplos JSONL en bloques, opcionalmente comprimidos
+
+    Después de flush() el archivo termina en el límite de un bloque, así que
+    f.tell() es una posición segura para truncar y continuar.
+    """
+
+    def __init__(
+        self,
+        f,
+        codec: Optional[Codec] = None,
+        compression: str = "none",
+        buffer_size: int = DEFAULT_BUFFER_SIZE
+    ):
+        """
+        Args:
+            f: Archivo abierto en modo binario
+            codec: Codec a usar (None = codec por defecto)
+            compression: "none", "gzip" o "zstd"
+            buffer_size: Bytes sin comprimir acumulados antes de escribir un bloque
+        """
+        self.f = f
+        self.codec = codec or default_codec()
+        self.buffer_size = buffer_size
+        self._compress = _compressor(compression)
+        self._lines = []
+        self._buffered = 0
+        self.count = 0
+        self.bytes_written = 0
+
+    def write(self, example: Dict):
+        """
+        Añade un ejemplo al búfer
+        """
+        line = self.codec.dumps(example) + b"\n"
+        self._lines.append(line)
+        self._buffered += len(line)
+        self.count += 1
+        if self._buffered >= self.buffer_size:
+            self._write_block()
+
+    def write_many(self, examples: Iterable[Dict]) -> int:
+        """
+        Añade varios ejemplos al búfer
+
+        Returns:
+            Número de ejemplos añadidos
+        """
+        dumps = self.codec.dumps
+        start = self.count
+        for example in examples:
+            line = dumps(example) + b"\n"
+            self._lines.append(line)
+            self._buffered += len(line)
+            self.count += 1
+            if self._buffered >= self.buffer_size:
+                self._write_block()
+        return self.count - start
+
+    def _write_block(self):
+        if not self._lines:
+            return
+        block = b"".join(self._lines)
+        self.bytes_written += len(block)
+        self.f.write(self._compress(block) if self._compress else block)
+        self._lines = []
+        self._buffered = 0
+
+    def flush(self):
+        """
+        Escribe el bloque pendiente y vacía el archivo
+        """
+        self._write_block()
+        self.f.flush()
+
+def open_jsonl_lines(path: str) -> io.BufferedIOBase:
+    """
+    Abre un archivo JSONL, comprimido o no, para leerlo línea a línea
+
+    La compresión se detecta por los primeros bytes del archivo.
+
+    Args:
+        path: Ruta del archivo
+
+    Returns:
+        Flujo binario descomprimido
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, 'rb')
+    if magic == ZSTD_MAGIC:
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Leer archivos zstd requiere el paquete zstandard (pip install zstandard)")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+        return io.BufferedReader(reader)
+    return open(path, 'rb')
+
+def iter_jsonl(path: str, codec: Optional[Codec] = None) -> Iterator[Dict]:
+    """
+    Lee ejemplos de un archivo JSONL, comprimido o no
+
+    Args:
+        path: Ruta del archivo
+        codec: Codec a usar (None = codec por defecto)
+
+    Returns:
+        Iterador de ejemplos (se ignoran las líneas vacías)
+    """
+    loads = (codec or default_codec()).loads
+    with open_jsonl_lines(path) as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
@@ -0,0 +1,382 @@
+"""
+Índice de desplazamientos de un JSONL: acceso aleatorio, barajado externo y
+división en entrenamiento y validación
+
+El índice es un array uint64 con el byte donde empieza cada línea no vacía
+(las que solo tienen espacios también se descartan) y, al final, el tamaño
+del archivo: la línea i ocupa offsets[i]:offsets[i + 1].
+Se guarda junto al archivo (<archivo>.idx.npy, 8 bytes por ejemplo) y se abre
+con memory map, así que leer cualquier ejemplo es una sola lectura del disco
+y la memoria depende del número de ejemplos, no de su tamaño.
+
+- Barajado externo: permutación con semilla de los números de línea. Las
+  líneas se leen por bloques en orden de desplazamiento (lecturas hacia
+  delante) y se escriben en el orden de la permutación.
+- Validación por usuario: un ejemplo va a validación según el hash de su
+  userId (o de sus mensajes si no lo tiene), así que todas las conversaciones
+  de un usuario caen en la misma parte y la división no depende de la semilla
+  ni del orden del archivo.
+
+Requiere NumPy (pip install numpy). El JSONL no puede estar comprimido.
+
+Uso:
+    with JsonlIndex("training_data.jsonl") as index:
+        print(len(index), index[12345])
+    shuffle_split("training_data.jsonl", "train.jsonl", "validation.jsonl", seed=42, validation_fraction=0.1)
+"""
+
+import os
+import time
+from array import array
+from hashlib import blake2b
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from dataset_shards import is_compressed
+from jsonl_codec import Codec, default_codec
+from training_pipeline import example_id
+
+INDEX_SUFFIX = ".idx.npy"
+
+# Bytes que se leen de una vez al construir el índice
+INDEX_CHUNK_SIZE = 16 << 20
+
+# Bytes de espacio en blanco (las líneas que solo tienen estos se descartan)
+_WHITESPACE = np.frombuffer(b" \t\r\n", dtype=np.uint8)
+
+# Líneas que se leen juntas (ordenadas por desplazamiento) al barajar
+SHUFFLE_BLOCK_SIZE = 16 * 1024
+
+def index_path(path: str) -> str:
+    """
+    Ruta del índice de un JSONL
+    """
+    return path + INDEX_SUFFIX
+
+def build_offset_index(path: str, chunk_size: int = INDEX_CHUNK_SIZE) -> np.ndarray:
+    """
+    Calcula el índice de desplazamientos recorriendo el archivo una vez
+
+    Solo se buscan saltos de línea (no se analiza el JSON).
+
+    Args:
+        path: Ruta del JSONL (sin comprimir)
+        chunk_size: Bytes que se leen de una vez
+
+    Returns:
+        Array uint64 con el inicio de cada línea no vacía y el tamaño del archivo al final
+    """
+    if is_compressed(path):
+        raise ValueError(f"El índice necesita un JSONL sin comprimir: {path}")
+
+    starts = [np.zeros(1, dtype=np.uint64)]
+    position = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 0x0A)
+            starts.append(newlines.astype(np.uint64) + np.uint64(position + 1))
+            position += len(chunk)
+
+    starts = np.concatenate(starts)
+    if starts[-1] != position:
+        starts = np.append(starts, np.uint64(position))
+    if position == 0:
+        return starts
+
+    # Descartar las líneas vacías o con solo espacios ("\n", "  \n", "\r\n"),
+    # como hacen los lectores de JSONL con line.strip(): su contenido queda al
+    # final de la línea anterior. Solo las líneas que empiezan por un espacio
+    # pueden estar vacías, así que solo esas se leen
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    line_starts = starts[:-1]
+    candidates = np.flatnonzero(np.isin(data[line_starts], _WHITESPACE))
+    keep = np.ones(len(line_starts), dtype=bool)
+    for i in candidates:
+        if not bytes(data[line_starts[i]:starts[i + 1]]).strip():
+            keep[i] = False
+    del data
+    return np.append(line_starts[keep], np.uint64(position))
+
+def save_offset_index(offsets: np.ndarray, path: str):
+    """
+    Guarda el índice junto al JSONL (escritura atómica)
+    """
+    tmp_file = index_path(path) + ".tmp"
+    with open(tmp_file, 'wb') as f:
+        np.save(f, np.asarray(offsets, dtype=np.uint64))
+    os.replace(tmp_file, index_path(path))
+
+def load_offset_index(path: str, rebuild: bool = True) -> np.ndarray:
+    """
+    Abre el índice de un JSONL (con memory map), construyéndolo si falta
+
+    Un índice más antiguo que el archivo, o cuyo último valor no coincide con
+    el tamaño del archivo, se considera obsoleto y se reconstruye.
+
+    Args:
+        path: Ruta del JSONL
+        rebuild: Construir y guardar el índice si falta o está obsoleto
+
+    Returns:
+        Array uint64 de desplazamientos (ver build_offset_index)
+    """
+    idx_file = index_path(path)
+    if os.path.exists(idx_file) and os.path.getmtime(idx_file) >= os.path.getmtime(path):
+        offsets = np.load(idx_file, mmap_mode="r")
+        if len(offsets) and int(offsets[-1]) == os.path.getsize(path):
+            return offsets
+    if not rebuild:
+        raise FileNotFoundError(f"No hay un índice válido para {path}")
+
+    save_offset_index(build_offset_index(path), path)
+    return np.load(idx_file, mmap_mode="r")
+
+class JsonlIndex:
+    """
+    Acceso aleatorio a las líneas de un JSONL a través de su índice
+
+    index[i] lee y decodifica el ejemplo i con una sola lectura; lines()
+    devuelve muchas líneas en cualquier orden leyéndolas por bloques en
+    orden de desplazamiento.
+    """
+
+    def __init__(self, path: str, codec: Optional[Codec] = None, rebuild: bool = True):
+        """
+        Args:
+            path: Ruta del JSONL (sin comprimir)
+            codec: Codec JSON (None = el más rápido disponible)
+            rebuild: Construir el índice si falta o está obsoleto
+        """
+        self.path = path
+        self.codec = codec or default_codec()
+        self.offsets = load_offset_index(path, rebuild)
+        self._file = open(path, 'rb')
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _check(self, i: int) -> int:
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(f"Ejemplo {i} fuera de rango (hay {n})")
+        return i
+
+    def line(self, i: int) -> bytes:
+        """
+        Línea i sin el salto de línea final
+
+        Args:
+            i: Número de ejemplo (los negativos cuentan desde el final)
+
+        Returns:
+            Bytes de la línea
+        """
+        i = self._check(i)
+        start = int(self.offsets[i])
+        self._file.seek(start)
+        return self._file.read(int(self.offsets[i + 1]) - start).rstrip()
+
+    def __getitem__(self, i: int) -> Dict:
+        return self.codec.loads(self.line(i))
+
+    def lines(self, indices: Iterable[int], block_size: int = SHUFFLE_BLOCK_SIZE) -> Iterator[bytes]:
+        """
+        Devuelve las líneas pedidas en el orden dado
+
+        Cada bloque de `block_size` números se lee en orden de desplazamiento,
+        así que la memoria está acotada por el bloque.
+
+        Args:
+            indices: Números de ejemplo
+            block_size: Líneas que se leen juntas
+
+        Returns:
+            Iterador de líneas (bytes, sin salto de línea)
+        """
+        block = []
+        for i in indices:
+            block.append(self._check(int(i)))
+            if len(block) >= block_size:
+                yield from self._read_block(block)
+                block = []
+        if block:
+            yield from self._read_block(block)
+
+    def _read_block(self, block: List[int]) -> List[bytes]:
+        block = np.asarray(block, dtype=np.int64)
+        lines = [b""] * len(block)
+        f = self._file
+        for position in np.argsort(block, kind="stable"):
+            i = int(block[position])
+            start = int(self.offsets[i])
+            f.seek(start)
+            lines[position] = f.read(int(self.offsets[i + 1]) - start).rstrip()
+        return lines
+
+    def sample(self, count: int, seed: Optional[int] = None) -> List[Dict]:
+        """
+        Elige ejemplos al azar sin repetición
+
+        Args:
+            count: Número de ejemplos (como mucho, todos)
+            seed: Semilla del generador (None = aleatoria)
+
+        Returns:
+            Ejemplos elegidos
+        """
+        rng = np.random.default_rng(seed)
+        chosen = rng.choice(len(self), size=min(count, len(self)), replace=False)
+        return [self.codec.loads(line) for line in self.lines(chosen)]
+
+    def close(self):
+        """
+        Cierra el archivo
+        """
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def shuffled_order(count: int, seed: Optional[int]) -> np.ndarray:
+    """
+    Permutación de los números de línea (None = orden original)
+
+    Args:
+        count: Número de líneas
+        seed: Semilla del barajado
+
+    Returns:
+        Array int64 con el orden de lectura
+    """
+    if seed is None:
+        return np.arange(count, dtype=np.int64)
+    return np.random.default_rng(seed).permutation(count)
+
+def validation_key(example: Dict) -> str:
+    """
+    Clave que decide la parte de un ejemplo: su userId o, si no lo tiene, su ID
+    """
+    user_id = example.get("userId")
+    return f"user:{user_id}" if user_id is not None else f"example:{example_id(example)}"
+
+def is_validation(example: Dict, fraction: float) -> bool:
+    """
+    Indica si un ejemplo pertenece a la parte de validación
+
+    Usa un hash distinto del de is_holdout, así que la validación y la parte
+    reservada para evaluación son independientes.
+
+    Args:
+        example: Ejemplo con "messages" (y "userId" si se conoce)
+        fraction: Proporción de validación (0-1)
+
+    Returns:
+        True si el ejemplo va a validación
+    """
+    if fraction <= 0:
+        return False
+    digest = blake2b(validation_key(example).encode("utf-8"), digest_size=8, person=b"validation")
+    return int.from_bytes(digest.digest(), "big") < fraction * 2 ** 64
+
+def _is_validation_line(line: bytes, loads, fraction: float) -> bool:
+    # Una línea que no es un ejemplo JSON válido se queda en entrenamiento: la
+    # validación de la preparación la pone en cuarentena
+    try:
+        return is_validation(loads(line), fraction)
+    except Exception:
+        return False
+
+class _IndexedOutput:
+    """
+    Archivo JSONL de salida que guarda su propio índice al cerrarse
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.f = open(path, 'wb')
+        self.offsets = array('Q', [0])
+        self.buffer = []
+        self.buffered = 0
+
+    def write(self, line: bytes):
+        self.buffer.append(line)
+        self.buffer.append(b"\n")
+        self.buffered += len(line) + 1
+        self.offsets.append(self.offsets[-1] + len(line) + 1)
+        if self.buffered >= 1 << 20:
+            self.flush()
+
+    def flush(self):
+        self.f.write(b"".join(self.buffer))
+        self.buffer = []
+        self.buffered = 0
+
+    def close(self) -> int:
+        self.flush()
+        self.f.close()
+        save_offset_index(np.frombuffer(self.offsets, dtype=np.uint64), self.path)
+        return len(self.offsets) - 1
+
+def shuffle_split(
+    data_file: str,
+    train_file: str,
+    validation_file: Optional[str] = None,
+    seed: Optional[int] = None,
+    validation_fraction: float = 0.0,
+    block_size: int = SHUFFLE_BLOCK_SIZE,
+    codec: Optional[Codec] = None
+) -> Dict:
+    """
+    Baraja un JSONL y lo divide en entrenamiento y validación en una pasada
+
+    Las líneas se copian tal cual (solo se decodifican para leer el userId
+    cuando hay validación). Cada salida se escribe con su índice.
+
+    Args:
+        data_file: JSONL de entrada (sin comprimir)
+        train_file: JSONL de entrenamiento
+        validation_file: JSONL de validación (necesario si validation_fraction > 0)
+        seed: Semilla del barajado (None = conservar el orden)
+        validation_fraction: Proporción de usuarios que van a validación (0-1)
+        block_size: Líneas que se leen juntas
+        codec: Codec JSON (None = el más rápido disponible)
+
+    Returns:
+        Ejemplos de cada parte y segundos empleados
+    """
+    if validation_fraction > 0 and not validation_file:
+        raise ValueError("Hace falta un archivo de validación si validation_fraction > 0")
+
+    start = time.perf_counter()
+    with JsonlIndex(data_file, codec) as index:
+        order = shuffled_order(len(index), seed)
+        loads = index.codec.loads
+        train = _IndexedOutput(train_file)
+        validation = _IndexedOutput(validation_file) if validation_fraction > 0 else None
+        try:
+            for line in index.lines(order, block_size):
+                if validation is not None and _is_validation_line(line, loads, validation_fraction):
+                    validation.write(line)
+                else:
+                    train.write(line)
+        finally:
+            train_examples = train.close()
+            validation_examples = validation.close() if validation is not None else 0
+
+    return {
+        "examples": len(order),
+        "train_examples": train_examples,
+        "validation_examples": validation_examples,
+        "seed": seed,
+        "validation_fraction": validation_fraction,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
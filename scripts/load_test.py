@@ -0,0 +1,212 @@
+"""
+Pruebas de carga de modelos Gemini con peticiones concurrentes en streaming
+
+Las peticiones se lanzan a un ritmo objetivo (peticiones por segundo, en
+lazo abierto: cada petición tiene su hora de salida prevista) con un máximo
+de `concurrency` streams a la vez. Si el servicio no da abasto, las
+peticiones esperan turno; esa espera se mide aparte (queue) para que no
+oculte la latencia real. Los modelos se intercalan petición a petición, así
+que se comparan en las mismas condiciones.
+
+Por cada petición se mide el tiempo hasta el primer token (TTFT), la latencia
+total y los tokens por segundo (estimados con la aproximación local del
+tokenizador), y por modelo se calculan percentiles y tasa de errores.
+"""
+
+import asyncio
+import math
+import time
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from gemini_backends import DEFAULT_CONFIG, examples_to_contents
+from instrumentation import metrics
+from jsonl_codec import iter_jsonl
+from training_pipeline import ASSISTANT_ROLES, CHARS_PER_TOKEN
+
+def load_prompts(path: str) -> List[List[Dict]]:
+    """
+    Carga los prompts de un archivo de texto o de un JSONL de entrenamiento
+
+    - Texto: un prompt por línea (se ignoran las líneas vacías).
+    - JSONL: por cada ejemplo, la conversación hasta el último mensaje del
+      usuario (la respuesta del asistente no se envía).
+
+    Args:
+        path: Ruta del archivo
+
+    Returns:
+        Lista de contenidos (mensajes {"role", "text"}) listos para enviar
+    """
+    if path.endswith((".jsonl", ".jsonl.gz", ".jsonl.zst")):
+        prompts = []
+        for example in iter_jsonl(path):
+            messages = example.get("messages", [])
+            last_user = max(
+                (i for i, message in enumerate(messages) if message.get("role", "user") not in ASSISTANT_ROLES),
+                default=None
+            )
+            if last_user is not None:
+                prompts.append(examples_to_contents(messages[:last_user + 1]))
+        return prompts
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return [[{"role": "user", "text": line.strip()}] for line in f if line.strip()]
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """
+    Percentil por el método del rango más cercano (None si no hay valores)
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * q / 100) - 1)]
+
+def summarize(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    """
+    Media y percentiles p50/p90/p99 de una lista de valores
+    """
+    return {
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+    }
+
+async def _request(backend, model: str, contents: List[Dict], config: Dict, scheduled: float, semaphore: asyncio.Semaphore) -> Dict:
+    """
+    Ejecuta una petición en streaming y mide sus tiempos
+    """
+    async with semaphore:
+        start = time.perf_counter()
+        result = {"model": model, "queue": max(0.0, start - scheduled)}
+        first = None
+        chars = 0
+        try:
+            async for text in backend.stream(model, contents, config):
+                if first is None:
+                    first = time.perf_counter()
+                chars += len(text)
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+            metrics().inc("load_test_errors")
+            return result
+        end = time.perf_counter()
+
+    tokens = math.ceil(chars / CHARS_PER_TOKEN)
+    result.update({
+        "ttft": (first or end) - start,
+        "latency": end - start,
+        "tokens": tokens,
+        "tokens_per_second": tokens / (end - first) if first is not None and end > first else None,
+    })
+    metrics().inc("load_test_requests")
+    metrics().inc("load_test_tokens", tokens)
+    return result
+
+def request_plan(prompts: List[List[Dict]], models: List[str], requests: int) -> Iterator[tuple]:
+    """
+    Reparte las peticiones: los prompts en orden circular y, para cada prompt,
+    todos los modelos seguidos
+    """
+    for i in range(requests):
+        prompt = prompts[(i // len(models)) % len(prompts)]
+        yield models[i % len(models)], prompt
+
+async def run_load_test(
+    backend,
+    models: List[str],
+    prompts: List[List[Dict]],
+    requests: int,
+    concurrency: int = 8,
+    rps: float = 0.0,
+    config: Optional[Dict] = None
+) -> Dict:
+    """
+    Ejecuta la prueba de carga
+
+    Args:
+        backend: Backend con el método stream (gemini_backends)
+        models: Modelos a comparar
+        prompts: Contenidos a enviar (se reutilizan en orden circular)
+        requests: Número total de peticiones
+        concurrency: Máximo de streams simultáneos
+        rps: Peticiones por segundo objetivo (0 = sin límite, solo concurrencia)
+        config: Configuración de generación
+
+    Returns:
+        Informe con las estadísticas por modelo
+    """
+    config = config or DEFAULT_CONFIG
+    semaphore = asyncio.Semaphore(concurrency)
+    loop_start = time.perf_counter()
+
+    tasks = []
+    for i, (model, contents) in enumerate(request_plan(prompts, models, requests)):
+        scheduled = loop_start + (i / rps if rps > 0 else 0)
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(_request(backend, model, contents, config, scheduled, semaphore)))
+        if rps <= 0 and len(tasks) % concurrency == 0:
+            # Sin ritmo objetivo: ceder el control para no crear todas las tareas de golpe
+            await asyncio.sleep(0)
+
+    dispatched = time.perf_counter() - loop_start
+    results = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - loop_start
+
+    report = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "target_rps": rps or None,
+        "send_rps": requests / dispatched if dispatched else None,
+        "achieved_rps": requests / elapsed if elapsed else None,
+        "seconds": elapsed,
+        "models": {}
+    }
+    for model in models:
+        model_results = [result for result in results if result["model"] == model]
+        ok = [result for result in model_results if "error" not in result]
+        errors = [result["error"] for result in model_results if "error" in result]
+        report["models"][model] = {
+            "requests": len(model_results),
+            "errors": len(errors),
+            "error_rate": len(errors) / len(model_results) if model_results else 0.0,
+            "ttft_seconds": summarize([result["ttft"] for result in ok]),
+            "latency_seconds": summarize([result["latency"] for result in ok]),
+            "queue_seconds": summarize([result["queue"] for result in model_results]),
+            "tokens_per_second": summarize([result["tokens_per_second"] for result in ok if result["tokens_per_second"] is not None]),
+            "output_tokens": sum(result["tokens"] for result in ok),
+            "sample_errors": sorted(set(errors))[:5],
+        }
+    return report
+
+def format_report(report: Dict) -> str:
+    """
+    Formatea el informe de la prueba de carga como texto
+    """
+    def ms(value):
+        return f"{value * 1000:.0f}" if value is not None else "-"
+
+    def rate(value):
+        return f"{value:.1f}" if value is not None else "-"
+
+    lines = [
+        f"Peticiones: {report['requests']}  Concurrencia: {report['concurrency']}  "
+        f"Envío: {rate(report['send_rps'])} pet/s (objetivo {report['target_rps'] or 'sin límite'})  "
+        f"Completadas: {rate(report['achieved_rps'])} pet/s  "
+        f"Duración: {report['seconds']:.1f}s",
+        "",
+        f"{'Modelo':<45} {'errores':>8} {'TTFT p50/p99 (ms)':>18} {'latencia p50/p99 (ms)':>22} {'tokens/s p50':>13}",
+    ]
+    for model, stats in report["models"].items():
+        ttft = stats["ttft_seconds"]
+        latency = stats["latency_seconds"]
+        speed = stats["tokens_per_second"]["p50"]
+        lines.append(
+            f"{model[-45:]:<45} {stats['error_rate']:>7.1%} "
+            f"{ms(ttft['p50']) + '/' + ms(ttft['p99']):>18} "
+            f"{ms(latency['p50']) + '/' + ms(latency['p99']):>22} "
+            f"{(f'{speed:.1f}' if speed is not None else '-'):>13}"
+        )
+    return "\n".join(lines)
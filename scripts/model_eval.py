@@ -0,0 +1,351 @@
+"""
+Evaluación offline de modelos con los ejemplos reservados del entrenamiento
+
+Cada respuesta del asistente de un ejemplo reservado (ver split_holdout en
+training_pipeline.py) es un caso de evaluación: se envía la conversación
+hasta el mensaje del usuario anterior y la respuesta del modelo se compara
+con la original usando métricas locales baratas:
+
+- f1: solapamiento de palabras con la respuesta de referencia (F1 de unigramas)
+- length_ratio: longitud de la respuesta / longitud de la referencia
+- quality: puntuación local de calidad del par pregunta-respuesta (quality_scorer.py)
+
+Los resultados se añaden línea a línea a un JSONL, que hace de checkpoint:
+si la evaluación se interrumpe, al volver a ejecutarla se omiten los pares
+(caso, modelo) que ya tienen resultado.
+"""
+
+import asyncio
+import os
+import random
+import re
+import time
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from gemini_backends import DEFAULT_CONFIG, examples_to_contents, is_rate_limit_error
+from instrumentation import metrics
+from jsonl_codec import default_codec
+from load_test import summarize
+from quality_scorer import score_messages
+from training_pipeline import ASSISTANT_ROLES, CHARS_PER_TOKEN, example_id
+
+WORD_RE = re.compile(r"\w+")
+
+def eval_items(examples: Iterable[Dict], turns: str = "all") -> Iterator[Dict]:
+    """
+    Genera los casos de evaluación de una serie de ejemplos
+
+    Args:
+        examples: Iterable de ejemplos (role/content)
+        turns: "all" evalúa cada respuesta del asistente, "last" solo la última
+
+    Returns:
+        Iterador de casos {"id", "contents", "prompt", "reference"}
+    """
+    for example in examples:
+        messages = example.get("messages", [])
+        base_id = example_id(example)
+        positions = [
+            i for i, message in enumerate(messages)
+            if i > 0
+            and message.get("role", "user") in ASSISTANT_ROLES
+            and messages[i - 1].get("role", "user") not in ASSISTANT_ROLES
+            and message.get("content")
+        ]
+        if turns == "last":
+            positions = positions[-1:]
+        for i in positions:
+            yield {
+                "id": f"{base_id}:{i}",
+                "contents": examples_to_contents(messages[:i]),
+                "prompt": messages[i - 1].get("content", ""),
+                "reference": messages[i]["content"],
+            }
+
+def token_f1(response: str, reference: str) -> float:
+    """
+    F1 de unigramas (palabras en minúsculas) entre la respuesta y la referencia
+    """
+    response_words = Counter(WORD_RE.findall(response.lower()))
+    reference_words = Counter(WORD_RE.findall(reference.lower()))
+    common = sum((response_words & reference_words).values())
+    if not common:
+        return 0.0
+    precision = common / sum(response_words.values())
+    recall = common / sum(reference_words.values())
+    return 2 * precision * recall / (precision + recall)
+
+def score_response(prompt: str, response: str, reference: str) -> Dict[str, float]:
+    """
+    Métricas locales de una respuesta
+
+    Args:
+        prompt: Último mensaje del usuario
+        response: Respuesta del modelo
+        reference: Respuesta original del conjunto de datos
+
+    Returns:
+        Diccionario con f1, length_ratio, quality y response_tokens
+    """
+    return {
+        "f1": token_f1(response, reference),
+        "length_ratio": len(response) / max(1, len(reference)),
+        "quality": score_messages([
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": response},
+        ]),
+        "response_tokens": -(-len(response) // CHARS_PER_TOKEN),
+    }
+
+def open_results(path: str) -> Tuple[Set[Tuple[str, str]], object]:
+    """
+    Abre el JSONL de resultados para continuar una evaluación
+
+    Si la ejecución anterior se cortó a mitad de una línea, esa línea se
+    descarta (se trunca el archivo en el último salto de línea). Los pares
+    que terminaron en error no cuentan como evaluados: se vuelven a intentar,
+    y el resultado nuevo sustituye al error en el informe (build_report).
+
+    Args:
+        path: Ruta del JSONL de resultados
+
+    Returns:
+        Pares (caso, modelo) ya evaluados sin error y el archivo abierto para añadir
+    """
+    completed = set()
+    if os.path.exists(path):
+        loads = default_codec().loads
+        valid_end = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                valid_end += len(line)
+                result = loads(line)
+                if "error" not in result:
+                    completed.add((result["id"], result["model"]))
+        if valid_end != os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(valid_end)
+    return completed, open(path, 'ab')
+
+def iter_results(path: str) -> Iterator[Dict]:
+    """
+    Lee los resultados guardados (ignora una última línea incompleta)
+    """
+    loads = default_codec().loads
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.endswith(b"\n"):
+                yield loads(line)
+
+class EvalRunner:
+    """
+    Ejecuta los casos de evaluación contra varios modelos en paralelo
+
+    Como máximo hay `concurrency` peticiones en curso. Un error de límite de
+    peticiones (429) o transitorio se reintenta con espera exponencial y
+    jitter, y además pausa el envío de peticiones nuevas de todos los
+    trabajadores durante esa espera, para bajar el ritmo en vez de insistir.
+    """
+
+    def __init__(
+        self,
+        backend,
+        models: List[str],
+        concurrency: int = 8,
+        max_retries: int = 5,
+        backoff_seconds: float = 1.0,
+        config: Optional[Dict] = None
+    ):
+        """
+        Args:
+            backend: Backend con el método stream (gemini_backends)
+            models: Modelos a evaluar
+            concurrency: Máximo de peticiones en curso
+            max_retries: Reintentos por petición ante límites de peticiones
+            backoff_seconds: Espera inicial antes del primer reintento (se duplica en cada uno)
+            config: Configuración de generación
+        """
+        self.backend = backend
+        self.models = models
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.config = config or DEFAULT_CONFIG
+        self._resume_at = 0.0
+        self._rng = random.Random()
+
+        self.completed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.retries = 0
+
+    async def _wait_cooldown(self):
+        delay = self._resume_at - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._resume_at - time.monotonic()
+
+    async def _generate(self, model: str, contents: List[Dict]) -> Dict:
+        """
+        Obtiene la respuesta completa de un modelo, con reintentos
+        """
+        attempt = 0
+        while True:
+            await self._wait_cooldown()
+            start = time.perf_counter()
+            first = None
+            parts = []
+            try:
+                async for text in self.backend.stream(model, contents, self.config):
+                    if first is None:
+                        first = time.perf_counter()
+                    parts.append(text)
+            except Exception as e:
+                if attempt < self.max_retries and is_rate_limit_error(e):
+                    delay = self.backoff_seconds * 2 ** attempt * (0.5 + self._rng.random())
+                    self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                    attempt += 1
+                    self.retries += 1
+                    metrics().inc("eval_retries")
+                    continue
+                return {"error": f"{type(e).__name__}: {e}", "attempts": attempt + 1}
+            end = time.perf_counter()
+            return {
+                "response": "".join(parts),
+                "ttft": (first or end) - start,
+                "latency": end - start,
+                "attempts": attempt + 1,
+            }
+
+    async def _evaluate(self, item: Dict, model: str) -> Dict:
+        result = {"id": item["id"], "model": model}
+        result.update(await self._generate(model, item["contents"]))
+        if "error" in result:
+            self.errors += 1
+            metrics().inc("eval_errors")
+        else:
+            result.update(score_response(item["prompt"], result["response"], item["reference"]))
+            metrics().inc("eval_responses")
+        return result
+
+    def _jobs(self, items: Iterable[Dict], completed: Set[Tuple[str, str]]) -> Iterator[Tuple[Dict, str]]:
+        for item in items:
+            for model in self.models:
+                if (item["id"], model) in completed:
+                    self.skipped += 1
+                    continue
+                yield item, model
+
+    async def run(self, items: Iterable[Dict], results_file: str, progress_every: int = 100) -> int:
+        """
+        Evalúa los casos y añade los resultados al JSONL
+
+        Args:
+            items: Casos de evaluación (eval_items)
+            results_file: JSONL de resultados (también sirve de checkpoint)
+            progress_every: Cada cuántos resultados se informa del progreso
+
+        Returns:
+            Número de resultados nuevos
+        """
+        completed, out = open_results(results_file)
+        dumps = default_codec().dumps
+        jobs = self._jobs(items, completed)
+        started = time.perf_counter()
+
+        async def worker():
+            # Todos los trabajadores comparten el mismo iterador: el bucle de
+            # eventos es de un solo hilo, así que next() no necesita bloqueo
+            for item, model in jobs:
+                result = await self._evaluate(item, model)
+                out.write(dumps(result) + b"\n")
+                out.flush()
+                self.completed += 1
+                if self.completed % progress_every == 0:
+                    rate = self.completed / (time.perf_counter() - started)
+                    print(f"Evaluados {self.completed} casos ({rate:.1f}/s, {self.errors} errores, {self.retries} reintentos)")
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            out.close()
+        return self.completed
+
+    def summary(self) -> str:
+        """
+        Resumen de la ejecución
+        """
+        return (
+            f"Evaluación: {self.completed} respuestas nuevas, {self.skipped} ya evaluadas (checkpoint), "
+            f"{self.errors} errores, {self.retries} reintentos por límite de peticiones"
+        )
+
+def _mean(values: List[float]) -> Optional[float]:
+    return sum(values) / len(values) if values else None
+
+def build_report(results_file: str, models: List[str]) -> Dict:
+    """
+    Agrega los resultados por modelo
+
+    La comparación ("wins_vs_first") cuenta, en los casos que ambos modelos
+    respondieron, en qué proporción cada modelo supera en F1 al primero de la
+    lista (normalmente el modelo base). Si un par (caso, modelo) aparece
+    varias veces (un error reintentado al reanudar), cuenta el último resultado.
+
+    Args:
+        results_file: JSONL de resultados
+        models: Modelos a incluir, el primero es la referencia
+
+    Returns:
+        Informe por modelo
+    """
+    by_model: Dict[str, Dict[str, Dict]] = {model: {} for model in models}
+    for result in iter_results(results_file):
+        if result["model"] in by_model:
+            # El último resultado de cada par sustituye a los anteriores
+            by_model[result["model"]][result["id"]] = result
+
+    baseline = by_model[models[0]] if models else {}
+    report = {"results_file": results_file, "models": {}}
+    for model, results in by_model.items():
+        ok = [result for result in results.values() if "error" not in result]
+        shared = [
+            (result["f1"], baseline[item_id]["f1"]) for item_id, result in results.items()
+            if "error" not in result and "error" not in baseline.get(item_id, {"error": True})
+        ]
+        report["models"][model] = {
+            "cases": len(results),
+            "errors": len(results) - len(ok),
+            "error_rate": (len(results) - len(ok)) / len(results) if results else 0.0,
+            "f1": _mean([result["f1"] for result in ok]),
+            "quality": _mean([result["quality"] for result in ok]),
+            "length_ratio": summarize([result["length_ratio"] for result in ok]),
+            "response_tokens": _mean([result["response_tokens"] for result in ok]),
+            "ttft_seconds": summarize([result["ttft"] for result in ok]),
+            "latency_seconds": summarize([result["latency"] for result in ok]),
+            "retried": sum(1 for result in results.values() if result.get("attempts", 1) > 1),
+            "wins_vs_first": sum(1 for mine, base in shared if mine > base) / len(shared) if shared and model != models[0] else None,
+        }
+    return report
+
+def format_report(report: Dict) -> str:
+    """
+    Formatea el informe de evaluación como texto
+    """
+    def number(value, pattern="{:.3f}"):
+        return pattern.format(value) if value is not None else "-"
+
+    lines = [f"{'Modelo':<45} {'casos':>6} {'errores':>8} {'F1':>6} {'calidad':>8} {'long. p50':>10} {'latencia p50/p90 (ms)':>22} {'gana':>6}"]
+    for model, stats in report["models"].items():
+        latency = stats["latency_seconds"]
+        lines.append(
+            f"{model[-45:]:<45} {stats['cases']:>6} {stats['error_rate']:>7.1%} "
+            f"{number(stats['f1']):>6} {number(stats['quality']):>8} "
+            f"{number(stats['length_ratio']['p50'], '{:.2f}x'):>10} "
+            f"{number(latency['p50'] and latency['p50'] * 1000, '{:.0f}') + '/' + number(latency['p90'] and latency['p90'] * 1000, '{:.0f}'):>22} "
+            f"{number(stats['wins_vs_first'], '{:.0%}'):>6}"
+        )
+    return "\n".join(lines)
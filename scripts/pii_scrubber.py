@@ -0,0 +1,482 @@
+"""
+Eliminación de datos personales (PII) de los ejemplos de entrenamiento
+
+Sustituye lo que los estudiantes escriben en las conversaciones por marcadores
+deterministas: el mismo valor produce siempre el mismo marcador (hash BLAKE2b
+con clave del valor normalizado), así que las repeticiones dentro de una
+conversación y entre conversaciones se conservan sin guardar el dato.
+
+- EMAIL: direcciones de correo.
+- PHONE: números de 9 a 15 dígitos con formato de teléfono (prefijo +,
+  código de área entre paréntesis o grupos separados por guiones), o sin
+  formato si van precedidos de una palabra como "teléfono" o "móvil".
+- CARD: números de 13 a 19 dígitos que cumplen el algoritmo de Luhn.
+- ID: documentos de identidad (DNI, NIE, CURP, RFC, CPF).
+- IP: direcciones IPv4 (octetos de 0 a 255 sin ceros a la izquierda).
+- NAME: nombres presentados por el usuario ("me llamo…", "soy…", "my name
+  is…"); el nombre se sustituye también en el resto de la conversación.
+
+Los números con punto o coma decimal y los separadores de miles no son
+datos personales: en las tutorías de matemáticas son respuestas, no
+teléfonos. Tampoco lo son las palabras comunes tras "soy" o "I am"
+("soy Estudiante", "I am Learning"), que se descartan con NAME_STOPWORDS.
+
+Los patrones se compilan una vez en dos alternancias. La de datos empieza
+siempre en un carácter disparador (@, dígito, + o paréntesis), así que el
+motor de expresiones regulares salta el resto del texto sin probar cada
+alternativa en cada posición; las partes a la izquierda del disparador (el
+usuario del correo, las letras de un NIE o un CURP) se añaden después. La de
+nombres empieza en las palabras que los presentan. Cada lote se une en un solo
+texto y se marcan con operaciones de bytes los mensajes que contienen algún
+disparador: solo esos pasan por las expresiones regulares. Los lotes se
+procesan en un pool de procesos (o en el mismo proceso con un solo worker)
+sin cambiar su orden.
+"""
+
+import os
+import re
+from bisect import bisect_right
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+PII_CATEGORIES = ("EMAIL", "PHONE", "CARD", "ID", "IP", "NAME")
+
+# Letras de los nombres propios
+_UPPER = "A-ZÁÉÍÓÚÑÜ"
+_LOWER = "a-záéíóúñü"
+
+# Datos anclados en un carácter disparador. El orden importa: en cada
+# posición gana la primera alternativa que coincide
+_DATA_RE = re.compile(
+    r"[@0-9+(]"
+    r"(?:(?<=@)(?P<EMAIL>[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)+)"
+    r"|(?<=[0-9])(?:"
+    r"(?<=[0-9])(?P<IP>[0-9]{0,2}(?:\.[0-9]{1,3}){3})(?![0-9]|\.[0-9])"
+    r"|(?P<CPF>[0-9]{2}\.[0-9]{3}\.[0-9]{3}-[0-9]{2})(?![0-9])"
+    r"|(?<=[A-Z]{4}[0-9])(?P<CURP>[0-9]{5}[HM][A-Z]{5}[A-Z0-9][0-9])"
+    r"|(?<=[A-ZÑ&]{3}[0-9])(?P<RFC>[0-9]{5}[A-Z0-9]{3})(?![0-9A-Za-z])"
+    r"|(?<=[XYZ][0-9])(?P<NIE>[0-9]{6}[A-Z])(?![0-9A-Za-z])"
+    r"|(?P<DNI>[0-9]{7}[A-Z])(?![0-9A-Za-z])"
+    r")"
+    r"|(?<=[0-9+(])(?P<NUMBER>[0-9 ().-]{6,22}[0-9]))"
+)
+
+# Prefijo de letras que pertenece a cada documento (a la izquierda del disparador)
+_ID_PREFIX = {"CPF": 0, "DNI": 0, "NIE": 1, "CURP": 4, "RFC": 3}
+
+# Usuario de un correo, justo antes de la @
+_EMAIL_USER_RE = re.compile(r"[\w.+-]{1,64}$")
+
+# Palabras que indican que el número siguiente es un teléfono
+_PHONE_CONTEXT_RE = re.compile(
+    r"\b(?:tel[eé]fono|tel|m[oó]vil|celular|cel|whatsapp|ll[aá]ma(?:me|nos)|llamar(?:me|nos)?|phone|mobile|cell|call me|text me)\b",
+    re.IGNORECASE
+)
+_PHONE_CONTEXT_CHARS = 40
+
+# Palabras con las que el usuario presenta su nombre, y la alternancia de nombres
+NAME_CUES = ("llamo", "nombre es", "soy", "Soy", "name is", "I am", "I'm", "i am", "i'm")
+# (El límite de palabra a la izquierda se comprueba al sustituir: un \b
+# inicial impide que el motor busque directamente el texto de las palabras)
+_NAME_RE = re.compile(
+    "(?:" + "|".join(re.escape(cue) for cue in NAME_CUES) + ")"
+    rf"[ ]+(?P<NAME>[{_UPPER}][{_LOWER}]+(?:[ ][{_UPPER}][{_LOWER}]+){{0,2}})\b"
+)
+
+# Palabras que se escriben con mayúscula tras "soy" o "I am" y no son nombres:
+# ocupaciones, gentilicios y estados
+NAME_STOPWORDS = frozenset("""
+    estudiante alumno alumna profesor profesora maestro maestra docente tutor tutora
+    principiante nuevo nueva padre madre mamá papá ingeniero ingeniera médico médica
+    doctor doctora abogado abogada programador programadora desarrollador desarrolladora
+    colombiano colombiana mexicano mexicana español española argentino argentina
+    peruano peruana chileno chilena venezolano venezolana ecuatoriano ecuatoriana
+    boliviano boliviana uruguayo uruguaya paraguayo paraguaya cubano cubana
+    dominicano dominicana guatemalteco guatemalteca hondureño hondureña
+    salvadoreño salvadoreña nicaragüense costarricense panameño panameña
+    puertorriqueño puertorriqueña brasileño brasileña estadounidense americano americana
+    latino latina europeo europea
+    student teacher tutor beginner parent engineer developer doctor
+    learning studying trying working looking going taking having doing getting
+    preparing reading writing new here ready happy glad sorry confused interested
+    american mexican spanish colombian argentinian argentine peruvian chilean
+    venezuelan cuban brazilian canadian english british french german italian latino
+""".split())
+
+# Mensajes con algún disparador: dígitos, @, + y ( se marcan con \x01 (un
+# \x01 original pasa a \x02) y el separador de mensajes es \x00
+_SEPARATOR = "\x00"
+_TRIGGERS = bytes.maketrans(b"0123456789@+(\x01", b"\x01" * 13 + b"\x02")
+
+def luhn_valid(digits: str) -> bool:
+    """
+    Comprueba el dígito de control de Luhn de un número de tarjeta
+    """
+    total = 0
+    for i, char in enumerate(reversed(digits)):
+        n = ord(char) - 48
+        if i % 2:
+            n *= 2
+            if n > 9:
+                n -= 9
+        total += n
+    return total % 10 == 0
+
+def placeholder(category: str, value: str, salt: str = "") -> str:
+    """
+    Marcador determinista de un valor
+
+    Args:
+        category: Categoría del dato (PII_CATEGORIES)
+        value: Valor normalizado
+        salt: Clave del hash (la misma clave da los mismos marcadores)
+
+    Returns:
+        Marcador "[CATEGORÍA_xxxxxxxx]"
+    """
+    digest = blake2b(value.encode("utf-8"), digest_size=4, key=salt.encode("utf-8")[:64], person=category.encode("ascii")[:16])
+    return f"[{category}_{digest.hexdigest()}]"
+
+def _classify(match: re.Match, text: str, last: int) -> Optional[Tuple[str, int, str]]:
+    """
+    Categoría, inicio real y valor normalizado de una coincidencia de _DATA_RE
+
+    Devuelve None si la coincidencia no es un dato personal (por ejemplo, un
+    número corto o parte de una palabra).
+    """
+    kind = match.lastgroup
+    start = match.start()
+    if kind == "EMAIL":
+        user = _EMAIL_USER_RE.search(text, max(last, start - 64), start)
+        if user is None:
+            return None
+        return "EMAIL", user.start(), text[user.start():match.end()].lower()
+
+    if kind in _ID_PREFIX:
+        start -= _ID_PREFIX[kind]
+        if kind == "RFC" and start > 0 and text[start - 1] in "ABCDEFGHIJKLMNÑOPQRSTUVWXYZ&":
+            start -= 1
+        if start < last or (start > 0 and text[start - 1].isalnum()):
+            return None
+        return "ID", start, text[start:match.end()]
+
+    if start > 0 and (text[start - 1].isalnum() or text[start - 1] in ".,"):
+        return None
+    value = match.group(0)
+    if kind == "IP":
+        parts = value.split(".")
+        if all(int(part) <= 255 and (part == "0" or part[0] != "0") for part in parts):
+            return "IP", start, value
+        return None
+
+    # Con punto (decimales, miles) no es una tarjeta ni un teléfono, salvo con prefijo +
+    if value[0] != "+" and "." in value:
+        return None
+    end = match.end()
+    if end < len(text) and text[end] in ".," and text[end + 1:end + 2].isdigit():
+        return None
+    digits = "".join(char for char in value if char.isdigit())
+    if 13 <= len(digits) <= 19 and luhn_valid(digits):
+        return "CARD", start, digits
+    if not 9 <= len(digits) <= 15:
+        return None
+    if (
+        value[0] == "+"
+        or re.match(r"\([0-9]{1,4}\)", value)
+        or ("-" in value and "(" not in value)
+        or _PHONE_CONTEXT_RE.search(text, max(0, start - _PHONE_CONTEXT_CHARS), start)
+    ):
+        return "PHONE", start, digits
+    return None
+
+def scrub_text(
+    text: str,
+    counts: Counter,
+    names: Set[str],
+    categories: Sequence[str] = PII_CATEGORIES,
+    salt: str = "",
+    user: bool = True
+) -> str:
+    """
+    Sustituye los datos personales de un texto
+
+    Args:
+        text: Texto del mensaje
+        counts: Contador de sustituciones por categoría (se actualiza)
+        names: Nombres encontrados (se actualiza)
+        categories: Categorías a sustituir
+        salt: Clave de los marcadores
+        user: Buscar también nombres presentados (solo en mensajes del usuario)
+
+    Returns:
+        Texto sin los datos personales
+
+    Los números de las respuestas de matemáticas y las palabras comunes tras
+    "soy" no se sustituyen:
+
+    >>> scrub_text("pi vale 3.14159265 y 10^9 = 1.000.000.000", Counter(), set())
+    'pi vale 3.14159265 y 10^9 = 1.000.000.000'
+    >>> scrub_text("El resultado es 123456789", Counter(), set())
+    'El resultado es 123456789'
+    >>> scrub_text("Soy Estudiante y soy Colombiano. I am Learning", Counter(), set())
+    'Soy Estudiante y soy Colombiano. I am Learning'
+    >>> scrub_text("Mi teléfono es 612345678", Counter(), set())  # doctest: +ELLIPSIS
+    'Mi teléfono es [PHONE_...]'
+    >>> scrub_text("Escríbeme al +34 612 345 678 o a 192.168.1.20", Counter(), set())  # doctest: +ELLIPSIS
+    'Escríbeme al [PHONE_...] o a [IP_...]'
+    >>> scrub_text("Hola, me llamo Ana López", Counter(), set())  # doctest: +ELLIPSIS
+    'Hola, me llamo [NAME_...]'
+    """
+    pieces = []
+    last = 0
+    for match in _DATA_RE.finditer(text):
+        found = _classify(match, text, last)
+        if found is None or found[0] not in categories:
+            continue
+        kind, start, value = found
+        pieces.append(text[last:start])
+        pieces.append(placeholder(kind, value, salt))
+        counts[kind] += 1
+        last = match.end()
+    if pieces:
+        pieces.append(text[last:])
+        text = "".join(pieces)
+
+    if user and "NAME" in categories:
+        def replace_name(match: re.Match) -> str:
+            if match.start() > 0 and match.string[match.start() - 1].isalnum():
+                return match.group(0)
+            words = match.group("NAME").split(" ")
+            # "Soy Ana Colombiana": el nombre termina en la primera palabra común
+            kept = next((i for i, word in enumerate(words) if word.lower() in NAME_STOPWORDS), len(words))
+            if not kept:
+                return match.group(0)
+            name = " ".join(words[:kept])
+            suffix = match.group("NAME")[len(name):]
+            names.add(name)
+            counts["NAME"] += 1
+            return match.group(0)[:match.start("NAME") - match.start()] + placeholder("NAME", name, salt) + suffix
+        text = _NAME_RE.sub(replace_name, text)
+    return text
+
+def _flag_triggers(texts: List[str], flagged: Set[int]):
+    """
+    Marca los mensajes que contienen dígitos, @, + o paréntesis
+    """
+    # En latin-1 cada carácter ocupa un byte (los que no caben pasan a "?"),
+    # y la codificación es una copia directa para el texto en español
+    joined = _SEPARATOR.join(texts).encode("latin-1", "replace").translate(_TRIGGERS)
+    separator = _SEPARATOR.encode("ascii")
+    position = 0
+    index = 0
+    counted = 0
+    while True:
+        hit = joined.find(b"\x01", position)
+        if hit < 0:
+            return
+        index += joined.count(separator, counted, hit)
+        flagged.add(index)
+        end = joined.find(separator, hit)
+        if end < 0:
+            return
+        counted = position = end
+
+def _flag_name_cues(texts: List[str], indices: List[int], flagged: Set[int]):
+    """
+    Marca los mensajes (de los indicados) que contienen una palabra de presentación
+    """
+    joined = _SEPARATOR.join(texts[i] for i in indices)
+    hits = []
+    for cue in NAME_CUES:
+        hit = joined.find(cue)
+        while hit >= 0:
+            hits.append(hit)
+            hit = joined.find(cue, hit + len(cue))
+    index = 0
+    counted = 0
+    for hit in sorted(hits):
+        index += joined.count(_SEPARATOR, counted, hit)
+        counted = hit
+        flagged.add(indices[index])
+
+def scrub_batch(
+    batch: List[List[Dict]],
+    categories: Sequence[str] = PII_CATEGORIES,
+    salt: str = ""
+) -> Tuple[List[Optional[List[str]]], Dict[str, int]]:
+    """
+    Elimina los datos personales de un lote de ejemplos (se ejecuta en un proceso hijo)
+
+    Args:
+        batch: Mensajes (role/content) de cada ejemplo
+        categories: Categorías a sustituir
+        salt: Clave de los marcadores
+
+    Returns:
+        Contenidos nuevos de cada ejemplo (None si no cambia) y sustituciones por categoría
+    """
+    # Sin bucles de Python por mensaje: solo los mensajes marcados se tratan uno a uno
+    texts = [message["content"] for messages in batch for message in messages]
+    roles = [message.get("role", "user") for messages in batch for message in messages]
+    user_indices = [index for index, role in enumerate(roles) if role == "user"]
+    ends = list(accumulate(len(messages) for messages in batch))
+
+    flagged: Set[int] = set()
+    _flag_triggers(texts, flagged)
+    if "NAME" in categories and user_indices:
+        _flag_name_cues(texts, user_indices, flagged)
+
+    counts: Counter = Counter()
+    scrubbed: List[Optional[List[str]]] = [None] * len(batch)
+    names_by_example: Dict[int, Set[str]] = {}
+    for index in sorted(flagged):
+        names: Set[str] = set()
+        text = scrub_text(texts[index], counts, names, categories, salt, roles[index] == "user")
+        position = bisect_right(ends, index)
+        if text != texts[index]:
+            if scrubbed[position] is None:
+                scrubbed[position] = texts[ends[position] - len(batch[position]):ends[position]]
+            scrubbed[position][index - ends[position] + len(batch[position])] = text
+        if names:
+            known = names_by_example.setdefault(position, set())
+            known.update(names)
+            # También el nombre de pila solo ("Hola, Ana")
+            known.update(name.split()[0] for name in names if " " in name)
+
+    # Un nombre presentado se sustituye en todos los mensajes del ejemplo
+    # (por ejemplo, cuando el asistente saluda al estudiante por su nombre)
+    for position, names in names_by_example.items():
+        contents = scrubbed[position]
+        for name in sorted(names, key=len, reverse=True):
+            pattern = re.compile(rf"(?<![\w\[]){re.escape(name)}(?!\w)")
+            marker = placeholder("NAME", name, salt)
+            for i, content in enumerate(contents):
+                if name in content:
+                    contents[i], replaced = pattern.subn(marker, content)
+                    counts["NAME"] += replaced
+    return scrubbed, dict(counts)
+
+class PIIScrubber:
+    """
+    Elimina los datos personales de los ejemplos
+
+    Con más de un worker los lotes se procesan en un pool de procesos que se
+    crea la primera vez que se usa y se reutiliza entre llamadas. Como mucho
+    hay 2 lotes por worker en curso, así que la memoria está acotada.
+    """
+
+    def __init__(
+        self,
+        categories: Sequence[str] = PII_CATEGORIES,
+        salt: str = "",
+        workers: Optional[int] = None,
+        batch_size: int = 512
+    ):
+        """
+        Args:
+            categories: Categorías a sustituir (PII_CATEGORIES)
+            salt: Clave de los marcadores (guárdala en secreto: sin ella no se
+                pueden comprobar valores conocidos contra los marcadores)
+            workers: Número de procesos (None = uno por CPU, 1 = en este proceso)
+            batch_size: Ejemplos por lote enviado a un proceso
+        """
+        unknown = set(categories) - set(PII_CATEGORIES)
+        if unknown:
+            raise ValueError(f"Categorías desconocidas: {', '.join(sorted(unknown))}")
+        self.categories = tuple(categories)
+        self.salt = salt
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self._executor = None
+
+        self.seen = 0
+        self.changed = 0
+        self.counts: Counter = Counter()
+
+    def _scrubbed_batches(self, examples: Iterable[Dict]) -> Iterator[tuple]:
+        """
+        Devuelve (lote, resultado de scrub_batch) en el orden de entrada
+        """
+        batch = []
+        if self.workers <= 1:
+            for example in examples:
+                batch.append(example)
+                if len(batch) >= self.batch_size:
+                    yield batch, scrub_batch([e["messages"] for e in batch], self.categories, self.salt)
+                    batch = []
+            if batch:
+                yield batch, scrub_batch([e["messages"] for e in batch], self.categories, self.salt)
+            return
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        pending = deque()
+        for example in examples:
+            batch.append(example)
+            if len(batch) >= self.batch_size:
+                pending.append((batch, self._executor.submit(scrub_batch, [e["messages"] for e in batch], self.categories, self.salt)))
+                batch = []
+                if len(pending) >= 2 * self.workers:
+                    done, future = pending.popleft()
+                    yield done, future.result()
+        if batch:
+            pending.append((batch, self._executor.submit(scrub_batch, [e["messages"] for e in batch], self.categories, self.salt)))
+        while pending:
+            done, future = pending.popleft()
+            yield done, future.result()
+
+    def scrub(self, examples: Iterable[Dict]) -> Iterator[Dict]:
+        """
+        Sustituye los datos personales de los ejemplos
+
+        Args:
+            examples: Iterable de ejemplos
+
+        Returns:
+            Iterador de ejemplos sin datos personales, en el mismo orden
+        """
+        for batch, (scrubbed, counts) in self._scrubbed_batches(examples):
+            self.seen += len(batch)
+            self.counts.update(counts)
+            for example, contents in zip(batch, scrubbed):
+                if contents is None:
+                    yield example
+                    continue
+                self.changed += 1
+                example = dict(example)
+                example["messages"] = [
+                    dict(message, content=content)
+                    for message, content in zip(example["messages"], contents)
+                ]
+                yield example
+
+    def close(self):
+        """
+        Cierra el pool de procesos
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def summary(self) -> str:
+        """
+        Resumen de las sustituciones
+        """
+        details = ", ".join(f"{category} {self.counts[category]}" for category in PII_CATEGORIES if category in self.categories)
+        return f"Datos personales: {self.changed} de {self.seen} ejemplos modificados ({details})"
+
+def scrub_pii(examples: Iterable[Dict], scrubber: PIIScrubber) -> Iterator[Dict]:
+    """
+    Sustituye los datos personales de los ejemplos por marcadores deterministas
+
+    Args:
+        examples: Iterable de ejemplos
+        scrubber: Estado de la sustitución (conserva los contadores y el pool)
+
+    Returns:
+        Iterador de ejemplos sin datos personales
+    """
+    return scrubber.scrub(examples)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Script para estimar el tamaño y el coste de un conjunto de datos de entrenamiento
+Este script recorre un archivo JSONL y calcula los tokens por mensaje y por ejemplo antes de lanzar el ajuste fino.
+
+Prerrequisitos:
+1. Tener instalado NumPy (pip install numpy)
+
+Uso:
+python profile-training-data.py --data-file=training_data.jsonl --epochs=3
+"""
+
+import argparse
+import json
+import time
+
+from jsonl_codec import set_default_codec
+
+# Configuración de argumentos
+parser = argparse.ArgumentParser(description="Perfil de tokens de un conjunto de datos de entrenamiento")
+parser.add_argument("--data-file", type=str, default="training_data.jsonl", help="Archivo JSONL de entrenamiento (puede estar comprimido)")
+parser.add_argument("--epochs", type=int, default=3, help="Número de épocas del ajuste fino")
+parser.add_argument("--batch-size", type=int, default=10000, help="Ejemplos procesados por lote")
+parser.add_argument("--max-tokens", type=int, default=32768, help="Límite de tokens por ejemplo del modelo")
+parser.add_argument("--top", type=int, default=10, help="Número de ejemplos más largos a mostrar")
+parser.add_argument("--price-per-million", type=float, default=None, help="Precio por millón de tokens de entrenamiento (para estimar el coste)")
+parser.add_argument("--json-output", type=str, default=None, help="Guardar el resumen en un archivo JSON")
+parser.add_argument("--codec", type=str, default="auto", choices=["auto", "orjson", "msgspec", "json"], help="Serializador JSON (auto = el más rápido instalado)")
+
+def main():
+    args = parser.parse_args()
+    set_default_codec(args.codec)
+    # NumPy se importa después de leer los argumentos (--help no lo necesita)
+    from token_profile import format_report, profile_jsonl
+    
+    print(f"Analizando {args.data_file}...")
+    start = time.perf_counter()
+    profile = profile_jsonl(args.data_file, args.batch_size, args.top, args.max_tokens)
+    elapsed = time.perf_counter() - start
+    
+    summary = profile.to_dict(args.epochs, args.price_per_million)
+    print(format_report(summary))
+    print(f"\nAnálisis completado en {elapsed:.1f}s ({profile.examples / elapsed if elapsed else 0:,.0f} ejemplos/s)")
+    
+    if args.json_output:
+        with open(args.json_output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"Resumen guardado en {args.json_output}")
+
+if __name__ == "__main__":
+    main()
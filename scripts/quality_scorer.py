@@ -0,0 +1,334 @@
+"""
+Puntuación local de la calidad de las conversaciones
+
+Calcula una puntuación entre 0 y 1 para cada ejemplo a partir de heurísticas
+baratas, sin depender del campo `quality` de Firestore:
+
+- Turnos vacíos: proporción de mensajes sin texto.
+- Equilibrio de turnos: preguntas frente a respuestas y alternancia de roles.
+- Longitud de las respuestas: respuestas del asistente frente a preguntas.
+- Idioma: palabras funcionales del idioma detectado y proporción de letras.
+- Repetición: respuestas repetidas y 3-gramas de palabras repetidos.
+
+La puntuación es la media geométrica ponderada de los componentes
+(QUALITY_WEIGHTS): un solo componente muy bajo (respuestas vacías, texto
+ilegible) basta para descartar la conversación, y vale 0 si no tiene
+pregunta o respuesta. Los ejemplos se
+puntúan por lotes en un pool de procesos (o en el mismo proceso con un solo
+worker) sin cambiar su orden.
+"""
+
+import math
+import os
+import re
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from training_pipeline import ASSISTANT_ROLES
+
+# Idiomas aceptados por defecto (la plataforma atiende en español e inglés)
+DEFAULT_LANGUAGES = ("es", "en")
+
+# Palabras funcionales frecuentes de cada idioma detectable
+STOPWORDS = {
+    "es": "el la los las de del que y en un una es por con para no se su al lo como más pero sus le ya o este sí porque esta entre cuando muy sin sobre también me hasta hay donde quien desde todo nos durante todos uno les ni contra otros ese eso ante ellos e esto mí antes algunos qué unos yo otro otras otra él tanto esa estos mucho quienes nada muchos cual poco ella estar estas algunas algo nosotros mi mis tú te ti tu tus puedo puedes cómo",
+    "en": "the be to of and a in that have i it for not on with he as you do at this but his by from they we say her she or an will my one all would there their what so up out if about who get which go me when make can like time no just him know take people into year your good some could them see other than then now look only come its over think also back after use two how our work first well way even new want because any these give day most us is are was were",
+    "pt": "o a os as de do da dos das que e em um uma é por com para não se seu sua ao no na nos nas como mais mas foi ele ela isso este esta você eu também já muito sem sobre quando até onde há",
+    "fr": "le la les de des du que et en un une est pour dans pas ne se son sa au aux ce qui sur avec plus mais il elle je vous nous on ou comme tout sont été très sans aussi cette ces",
+    "it": "il lo la gli le di del della che e è un una per con non si suo sua al nel come più ma questo questa anche sono molto senza sulla quando",
+}
+
+# Idiomas en los que aparece cada palabra funcional
+_WORD_LANGUAGES: Dict[str, tuple] = {}
+for _language, _words in STOPWORDS.items():
+    for _word in _words.split():
+        _WORD_LANGUAGES[_word] = _WORD_LANGUAGES.get(_word, ()) + (_language,)
+
+# Peso de cada componente en la puntuación final
+QUALITY_WEIGHTS = {
+    "empty_turns": 0.15,
+    "turn_balance": 0.2,
+    "answer_length": 0.25,
+    "language": 0.2,
+    "repetition": 0.2,
+}
+
+# Respuesta media mínima (caracteres) y proporción respuesta/pregunta esperada
+MIN_ANSWER_CHARS = 20
+ANSWER_RATIO_TARGET = 1.0
+
+# Palabras funcionales necesarias para decidir el idioma, y palabras a partir
+# de las cuales un texto sin palabras funcionales conocidas se considera de
+# otro idioma
+MIN_LANGUAGE_HITS = 3
+MIN_LANGUAGE_WORDS = 10
+# Proporción mínima de letras entre los caracteres que no son espacios
+MIN_LETTER_RATIO = 0.6
+# Proporción mínima de 3-gramas de palabras distintos (el texto natural casi
+# no repite 3-gramas; las respuestas en bucle sí)
+MIN_UNIQUE_TRIGRAM_RATIO = 0.5
+
+# Palabras formadas solo por letras (sin dígitos ni guiones bajos)
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+def detect_language(word_counts: Dict[str, int]) -> Optional[str]:
+    """
+    Detecta el idioma de un texto por sus palabras funcionales
+
+    Args:
+        word_counts: Número de apariciones de cada palabra (en minúsculas)
+
+    Returns:
+        Código del idioma, o None si no hay suficientes indicios
+    """
+    hits: Dict[str, int] = {}
+    total = 0
+    for word, count in word_counts.items():
+        languages = _WORD_LANGUAGES.get(word)
+        if languages:
+            total += count
+            for language in languages:
+                hits[language] = hits.get(language, 0) + count
+    if total < MIN_LANGUAGE_HITS:
+        return None
+    return max(hits, key=hits.get)
+
+def quality_components(messages: List[Dict], languages: Sequence[str] = DEFAULT_LANGUAGES) -> Dict[str, float]:
+    """
+    Calcula cada componente de la puntuación de calidad
+
+    Args:
+        messages: Mensajes del ejemplo (role/content)
+        languages: Idiomas aceptados
+
+    Returns:
+        Diccionario componente → valor entre 0 y 1
+    """
+    user_chars = 0
+    assistant_chars = 0
+    user_turns = 0
+    assistant_turns = 0
+    empty = 0
+    switches = 0
+    previous = None
+    answers = set()
+    for message in messages:
+        content = message.get("content") or ""
+        is_assistant = message.get("role", "user") in ASSISTANT_ROLES
+        if not content.strip():
+            empty += 1
+        if is_assistant:
+            assistant_turns += 1
+            assistant_chars += len(content)
+            answers.add(content)
+        else:
+            user_turns += 1
+            user_chars += len(content)
+        if previous is not None and previous != is_assistant:
+            switches += 1
+        previous = is_assistant
+
+    if not user_turns or not assistant_turns:
+        return {name: 0.0 for name in QUALITY_WEIGHTS}
+
+    n = len(messages)
+    balance = min(user_turns, assistant_turns) / max(user_turns, assistant_turns)
+    alternation = switches / (n - 1)
+
+    average_answer = assistant_chars / assistant_turns
+    average_question = max(user_chars / user_turns, 1)
+    answer_length = min(1.0, average_answer / average_question / ANSWER_RATIO_TARGET)
+    answer_length *= min(1.0, average_answer / MIN_ANSWER_CHARS)
+
+    text = " ".join(message.get("content") or "" for message in messages).lower()
+    words = _WORD_RE.findall(text)
+    word_counts = Counter(words)
+    visible = sum(map(len, text.split()))
+    letter_ratio = sum(map(len, words)) / visible if visible else 0.0
+    detected = detect_language(word_counts)
+    if detected is None:
+        language = 0.5 if len(words) < MIN_LANGUAGE_WORDS else 0.1
+    else:
+        language = 1.0 if detected in languages else 0.0
+    language *= min(1.0, letter_ratio / MIN_LETTER_RATIO)
+
+    repetition = len(answers) / assistant_turns
+    if len(words) >= 3:
+        trigrams = len(set(zip(words, words[1:], words[2:])))
+        repetition *= min(1.0, trigrams / (len(words) - 2) / MIN_UNIQUE_TRIGRAM_RATIO)
+
+    return {
+        "empty_turns": 1 - empty / n,
+        "turn_balance": (balance + alternation) / 2,
+        "answer_length": answer_length,
+        "language": language,
+        "repetition": repetition,
+    }
+
+def score_messages(messages: List[Dict], languages: Sequence[str] = DEFAULT_LANGUAGES) -> float:
+    """
+    Puntuación de calidad de un ejemplo
+
+    Args:
+        messages: Mensajes del ejemplo (role/content)
+        languages: Idiomas aceptados
+
+    Returns:
+        Puntuación entre 0 y 1
+    """
+    components = quality_components(messages, languages)
+    if min(components.values()) <= 0:
+        return 0.0
+    return math.exp(sum(QUALITY_WEIGHTS[name] * math.log(value) for name, value in components.items()))
+
+def score_batch(batch: List[List[Dict]], languages: Sequence[str] = DEFAULT_LANGUAGES) -> List[float]:
+    """
+    Puntúa un lote de ejemplos (se ejecuta en un proceso hijo)
+
+    Args:
+        batch: Mensajes de cada ejemplo
+        languages: Idiomas aceptados
+
+    Returns:
+        Puntuación de cada ejemplo
+    """
+    return [score_messages(messages, languages) for messages in batch]
+
+class QualityScorer:
+    """
+    Filtra ejemplos por su puntuación de calidad local
+
+    Con más de un worker los lotes se puntúan en un pool de procesos que se
+    crea la primera vez que se usa y se reutiliza entre llamadas (por
+    ejemplo, entre páginas de la exportación). Como mucho hay 2 lotes por
+    worker en curso, así que la memoria está acotada. Cuando los ejemplos
+    llegan por páginas (`page_size`), los lotes se reducen para que cada
+    página se reparta entre todos los procesos.
+    """
+
+    def __init__(
+        self,
+        min_score: float,
+        workers: Optional[int] = None,
+        batch_size: int = 256,
+        languages: Sequence[str] = DEFAULT_LANGUAGES,
+        page_size: Optional[int] = None
+    ):
+        """
+        Args:
+            min_score: Puntuación mínima para conservar un ejemplo (0-1)
+            workers: Número de procesos (None = uno por CPU, 1 = en este proceso)
+            batch_size: Ejemplos por lote enviado a un proceso (máximo)
+            languages: Idiomas aceptados
+            page_size: Ejemplos que se filtran en cada llamada (None = flujo continuo)
+        """
+        self.min_score = min_score
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        if page_size:
+            self.batch_size = max(1, min(batch_size, -(-page_size // self.workers)))
+        self.languages = tuple(languages)
+        self._executor = None
+
+        self.seen = 0
+        self.rejected = 0
+        self.score_sum = 0.0
+
+    def _scored_batches(self, examples: Iterable[Dict]) -> Iterator[tuple]:
+        """
+        Devuelve (lote, puntuaciones) en el orden de entrada
+        """
+        batch = []
+        if self.workers <= 1:
+            for example in examples:
+                batch.append(example)
+                if len(batch) >= self.batch_size:
+                    yield batch, score_batch([e["messages"] for e in batch], self.languages)
+                    batch = []
+            if batch:
+                yield batch, score_batch([e["messages"] for e in batch], self.languages)
+            return
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        pending = deque()
+        for example in examples:
+            batch.append(example)
+            if len(batch) >= self.batch_size:
+                pending.append((batch, self._executor.submit(score_batch, [e["messages"] for e in batch], self.languages)))
+                batch = []
+                if len(pending) >= 2 * self.workers:
+                    done, future = pending.popleft()
+                    yield done, future.result()
+        if batch:
+            pending.append((batch, self._executor.submit(score_batch, [e["messages"] for e in batch], self.languages)))
+        while pending:
+            done, future = pending.popleft()
+            yield done, future.result()
+
+    def filter(self, examples: Iterable[Dict]) -> Iterator[Dict]:
+        """
+        Conserva los ejemplos con puntuación mayor o igual que min_score
+
+        Args:
+            examples: Iterable de ejemplos
+
+        Returns:
+            Iterador de ejemplos que superan el umbral, en el mismo orden
+        """
+        for batch, scores in self._scored_batches(examples):
+            for example, score in zip(batch, scores):
+                self.seen += 1
+                self.score_sum += score
+                if score >= self.min_score:
+                    yield example
+                else:
+                    self.rejected += 1
+
+    def scores(self, examples: Iterable[Dict]) -> Iterator[float]:
+        """
+        Puntúa los ejemplos sin descartar ninguno (para guardar la puntuación
+        y filtrar más tarde)
+
+        Args:
+            examples: Iterable de ejemplos
+
+        Returns:
+            Iterador con la puntuación de cada ejemplo, en el mismo orden
+        """
+        for batch, scores in self._scored_batches(examples):
+            self.seen += len(scores)
+            self.score_sum += sum(scores)
+            yield from scores
+
+    def close(self):
+        """
+        Cierra el pool de procesos
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def summary(self) -> str:
+        """
+        Resumen de los ejemplos descartados
+        """
+        average = self.score_sum / self.seen if self.seen else 0.0
+        return (
+            f"Calidad: {self.rejected} de {self.seen} ejemplos descartados "
+            f"(puntuación media {average:.2f}, mínimo {self.min_score})"
+        )
+
+def filter_quality(examples: Iterable[Dict], scorer: QualityScorer) -> Iterator[Dict]:
+    """
+    Descarta los ejemplos con puntuación de calidad inferior al mínimo
+
+    Args:
+        examples: Iterable de ejemplos
+        scorer: Estado de la puntuación (conserva los contadores y el pool)
+
+    Returns:
+        Iterador de ejemplos que superan el umbral
+    """
+    return scorer.filter(examples)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Script para filtrar el almacén columnar de conversaciones y generar el JSONL de entrenamiento
+Este script lee el almacén Parquet/Arrow que escribe collect-training-data.py con --format, filtra por calidad, fechas o usuarios y escribe el JSONL final para Vertex AI.
+
+Los filtros solo leen las columnas que necesitan y saltan los grupos de
+filas que no los cumplen, así que contar o resumir las conversaciones de un
+rango de fechas no analiza el texto de los mensajes. La deduplicación y la
+división en ventanas se aplican al escribir el JSONL.
+
+Prerrequisitos:
+1. Tener instalado pyarrow (pip install pyarrow)
+
+Uso:
+python query-conversations.py --store=conversations.parquet --min-quality=0.7 --since=2024-01-01
+python query-conversations.py --store=conversations.parquet --min-quality=0.7 --output=training_data.jsonl --vertex
+"""
+
+import argparse
+import datetime
+import json
+import time
+
+from conversation_store import iter_store_examples, store_summary
+from instrumentation import add_metrics_arguments, metrics
+from jsonl_codec import COMPRESSIONS, compression_for_path, set_default_codec
+from training_pipeline import (
+    MODEL_ROLE,
+    Deduplicator,
+    Windower,
+    deduplicate,
+    normalize_roles,
+    run_pipeline,
+    save_jsonl,
+    strip_metadata,
+    window_examples
+)
+
+# Configuración de argumentos
+parser = argparse.ArgumentParser(description="Filtrar el almacén columnar de conversaciones y generar el JSONL de entrenamiento")
+parser.add_argument("--store", type=str, required=True, help="Directorio del almacén (salida de collect-training-data.py con --format=parquet|arrow)")
+parser.add_argument("--min-quality", type=float, default=None, help="Puntuación mínima de calidad (0-1)")
+parser.add_argument("--since", type=str, default=None, help="Solo conversaciones con endTime desde esta fecha (ISO 8601, UTC si no se indica zona)")
+parser.add_argument("--until", type=str, default=None, help="Solo conversaciones con endTime anterior a esta fecha (ISO 8601)")
+parser.add_argument("--users", type=str, default=None, help="Solo conversaciones de estos userId (separados por comas)")
+parser.add_argument("--output", type=str, default=None, help="Archivo JSONL de salida (sin él solo se muestra el resumen)")
+parser.add_argument("--dedup", type=str, default="near", choices=["none", "exact", "near"], help="Eliminar duplicados exactos y/o casi duplicados al escribir el JSONL")
+parser.add_argument("--dedup-threshold", type=float, default=0.9, help="Similitud de Jaccard a partir de la cual dos conversaciones son casi duplicadas (0-1)")
+parser.add_argument("--dedup-window", type=int, default=200000, help="Número de ejemplos recientes que recuerda la deduplicación")
+parser.add_argument("--max-tokens", type=int, default=None, help="Dividir las conversaciones que superen este número de tokens en ventanas solapadas")
+parser.add_argument("--window-overlap", type=int, default=1, help="Turnos (pregunta y respuesta) que comparten dos ventanas consecutivas")
+parser.add_argument("--vertex", action="store_true", help="Escribir directamente el formato de Vertex AI (rol 'model' en las respuestas)")
+parser.add_argument("--codec", type=str, default="auto", choices=["auto", "orjson", "msgspec", "json"], help="Serializador JSON (auto = el más rápido instalado)")
+parser.add_argument("--compression", type=str, default=None, choices=COMPRESSIONS, help="Compresión del JSONL (por defecto según la extensión: .gz, .zst)")
+add_metrics_arguments(parser)
+
+def parse_date(value):
+    return datetime.datetime.fromisoformat(value) if value else None
+
+def main():
+    args = parser.parse_args()
+    set_default_codec(args.codec)
+
+    metrics().configure("query-conversations", args.metrics_json, args.metrics_prom, args.profile, args.profile_output)
+    success = False
+
+    try:
+        filters = {
+            "min_quality": args.min_quality,
+            "since": parse_date(args.since),
+            "until": parse_date(args.until),
+            "user_ids": [user.strip() for user in args.users.split(",")] if args.users else None,
+        }
+
+        start = time.perf_counter()
+        with metrics().timer("filter"):
+            summary = store_summary(args.store, **filters)
+        print(f"Conversaciones que cumplen los filtros ({time.perf_counter() - start:.2f}s):")
+        print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+        if args.output:
+            stages = []
+            deduplicator = None
+            if args.dedup != "none":
+                deduplicator = Deduplicator(
+                    threshold=args.dedup_threshold,
+                    window=args.dedup_window,
+                    near=args.dedup == "near"
+                )
+                stages.append(lambda examples: deduplicate(examples, deduplicator))
+            windower = Windower(args.max_tokens, args.window_overlap) if args.max_tokens else None
+            if windower is not None:
+                stages.append(lambda examples: window_examples(examples, windower))
+            if args.vertex:
+                stages.append(lambda examples: normalize_roles(examples, MODEL_ROLE))
+                stages.append(strip_metadata)
+
+            print(f"\nGenerando {args.output}...")
+            with metrics().timer("write"):
+                count = save_jsonl(
+                    run_pipeline(iter_store_examples(args.store, **filters), *stages),
+                    args.output,
+                    compression=args.compression or compression_for_path(args.output)
+                )
+            metrics().inc("examples_written", count)
+            print(f"Se guardaron {count} ejemplos en {args.output}")
+            if deduplicator is not None:
+                print(deduplicator.summary())
+            if windower is not None:
+                print(windower.summary())
+        success = True
+    finally:
+        metrics().finish(success)
+
+if __name__ == "__main__":
+    main()
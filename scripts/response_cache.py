@@ -0,0 +1,339 @@
+"""
+Caché persistente en disco (SQLite) de las respuestas de Gemini
+
+Equivalente en Python de lib/gemini-cache.ts: evita repetir peticiones de
+pago idénticas entre ejecuciones de test-gemini.py o eval-model.py.
+
+- Clave: SHA-256 del modelo, los contenidos y la configuración de generación.
+- Expulsión por antigüedad (TTL), por número de entradas y por tamaño total,
+  empezando por las menos usadas recientemente (LRU).
+- Varios hilos y procesos pueden leer y escribir a la vez: cada hilo tiene su
+  propia conexión y la base de datos usa WAL (los lectores no bloquean a los
+  escritores) con espera ante bloqueos.
+- Las respuestas en streaming se guardan fragmento a fragmento y se
+  reproducen igual; solo se guardan los streams que terminan sin error.
+
+Con temperatura > 0 el modelo no es determinista: la caché devuelve siempre
+la primera respuesta obtenida para la misma petición.
+
+Uso:
+    cache = ResponseCache("gemini_cache.sqlite")
+    backend = CachedBackend(create_backend("vertex", project=...), cache)
+    async for text in backend.stream(model, contents, config):
+        ...
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from instrumentation import metrics
+from jsonl_codec import default_codec
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    chunks BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses BEGIN
+    UPDATE totals SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses BEGIN
+    UPDATE totals SET entries = entries - 1, bytes = bytes - OLD.size WHERE id = 0;
+END;
+"""
+
+def cache_key(model: str, contents: List[Dict], config: Optional[Dict] = None) -> str:
+    """
+    Clave de una petición: SHA-256 del modelo, los contenidos y la configuración
+
+    Args:
+        model: Modelo
+        contents: Mensajes {"role", "text"}
+        config: Configuración de generación
+
+    Returns:
+        Clave en hexadecimal
+    """
+    payload = json.dumps(
+        {"model": model, "contents": contents, "config": config or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Caché de respuestas en SQLite con expulsión LRU, TTL y límite de tamaño
+
+    La hora de último acceso se actualiza como mucho una vez cada
+    `touch_interval` segundos por entrada, así que una consulta repetida es
+    solo una lectura (sin escritura en disco).
+    """
+
+    def __init__(
+        self,
+        path: str = "gemini_cache.sqlite",
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+        max_entries: Optional[int] = 100_000,
+        max_bytes: Optional[int] = 512 * 1024 * 1024,
+        touch_interval: float = 60.0
+    ):
+        """
+        Args:
+            path: Archivo de la base de datos
+            ttl_seconds: Antigüedad máxima de una respuesta (None = sin límite)
+            max_entries: Máximo de respuestas guardadas (None = sin límite)
+            max_bytes: Tamaño máximo del texto guardado (None = sin límite)
+            touch_interval: Resolución en segundos de la hora de último acceso
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.codec = default_codec()
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stores = 0
+        self.evicted = 0
+
+        # executescript confirma cualquier transacción abierta, así que el
+        # esquema se crea en su propia transacción dentro del script
+        self._connection().executescript(f"BEGIN IMMEDIATE;{SCHEMA}COMMIT;")
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Conexión del hilo actual (sqlite3 no comparte conexiones entre hilos)
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """
+        Transacción de escritura (BEGIN IMMEDIATE toma el bloqueo al empezar,
+        así dos procesos no chocan a mitad de la transacción)
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """
+        Busca una respuesta
+
+        Args:
+            key: Clave de la petición (cache_key)
+
+        Returns:
+            Fragmentos de la respuesta, o None si no está o ha caducado
+        """
+        row = self._connection().execute(
+            "SELECT chunks, created, accessed FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None:
+            self.misses += 1
+            metrics().inc("cache_misses")
+            return None
+
+        chunks, created, accessed = row
+        if self.ttl_seconds is not None and now - created > self.ttl_seconds:
+            with self._write() as connection:
+                connection.execute("DELETE FROM responses WHERE key = ? AND created = ?", (key, created))
+            self.expired += 1
+            self.misses += 1
+            metrics().inc("cache_misses")
+            return None
+
+        if now - accessed > self.touch_interval:
+            with self._write() as connection:
+                connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        metrics().inc("cache_hits")
+        return self.codec.loads(chunks)
+
+    def put(self, key: str, model: str, chunks: List[str]):
+        """
+        Guarda una respuesta y expulsa entradas si se superan los límites
+
+        Args:
+            key: Clave de la petición (cache_key)
+            model: Modelo (solo informativo)
+            chunks: Fragmentos de la respuesta
+        """
+        blob = self.codec.dumps(chunks)
+        now = time.time()
+        with self._write() as connection:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            connection.execute(
+                "INSERT INTO responses (key, model, chunks, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, blob, len(blob), now, now)
+            )
+            self._evict(connection, now)
+        self.stores += 1
+
+    def _evict(self, connection: sqlite3.Connection, now: float):
+        """
+        Expulsa las entradas caducadas y, si hace falta, las menos usadas
+        (dentro de la transacción de escritura)
+        """
+        entries, size = connection.execute("SELECT entries, bytes FROM totals WHERE id = 0").fetchone()
+        over_entries = self.max_entries is not None and entries > self.max_entries
+        over_bytes = self.max_bytes is not None and size > self.max_bytes
+        if not (over_entries or over_bytes):
+            return
+
+        if self.ttl_seconds is not None:
+            self.evicted += connection.execute(
+                "DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,)
+            ).rowcount
+
+        while True:
+            entries, size = connection.execute("SELECT entries, bytes FROM totals WHERE id = 0").fetchone()
+            excess = entries - self.max_entries if self.max_entries is not None else 0
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Sin saber el tamaño de cada entrada, se expulsa al menos
+                # una décima parte de la caché por vuelta
+                excess = max(excess, 1, entries // 10)
+            if excess <= 0:
+                return
+            self.evicted += connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                (excess,)
+            ).rowcount
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Entradas y bytes guardados
+        """
+        entries, size = self._connection().execute("SELECT entries, bytes FROM totals WHERE id = 0").fetchone()
+        return {"entries": entries, "bytes": size}
+
+    def clear(self):
+        """
+        Vacía la caché
+        """
+        with self._write() as connection:
+            connection.execute("DELETE FROM responses")
+
+    def close(self):
+        """
+        Cierra las conexiones de todos los hilos
+        """
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def summary(self) -> str:
+        """
+        Resumen de la actividad de la caché
+        """
+        lookups = self.hits + self.misses
+        rate = f" ({self.hits / lookups:.0%} aciertos)" if lookups else ""
+        return (
+            f"Caché de respuestas: {self.hits} aciertos, {self.misses} fallos{rate}, "
+            f"{self.stores} guardadas, {self.expired} caducadas, {self.evicted} expulsadas"
+        )
+
+class CachedBackend:
+    """
+    Envuelve un backend de gemini_backends con la caché de respuestas
+
+    Un acierto reproduce los fragmentos guardados sin llamar al modelo; un
+    fallo llama al backend, reenvía los fragmentos según llegan y guarda la
+    respuesta completa al terminar el stream.
+    """
+
+    def __init__(self, backend, cache: ResponseCache):
+        """
+        Args:
+            backend: Backend con el método stream
+            cache: Caché de respuestas
+        """
+        self.backend = backend
+        self.cache = cache
+        self.name = f"{backend.name}+cache"
+
+    async def stream(self, model: str, contents: List[Dict], config: Optional[Dict] = None) -> AsyncIterator[str]:
+        """
+        Devuelve la respuesta de la caché o del backend
+        """
+        key = cache_key(model, contents, config)
+        chunks = self.cache.get(key)
+        if chunks is not None:
+            for text in chunks:
+                yield text
+            return
+
+        recorded = []
+        async for text in self.backend.stream(model, contents, config):
+            recorded.append(text)
+            yield text
+        self.cache.put(key, model, recorded)
+
+def add_cache_arguments(parser):
+    """
+    Añade a un parser de argparse las opciones de la caché de respuestas
+    """
+    parser.add_argument("--cache", type=str, default=None,
+                        help="Archivo SQLite para guardar y reutilizar las respuestas (sin él no se usa caché)")
+    parser.add_argument("--cache-ttl-hours", type=float, default=168.0,
+                        help="Antigüedad máxima de las respuestas de la caché en horas (default: 168)")
+    parser.add_argument("--cache-max-mb", type=float, default=512.0,
+                        help="Tamaño máximo de la caché en MB (default: 512)")
+
+def cache_from_args(backend, args):
+    """
+    Envuelve el backend con la caché si se pidió con --cache
+
+    Returns:
+        (backend, caché o None)
+    """
+    if not args.cache:
+        return backend, None
+    cache = ResponseCache(
+        args.cache,
+        ttl_seconds=args.cache_ttl_hours * 3600 if args.cache_ttl_hours > 0 else None,
+        max_bytes=int(args.cache_max_mb * 1024 * 1024) if args.cache_max_mb > 0 else None,
+    )
+    return CachedBackend(backend, cache), cache
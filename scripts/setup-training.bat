@@ -24,7 +24,7 @@ if %ERRORLEVEL% NEQ 0 (
 
 echo.
 echo Instalando dependencias necesarias...
-pip install google-cloud-aiplatform firebase-admin
+pip install google-cloud-aiplatform firebase-admin numpy
 
 echo.
 echo Por favor, ingresa el ID de tu proyecto de Google Cloud:
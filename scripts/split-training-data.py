@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Script para barajar un conjunto de datos de entrenamiento y separar la validación
+Este script indexa un archivo JSONL (desplazamiento de cada línea, guardado como <archivo>.idx.npy), lo baraja con una semilla y lo divide en entrenamiento y validación por userId, sin cargar los ejemplos en memoria.
+
+El índice también permite ver cualquier ejemplo por su número o una muestra
+aleatoria sin recorrer el archivo.
+
+Prerrequisitos:
+1. Tener instalado NumPy (pip install numpy)
+
+Uso:
+python split-training-data.py --data-file=training_data.jsonl --seed=42 --validation-fraction=0.1
+python split-training-data.py --data-file=training_data.jsonl --show=12345
+python split-training-data.py --data-file=training_data.jsonl --sample=5 --seed=7
+"""
+
+import argparse
+import json
+import os
+import time
+
+from instrumentation import add_metrics_arguments, metrics
+from jsonl_codec import set_default_codec
+from jsonl_index import SHUFFLE_BLOCK_SIZE, JsonlIndex, shuffle_split
+
+# Configuración de argumentos
+parser = argparse.ArgumentParser(description="Barajar un JSONL de entrenamiento y separar la validación por usuario")
+parser.add_argument("--data-file", type=str, default="training_data.jsonl", help="Archivo JSONL de entrenamiento (sin comprimir)")
+parser.add_argument("--seed", type=int, default=42, help="Semilla del barajado (y de --sample)")
+parser.add_argument("--no-shuffle", action="store_true", help="Conservar el orden del archivo (solo dividir)")
+parser.add_argument("--validation-fraction", type=float, default=0.1, help="Proporción de usuarios que van a validación (0-1)")
+parser.add_argument("--train-output", type=str, default=None, help="JSONL de entrenamiento (por defecto <archivo>_train.jsonl)")
+parser.add_argument("--validation-output", type=str, default=None, help="JSONL de validación (por defecto <archivo>_validation.jsonl)")
+parser.add_argument("--block-size", type=int, default=SHUFFLE_BLOCK_SIZE, help="Líneas que se leen juntas al barajar (acota la memoria)")
+parser.add_argument("--show", type=int, default=None, help="Mostrar el ejemplo N (los negativos cuentan desde el final) y salir")
+parser.add_argument("--sample", type=int, default=None, help="Mostrar N ejemplos al azar y salir")
+parser.add_argument("--codec", type=str, default="auto", choices=["auto", "orjson", "msgspec", "json"], help="Serializador JSON (auto = el más rápido instalado)")
+add_metrics_arguments(parser)
+
+def inspect(args) -> bool:
+    """
+    Muestra ejemplos concretos usando el índice
+
+    Returns:
+        True si se pidió --show o --sample
+    """
+    if args.show is None and args.sample is None:
+        return False
+
+    start = time.perf_counter()
+    with metrics().timer("index"):
+        index = JsonlIndex(args.data_file)
+    with index:
+        print(f"{args.data_file}: {len(index)} ejemplos (índice en {time.perf_counter() - start:.2f}s)")
+        if args.show is not None:
+            print(f"\nEjemplo {args.show}:")
+            print(json.dumps(index[args.show], indent=2, ensure_ascii=False))
+        if args.sample is not None:
+            for example in index.sample(args.sample, args.seed):
+                print()
+                print(json.dumps(example, indent=2, ensure_ascii=False))
+    return True
+
+def main():
+    args = parser.parse_args()
+    set_default_codec(args.codec)
+
+    metrics().configure("split-training-data", args.metrics_json, args.metrics_prom, args.profile, args.profile_output)
+    success = False
+
+    try:
+        if inspect(args):
+            success = True
+            return
+
+        stem, _ = os.path.splitext(args.data_file)
+        train_output = args.train_output or f"{stem}_train.jsonl"
+        validation_output = args.validation_output or f"{stem}_validation.jsonl"
+        seed = None if args.no_shuffle else args.seed
+
+        print(f"Dividiendo {args.data_file} (semilla {seed}, {args.validation_fraction:.0%} de los usuarios a validación)...")
+        with metrics().timer("shuffle_split"):
+            result = shuffle_split(
+                args.data_file,
+                train_output,
+                validation_output,
+                seed=seed,
+                validation_fraction=args.validation_fraction,
+                block_size=args.block_size
+            )
+        metrics().inc("train_examples", result["train_examples"])
+        metrics().inc("validation_examples", result["validation_examples"])
+
+        print(f"- Entrenamiento: {result['train_examples']} ejemplos en {train_output}")
+        if args.validation_fraction > 0:
+            print(f"- Validación: {result['validation_examples']} ejemplos en {validation_output}")
+        print(f"Completado en {result['seconds']:.1f}s")
+        success = True
+    finally:
+        metrics().finish(success)
+
+if __name__ == "__main__":
+    main()
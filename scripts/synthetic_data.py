@@ -0,0 +1,208 @@
+"""
+Generador de conversaciones sintéticas para pruebas de rendimiento
+
+Produce conversaciones con la estructura de Firestore (userId, startTime,
+endTime, messages con sender/text/timestamp) y texto en español de tutoría
+(cursos, ejercicios, acceso a la plataforma). El generador es determinista
+para una semilla dada, así que dos versiones del código se pueden comparar
+con exactamente los mismos datos, y no guarda nada en memoria: sirve igual
+para mil que para diez millones de conversaciones.
+
+Para que las etapas tengan trabajo realista, una parte de las conversaciones
+son preguntas frecuentes repetidas (duplicados), otra parte tiene respuestas
+vacías o demasiado cortas (baja calidad) y otra incluye datos personales del
+estudiante (nombre, correo, teléfono o documento).
+
+Uso:
+    from synthetic_data import iter_conversations
+    for conversation in iter_conversations(1000, seed=42):
+        ...
+"""
+
+import datetime
+import random
+from typing import Dict, Iterator, List
+
+from jsonl_codec import JsonlWriter
+from training_pipeline import conversations_to_examples, normalize_roles
+
+TOPICS = [
+    "álgebra lineal", "cálculo diferencial", "programación en Python", "estructuras de datos",
+    "historia de América Latina", "química orgánica", "física cuántica", "inglés intermedio",
+    "estadística descriptiva", "bases de datos SQL", "redes neuronales", "contabilidad básica",
+    "biología celular", "literatura española", "diseño web", "microeconomía",
+]
+
+CONCEPTS = [
+    "las matrices", "las derivadas", "los bucles", "las listas enlazadas", "la independencia",
+    "los enlaces covalentes", "el principio de incertidumbre", "el presente perfecto",
+    "la desviación estándar", "las claves foráneas", "el descenso del gradiente", "el balance general",
+    "la mitosis", "el Siglo de Oro", "las hojas de estilo", "la oferta y la demanda",
+]
+
+QUESTIONS = [
+    "¿Qué son {concept} en {topic}?",
+    "No entiendo bien {concept}, ¿me lo puedes explicar con un ejemplo?",
+    "¿Cómo se relacionan {concept} con el resto del curso de {topic}?",
+    "Tengo un examen de {topic} la próxima semana, ¿qué debería repasar sobre {concept}?",
+    "¿Puedes darme un ejercicio sobre {concept}?",
+    "¿Por qué es importante estudiar {concept}?",
+    "Revisé la lección de {topic} pero sigo con dudas sobre {concept}.",
+]
+
+ANSWER_SENTENCES = [
+    "En {topic}, {concept} aparecen en casi todos los temas del curso.",
+    "Una forma sencilla de entender {concept} es pensar en un caso concreto y resolverlo paso a paso.",
+    "Te recomiendo revisar primero la definición y después los ejercicios resueltos de la unidad.",
+    "Por ejemplo, si partimos de un problema pequeño, podemos ver cómo cambia el resultado al modificar cada dato.",
+    "Es normal que al principio cueste, pero con práctica regular se vuelve mucho más intuitivo.",
+    "En la sección de recursos del curso encontrarás un resumen y varios ejercicios con solución.",
+    "La idea clave es que {concept} permiten describir situaciones complejas con reglas simples.",
+    "Si quieres, podemos hacer juntos un ejercicio y revisar tus respuestas al final.",
+    "Recuerda anotar las dudas que te surjan para comentarlas en la próxima sesión de tutoría.",
+    "Muchos estudiantes confunden {concept} con conceptos parecidos, así que conviene compararlos.",
+]
+
+FOLLOW_UPS = [
+    "Gracias, ¿y cómo lo aplico en un problema real?",
+    "Vale, creo que ya lo entiendo. ¿Puedes darme otro ejemplo?",
+    "¿Eso también entra en el examen final?",
+    "No me quedó claro el segundo paso, ¿lo puedes repetir?",
+    "Perfecto, ¿qué debería estudiar después?",
+]
+
+# Preguntas frecuentes que se repiten casi igual entre usuarios
+FAQ = [
+    ("¿Cómo puedo acceder a mis cursos?", "Puedes acceder a tus cursos iniciando sesión en la plataforma y yendo a la sección 'Mis Cursos'. Allí encontrarás todos los cursos en los que estás inscrito."),
+    ("¿Qué hago si olvidé mi contraseña?", "Usa la opción 'Olvidé mi contraseña' en la página de inicio de sesión y te enviaremos un enlace a tu correo electrónico para restablecerla."),
+    ("¿Cómo descargo mi certificado?", "Cuando completes todas las lecciones del curso, el certificado aparecerá en tu perfil, en la sección 'Logros', listo para descargar en PDF."),
+]
+
+# Datos personales que algunos estudiantes escriben al presentarse
+NAMES = ["Ana García", "Luis Martínez", "María Fernanda López", "Carlos Ramírez", "Sofía Torres", "Diego Herrera"]
+PII_DETAILS = [
+    "mi correo es {email}",
+    "mi teléfono es {phone}",
+    "mi DNI es {dni}",
+    "puedes escribirme a {email} o llamarme al {phone}",
+]
+
+# Proporción de preguntas frecuentes, de conversaciones de baja calidad y de
+# conversaciones con datos personales
+FAQ_RATE = 0.1
+LOW_QUALITY_RATE = 0.05
+PII_RATE = 0.05
+
+START_TIME = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Los IDs imitan los IDs automáticos de Firestore (20 caracteres de este
+# alfabeto), para que las lecturas particionadas por rango de ID se repartan
+ID_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+def _answer(rng: random.Random, topic: str, concept: str) -> str:
+    sentences = rng.sample(ANSWER_SENTENCES, rng.randint(2, 5))
+    return " ".join(sentence.format(topic=topic, concept=concept) for sentence in sentences)
+
+def _personal_details(rng: random.Random) -> tuple:
+    """
+    Presentación con datos personales y el nombre de pila del estudiante
+    """
+    name = rng.choice(NAMES)
+    email = name.lower().replace(" ", ".").translate(str.maketrans("áéíóú", "aeiou")) + "@ejemplo.com"
+    phone = f"+34 6{rng.randrange(10):d}{rng.randrange(10):d} {rng.randrange(1000):03d} {rng.randrange(1000):03d}"
+    number = rng.randrange(10 ** 8)
+    dni = f"{number:08d}{'TRWAGMYFPDXBNJZSQVHLCKE'[number % 23]}"
+    detail = rng.choice(PII_DETAILS).format(email=email, phone=phone, dni=dni)
+    return f"Hola, me llamo {name} y {detail}. ", name.split()[0]
+
+def _turn_count(rng: random.Random) -> int:
+    """
+    Número de intercambios pregunta-respuesta: la mayoría de las sesiones son
+    cortas, pero algunas tutorías se alargan bastante
+    """
+    return max(1, min(60, int(rng.lognormvariate(1.0, 0.8))))
+
+def iter_conversations(count: int, seed: int = 42) -> Iterator[Dict]:
+    """
+    Genera conversaciones sintéticas con la estructura de Firestore
+
+    Args:
+        count: Número de conversaciones
+        seed: Semilla del generador
+
+    Returns:
+        Iterador de conversaciones (con "id", como las que lee el exportador)
+    """
+    rng = random.Random(seed)
+    # Generador aparte para los datos personales, así el resto de los datos
+    # no cambia al ajustar PII_RATE
+    pii_rng = random.Random(f"pii-{seed}")
+    for i in range(count):
+        start = START_TIME + datetime.timedelta(seconds=i * 37)
+        kind = rng.random()
+        pairs: List[tuple] = []
+        if kind < FAQ_RATE:
+            pairs.append(rng.choice(FAQ))
+        else:
+            topic = rng.choice(TOPICS)
+            concept = rng.choice(CONCEPTS)
+            question = rng.choice(QUESTIONS).format(topic=topic, concept=concept)
+            for turn in range(_turn_count(rng)):
+                if kind < FAQ_RATE + LOW_QUALITY_RATE:
+                    answer = rng.choice(["", "ok", "no sé"])
+                else:
+                    answer = _answer(rng, topic, concept)
+                pairs.append((question, answer))
+                question = rng.choice(FOLLOW_UPS)
+            if pii_rng.random() < PII_RATE:
+                introduction, first_name = _personal_details(pii_rng)
+                question, answer = pairs[0]
+                pairs[0] = (introduction + question, f"Hola, {first_name}. {answer}")
+
+        messages = []
+        timestamp = start
+        for question, answer in pairs:
+            messages.append({"sender": "user", "text": question, "timestamp": timestamp})
+            timestamp += datetime.timedelta(seconds=rng.randint(5, 120))
+            messages.append({"sender": "ai", "text": answer, "timestamp": timestamp})
+            timestamp += datetime.timedelta(seconds=rng.randint(5, 120))
+
+        yield {
+            "id": "".join(rng.choices(ID_ALPHABET, k=20)),
+            "userId": f"user{rng.randrange(max(1, count // 5)):08d}",
+            "startTime": start,
+            "endTime": timestamp,
+            "messages": messages,
+        }
+
+def iter_examples(count: int, seed: int = 42) -> Iterator[Dict]:
+    """
+    Genera ejemplos de entrenamiento sintéticos (role/content, como los que
+    escribe collect-training-data.py)
+
+    Args:
+        count: Número de ejemplos
+        seed: Semilla del generador
+
+    Returns:
+        Iterador de ejemplos
+    """
+    return normalize_roles(conversations_to_examples(iter_conversations(count, seed)))
+
+def write_examples_jsonl(path: str, count: int, seed: int = 42) -> int:
+    """
+    Escribe ejemplos sintéticos en un archivo JSONL
+
+    Args:
+        path: Ruta del archivo
+        count: Número de ejemplos
+        seed: Semilla del generador
+
+    Returns:
+        Número de ejemplos escritos
+    """
+    with open(path, 'wb') as f:
+        writer = JsonlWriter(f)
+        written = writer.write_many(iter_examples(count, seed))
+        writer.flush()
+    return written
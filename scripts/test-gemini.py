@@ -4,76 +4,136 @@ Test script for Gemini API using Python
 Based on the user's provided code but simplified for testing
 
 To use:
-1. Install Google AI Python SDK: pip install google-generativeai
+1. Install Google AI Python SDK: pip install google-genai
 2. Run this script: python test-gemini.py
+3. Optional: python test-gemini.py --metrics-json=metrics.jsonl --metrics-prom=gemini.prom
+
+Load test (compare the base model with the tuned model):
+    python test-gemini.py --prompts=training_data.jsonl --requests=200 --concurrency=16 --rps=5 \
+        --models=gemini-2.5-flash-preview-05-20,projects/.../endpoints/...
+    python test-gemini.py --backend=mock --prompts=prompts.txt --requests=500 --concurrency=50
 """
 
-import os
-from google import genai
-from google.genai import types
-
-def generate_response():
-    """Generate a response using Gemini model"""
-    
-    # Configure the client - either with an API key or with Google Cloud credentials
-    # Uncomment one of these two methods:
-    
-    # Method 1: Using API key
-    # genai.configure(api_key="YOUR_API_KEY_HERE")
-    
-    # Method 2: Using Google Cloud credentials
-    client = genai.Client(
-        vertexai=True,
-        project="cogniaintellilearn-ebdb3",  # Update with your project ID
-        location="global",
-    )
-
-    # Configure the model and request
-    model = "gemini-2.5-flash-preview-05-20"
-    
-    # Example of a chat message
-    contents = [
-        types.Content(
-            role="user",
-            parts=[types.Part(text="Hola, ¿cómo estás? Explícame qué es la inteligencia artificial.")]
+import argparse
+import asyncio
+import json
+import time
+
+from gemini_backends import DEFAULT_CONFIG, DEFAULT_MODEL, create_backend
+from instrumentation import add_metrics_arguments, metrics
+from load_test import format_report, load_prompts, run_load_test
+from response_cache import add_cache_arguments, cache_from_args
+
+DEFAULT_PROMPT = "Hola, ¿cómo estás? Explícame qué es la inteligencia artificial."
+
+parser = argparse.ArgumentParser(description="Prueba de la API de Gemini")
+parser.add_argument("--backend", choices=["vertex", "mock"], default="vertex",
+                    help="Backend: Vertex AI o simulación local sin red (default: vertex)")
+parser.add_argument("--project", default="cogniaintellilearn-ebdb3",
+                    help="ID del proyecto de Google Cloud")
+parser.add_argument("--location", default="global",
+                    help="Región de Vertex AI (default: global)")
+parser.add_argument("--models", default=DEFAULT_MODEL,
+                    help="Modelos separados por comas; en la prueba de carga se intercalan petición a petición")
+parser.add_argument("--prompt", default=DEFAULT_PROMPT,
+                    help="Prompt de la prueba simple")
+parser.add_argument("--prompts",
+                    help="Archivo de prompts (texto, uno por línea) o JSONL de entrenamiento; activa la prueba de carga")
+parser.add_argument("--requests", type=int, default=100,
+                    help="Número total de peticiones de la prueba de carga (default: 100)")
+parser.add_argument("--concurrency", type=int, default=8,
+                    help="Máximo de streams simultáneos (default: 8)")
+parser.add_argument("--rps", type=float, default=0.0,
+                    help="Peticiones por segundo objetivo (default: 0, sin límite)")
+parser.add_argument("--max-output-tokens", type=int, default=DEFAULT_CONFIG["max_output_tokens"],
+                    help="Máximo de tokens por respuesta (default: 8192)")
+parser.add_argument("--mock-ttft-ms", type=float, default=300.0,
+                    help="Backend mock: tiempo medio hasta el primer token en ms (default: 300)")
+parser.add_argument("--mock-tokens-per-second", type=float, default=80.0,
+                    help="Backend mock: velocidad de generación (default: 80)")
+parser.add_argument("--mock-error-rate", type=float, default=0.0,
+                    help="Backend mock: proporción de peticiones que fallan con 429 (default: 0)")
+parser.add_argument("--output",
+                    help="Guardar el informe de la prueba de carga en este archivo JSON")
+add_cache_arguments(parser)
+add_metrics_arguments(parser)
+
+def build_backend(args):
+    """Create the backend selected in the command line"""
+    if args.backend == "mock":
+        return create_backend(
+            "mock",
+            ttft_ms=args.mock_ttft_ms,
+            tokens_per_second=args.mock_tokens_per_second,
+            error_rate=args.mock_error_rate,
         )
-    ]
-
-    # Generation configuration
-    generate_content_config = types.GenerateContentConfig(
-        temperature=1,
-        top_p=0.95,
-        max_output_tokens=8192,
-        safety_settings=[
-            types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="OFF"),
-            types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="OFF"),
-            types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="OFF"),
-            types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="OFF")
-        ],
-    )
+    return create_backend("vertex", project=args.project, location=args.location)
+
+async def generate_response(backend, model, prompt, config):
+    """Generate a response using Gemini model. Returns True if the full response was received"""
+    contents = [{"role": "user", "text": prompt}]
 
     print("Enviando solicitud a Gemini...\n")
-    
+
     try:
-        # For streamed response
-        for chunk in client.models.generate_content_stream(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-        ):
-            print(chunk.text, end="")
+        # Streamed response
+        start = time.perf_counter()
+        with metrics().timer("generate"):
+            async for text in backend.stream(model, contents, config):
+                if "time_to_first_chunk_seconds" not in metrics().values:
+                    metrics().set("time_to_first_chunk_seconds", round(time.perf_counter() - start, 6))
+                metrics().inc("chunks_received")
+                metrics().inc("characters_received", len(text))
+                print(text, end="")
         print("\n\nRespuesta completa recibida con éxito.")
-        
-        # For non-streamed response (alternative)
-        # response = client.models.generate_content(
-        #     model=model,
-        #     contents=contents,
-        #     config=generate_content_config,
-        # )
-        # print(response.text)
-        
+        return True
+
     except Exception as e:
+        metrics().inc("errors")
         print(f"Error al llamar a la API de Gemini: {e}")
+        return False
+
+async def load_test(backend, models, args, config):
+    """Run the load test and print the report. Returns True if every request succeeded"""
+    prompts = load_prompts(args.prompts)
+    if not prompts:
+        print(f"No se encontraron prompts en {args.prompts}")
+        return False
+
+    print(f"Prueba de carga: {args.requests} peticiones, {len(prompts)} prompts, "
+          f"modelos: {', '.join(models)} (backend {args.backend})\n")
+    with metrics().timer("load_test"):
+        report = await run_load_test(backend, models, prompts, args.requests, args.concurrency, args.rps, config)
+    print(format_report(report))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nInforme guardado en {args.output}")
+
+    return all(stats["errors"] == 0 for stats in report["models"].values())
+
+async def run(args):
+    backend, cache = cache_from_args(build_backend(args), args)
+    models = [model.strip() for model in args.models.split(",") if model.strip()]
+    config = dict(DEFAULT_CONFIG, max_output_tokens=args.max_output_tokens)
+    try:
+        if args.prompts:
+            return await load_test(backend, models, args, config)
+        return await generate_response(backend, models[0], args.prompt, config)
+    finally:
+        if cache:
+            print(f"\n{cache.summary()}")
+            cache.close()
+
+def main():
+    args = parser.parse_args()
+    metrics().configure("test-gemini", args.metrics_json, args.metrics_prom, args.profile, args.profile_output)
+    success = False
+    try:
+        success = asyncio.run(run(args))
+    finally:
+        metrics().finish(success)
 
 if __name__ == "__main__":
-    generate_response() 
\ No newline at end of file
+    main()
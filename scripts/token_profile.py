@@ -0,0 +1,269 @@
+"""
+Perfil de tokens de un conjunto de datos de entrenamiento
+
+Estima los tokens de cada mensaje con una aproximación local del tokenizador
+(sin llamadas a la API) y acumula las estadísticas por lotes con arrays de
+NumPy. La memoria depende del tamaño del lote, no del archivo: los
+histogramas usan intervalos fijos (potencias de 2) y de los valores atípicos
+solo se guardan los `top` ejemplos más largos.
+"""
+
+import heapq
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from jsonl_codec import Codec, iter_jsonl
+from training_pipeline import CHARS_PER_TOKEN, MESSAGE_OVERHEAD_TOKENS
+
+# Intervalos de los histogramas: [0, 1), [1, 2), [2, 4), ... [2^20, ∞)
+HISTOGRAM_EDGES = np.array([0] + [2 ** i for i in range(21)] + [np.iinfo(np.int64).max], dtype=np.int64)
+
+def estimate_tokens(chars: np.ndarray, words: np.ndarray) -> np.ndarray:
+    """
+    Estima los tokens de un lote de mensajes (versión vectorizada de
+    training_pipeline.estimate_message_tokens)
+
+    Args:
+        chars: Número de caracteres de cada mensaje
+        words: Número de palabras de cada mensaje
+
+    Returns:
+        Tokens estimados de cada mensaje
+    """
+    return np.maximum(np.ceil(chars / CHARS_PER_TOKEN).astype(np.int64), words) + MESSAGE_OVERHEAD_TOKENS
+
+class TokenProfile:
+    """
+    Estadísticas acumuladas de tokens por ejemplo, por mensaje y por rol
+    """
+
+    def __init__(self, top: int = 10, max_tokens: Optional[int] = None):
+        """
+        Args:
+            top: Número de ejemplos más largos que se informan
+            max_tokens: Límite de tokens por ejemplo (se cuentan los que lo superan)
+        """
+        self.top = top
+        self.max_tokens = max_tokens
+        self.examples = 0
+        self.messages = 0
+        self.total_tokens = 0
+        self.max_example_tokens = 0
+        self.over_limit = 0
+        self.example_histogram = np.zeros(len(HISTOGRAM_EDGES) - 1, dtype=np.int64)
+        self.message_histogram = np.zeros(len(HISTOGRAM_EDGES) - 1, dtype=np.int64)
+        self.role_tokens: Dict[str, int] = {}
+        self._largest: List[Tuple[int, int]] = []
+
+    def add_batch(self, message_counts: List[int], chars: List[int], words: List[int], roles: List[int], role_names: List[str]):
+        """
+        Añade un lote de ejemplos
+
+        Args:
+            message_counts: Número de mensajes de cada ejemplo del lote
+            chars: Caracteres de cada mensaje (todos los ejemplos seguidos)
+            words: Palabras de cada mensaje
+            roles: Código de rol de cada mensaje (índice en role_names)
+            role_names: Nombre de cada código de rol
+        """
+        counts = np.asarray(message_counts, dtype=np.int64)
+        if counts.size == 0:
+            return
+        message_tokens = estimate_tokens(np.asarray(chars, dtype=np.int64), np.asarray(words, dtype=np.int64))
+
+        # Sumar los tokens de los mensajes de cada ejemplo
+        example_ids = np.repeat(np.arange(counts.size), counts)
+        example_tokens = np.bincount(example_ids, weights=message_tokens, minlength=counts.size).astype(np.int64)
+
+        self.example_histogram += np.histogram(example_tokens, bins=HISTOGRAM_EDGES)[0]
+        self.message_histogram += np.histogram(message_tokens, bins=HISTOGRAM_EDGES)[0]
+
+        role_totals = np.bincount(np.asarray(roles, dtype=np.int64), weights=message_tokens, minlength=len(role_names))
+        for name, total in zip(role_names, role_totals):
+            self.role_tokens[name] = self.role_tokens.get(name, 0) + int(total)
+
+        if self.max_tokens is not None:
+            self.over_limit += int((example_tokens > self.max_tokens).sum())
+
+        # Candidatos a valores atípicos: los `top` más largos del lote
+        candidates = np.arange(counts.size)
+        if counts.size > self.top:
+            candidates = np.argpartition(example_tokens, -self.top)[-self.top:]
+        for i in candidates:
+            item = (int(example_tokens[i]), self.examples + int(i))
+            if len(self._largest) < self.top:
+                heapq.heappush(self._largest, item)
+            else:
+                heapq.heappushpop(self._largest, item)
+
+        self.examples += int(counts.size)
+        self.messages += int(counts.sum())
+        self.total_tokens += int(example_tokens.sum())
+        self.max_example_tokens = max(self.max_example_tokens, int(example_tokens.max()))
+
+    def percentile(self, q: float, histogram: Optional[np.ndarray] = None) -> int:
+        """
+        Percentil aproximado (límite superior del intervalo del histograma)
+
+        Args:
+            q: Percentil entre 0 y 100
+            histogram: Histograma a usar (por defecto, el de ejemplos)
+
+        Returns:
+            Cota superior de tokens del percentil
+        """
+        histogram = self.example_histogram if histogram is None else histogram
+        total = histogram.sum()
+        if total == 0:
+            return 0
+        index = int(np.searchsorted(np.cumsum(histogram), math.ceil(total * q / 100)))
+        return int(min(HISTOGRAM_EDGES[index + 1] - 1, self.max_example_tokens))
+
+    def largest(self) -> List[Tuple[int, int]]:
+        """
+        Ejemplos más largos como (índice del ejemplo, tokens), de mayor a menor
+        """
+        return [(index, tokens) for tokens, index in sorted(self._largest, reverse=True)]
+
+    def to_dict(self, epochs: int = 1, price_per_million: Optional[float] = None) -> Dict:
+        """
+        Resumen serializable del perfil
+
+        Args:
+            epochs: Épocas del ajuste fino
+            price_per_million: Precio por millón de tokens de entrenamiento
+
+        Returns:
+            Diccionario con el resumen
+        """
+        training_tokens = self.total_tokens * epochs
+        summary = {
+            "examples": self.examples,
+            "messages": self.messages,
+            "tokens_per_epoch": self.total_tokens,
+            "epochs": epochs,
+            "training_tokens": training_tokens,
+            "tokens_per_example": {
+                "mean": self.total_tokens / self.examples if self.examples else 0,
+                "p50": self.percentile(50),
+                "p90": self.percentile(90),
+                "p99": self.percentile(99),
+                "max": self.max_example_tokens
+            },
+            "tokens_per_role": self.role_tokens,
+            "example_histogram": self._histogram_dict(self.example_histogram),
+            "message_histogram": self._histogram_dict(self.message_histogram),
+            "largest_examples": [{"index": index, "tokens": tokens} for index, tokens in self.largest()]
+        }
+        if self.max_tokens is not None:
+            summary["max_tokens"] = self.max_tokens
+            summary["over_limit"] = self.over_limit
+        if price_per_million is not None:
+            summary["estimated_cost"] = training_tokens / 1_000_000 * price_per_million
+        return summary
+
+    @staticmethod
+    def _histogram_dict(histogram: np.ndarray) -> Dict[str, int]:
+        return {
+            f"{HISTOGRAM_EDGES[i]}-{HISTOGRAM_EDGES[i + 1] - 1 if i + 2 < len(HISTOGRAM_EDGES) else 'inf'}": int(count)
+            for i, count in enumerate(histogram)
+            if count
+        }
+
+def profile_examples(
+    examples: Iterable[Dict],
+    batch_size: int = 10000,
+    top: int = 10,
+    max_tokens: Optional[int] = None
+) -> TokenProfile:
+    """
+    Calcula el perfil de tokens de un flujo de ejemplos
+
+    Args:
+        examples: Iterable de ejemplos con "messages"
+        batch_size: Ejemplos por lote
+        top: Número de ejemplos más largos que se informan
+        max_tokens: Límite de tokens por ejemplo
+
+    Returns:
+        Perfil de tokens
+    """
+    profile = TokenProfile(top, max_tokens)
+    role_codes: Dict[str, int] = {}
+    counts, chars, words, roles = [], [], [], []
+
+    for example in examples:
+        messages = example.get("messages", [])
+        counts.append(len(messages))
+        for message in messages:
+            content = message.get("content", "")
+            chars.append(len(content))
+            words.append(content.count(" ") + 1 if content else 0)
+            roles.append(role_codes.setdefault(message.get("role", "user"), len(role_codes)))
+
+        if len(counts) >= batch_size:
+            profile.add_batch(counts, chars, words, roles, list(role_codes))
+            counts, chars, words, roles = [], [], [], []
+
+    profile.add_batch(counts, chars, words, roles, list(role_codes))
+    return profile
+
+def profile_jsonl(
+    path: str,
+    batch_size: int = 10000,
+    top: int = 10,
+    max_tokens: Optional[int] = None,
+    codec: Optional[Codec] = None
+) -> TokenProfile:
+    """
+    Calcula el perfil de tokens de un archivo JSONL (comprimido o no)
+
+    Args:
+        path: Ruta del archivo
+        batch_size: Ejemplos por lote
+        top: Número de ejemplos más largos que se informan
+        max_tokens: Límite de tokens por ejemplo
+        codec: Codec JSON
+
+    Returns:
+        Perfil de tokens
+    """
+    return profile_examples(iter_jsonl(path, codec), batch_size, top, max_tokens)
+
+def format_report(summary: Dict) -> str:
+    """
+    Formatea el resumen del perfil como texto
+
+    Args:
+        summary: Resultado de TokenProfile.to_dict
+
+    Returns:
+        Informe legible
+    """
+    per_example = summary["tokens_per_example"]
+    lines = [
+        f"Ejemplos: {summary['examples']:,}  Mensajes: {summary['messages']:,}",
+        f"Tokens por época: {summary['tokens_per_epoch']:,}",
+        f"Tokens de entrenamiento ({summary['epochs']} épocas): {summary['training_tokens']:,}",
+        f"Tokens por ejemplo: media {per_example['mean']:.1f}, p50 ≤{per_example['p50']}, "
+        f"p90 ≤{per_example['p90']}, p99 ≤{per_example['p99']}, máx {per_example['max']}",
+        "Tokens por rol: " + ", ".join(f"{role} {tokens:,}" for role, tokens in summary["tokens_per_role"].items()),
+    ]
+    if "over_limit" in summary:
+        lines.append(f"Ejemplos por encima de {summary['max_tokens']} tokens: {summary['over_limit']:,}")
+    if "estimated_cost" in summary:
+        lines.append(f"Coste estimado: {summary['estimated_cost']:.2f}")
+
+    lines.append("\nHistograma de tokens por ejemplo:")
+    histogram = summary["example_histogram"]
+    peak = max(histogram.values(), default=0)
+    for label, count in histogram.items():
+        bar = "#" * max(1, round(40 * count / peak)) if peak else ""
+        lines.append(f"  {label:>15} {count:>12,} {bar}")
+
+    lines.append("\nEjemplos más largos (índice: tokens):")
+    for item in summary["largest_examples"]:
+        lines.append(f"  {item['index']}: {item['tokens']:,}")
+    return "\n".join(lines)
@@ -11,17 +11,26 @@ Prerrequisitos:
 
 Uso:
 python train-gemini-model.py --project=cogniaintellilearn-ebdb3 --region=us-central1
+
+Barrido de hiperparámetros (varios trabajos de ajuste en paralelo):
+python train-gemini-model.py --project=cogniaintellilearn-ebdb3 --sweep='{"learning_rate": [1e-5, 3e-5], "epochs": [2, 3]}'
+python train-gemini-model.py --project=cogniaintellilearn-ebdb3 --sweep=space.json --sweep-mode=random --sweep-trials=12 --max-concurrent-jobs=4
 """
 
 import argparse
-import json
+import asyncio
 import os
 import time
-from typing import List, Dict, Any
-import uuid
+from typing import List, Dict, Any, Optional, Tuple
 
-from google.cloud import aiplatform
-from google.cloud.aiplatform.tuning import TuningJob
+from dataset_shards import prepare_shards
+from dataset_validator import DatasetValidator, check_structure, format_validation, read_validated_jsonl, validate_examples
+from gcs_upload import DEFAULT_CHUNK_SIZE, GCSBackend, LocalBackend, upload_file, upload_files
+from instrumentation import add_metrics_arguments, metrics
+from jsonl_codec import set_default_codec
+from training_pipeline import MODEL_ROLE, normalize_roles, run_pipeline, save_jsonl, split_holdout, strip_metadata
+from tuning_backends import create_tuning_backend
+from tuning_sweep import SweepRunner, format_sweep_report, load_search_space, load_sweep, search_trials
 
 # Configuración de argumentos
 parser = argparse.ArgumentParser(description="Entrenar un modelo Gemini personalizado")
@@ -33,85 +42,200 @@ parser.add_argument("--tuned-model-name", type=str, default=f"cognia-assistant-{
 parser.add_argument("--epochs", type=int, default=3, help="Número de épocas para el entrenamiento")
 parser.add_argument("--batch-size", type=int, default=4, help="Tamaño del lote para el entrenamiento")
 parser.add_argument("--learning-rate", type=float, default=1e-5, help="Tasa de aprendizaje")
+parser.add_argument("--holdout-fraction", type=float, default=0.0, help="Proporción de ejemplos reservada para evaluar el modelo con eval-model.py (no se entrena con ella)")
+parser.add_argument("--shuffle-seed", type=int, default=None, help="Barajar los ejemplos con esta semilla antes de preparar (sin cargarlos en memoria)")
+parser.add_argument("--validation-fraction", type=float, default=0.0, help="Proporción de usuarios cuyos ejemplos forman el conjunto de validación del ajuste fino")
+parser.add_argument("--max-invalid-fraction", type=float, default=0.05, help="Proporción máxima de ejemplos no válidos (en cuarentena) antes de cancelar la subida")
+parser.add_argument("--shards", type=int, default=1, help="Preparar los datos en N shards en paralelo (un proceso por CPU)")
+parser.add_argument("--bucket", type=str, default=None, help="Bucket para los datos de entrenamiento (por defecto <project>-tuning-data)")
+parser.add_argument("--upload-workers", type=int, default=8, help="Partes que se suben en paralelo")
+parser.add_argument("--chunk-size-mb", type=int, default=DEFAULT_CHUNK_SIZE // (1024 * 1024), help="Tamaño de cada parte en subidas compuestas (MB)")
+parser.add_argument("--storage-root", type=str, default=None, help="Directorio local que sustituye a GCS (pruebas sin red)")
+parser.add_argument("--codec", type=str, default="auto", choices=["auto", "orjson", "msgspec", "json"], help="Serializador JSON (auto = el más rápido instalado)")
+parser.add_argument("--sweep", type=str, default=None, help="Barrido de hiperparámetros: espacio de búsqueda en JSON (archivo o texto)")
+parser.add_argument("--sweep-mode", type=str, default="grid", choices=["grid", "random"], help="Probar todas las combinaciones o una muestra aleatoria")
+parser.add_argument("--sweep-trials", type=int, default=8, help="Número de pruebas de la búsqueda aleatoria")
+parser.add_argument("--sweep-seed", type=int, default=0, help="Semilla de la búsqueda aleatoria")
+parser.add_argument("--sweep-state", type=str, default="sweep_state.json", help="Estado del barrido; al relanzar con el mismo archivo se reenganchan los trabajos en curso")
+parser.add_argument("--max-concurrent-jobs", type=int, default=4, help="Máximo de trabajos de ajuste en curso (se reduce si se alcanza la cuota)")
+parser.add_argument("--poll-seconds", type=float, default=30.0, help="Intervalo inicial entre consultas del estado de un trabajo (se duplica hasta --max-poll-seconds)")
+parser.add_argument("--max-poll-seconds", type=float, default=600.0, help="Intervalo máximo entre consultas del estado de un trabajo")
+parser.add_argument("--tuning-backend", type=str, default="vertex", choices=["vertex", "mock"], help="Servicio de ajuste del barrido: Vertex AI o simulación local")
+parser.add_argument("--mock-job-seconds", type=float, default=5.0, help="Backend mock: duración media de una época (s)")
+parser.add_argument("--mock-failure-rate", type=float, default=0.0, help="Backend mock: proporción de trabajos que fallan")
+parser.add_argument("--mock-quota", type=int, default=4, help="Backend mock: trabajos simultáneos permitidos antes de devolver 429")
+add_metrics_arguments(parser)
+
+def _prepared_examples(data_file: str, holdout_fraction: float, validator: DatasetValidator):
+    """
+    Lee un archivo, lo convierte al formato de Vertex AI y aparta los ejemplos no válidos
+    """
+    return run_pipeline(
+        read_validated_jsonl(data_file, validator),
+        lambda examples: check_structure(examples, validator),
+        lambda examples: split_holdout(examples, holdout_fraction),
+        lambda examples: normalize_roles(examples, MODEL_ROLE),
+        strip_metadata,
+        lambda examples: validate_examples(examples, validator)
+    )
 
-def prepare_training_data(data_file: str) -> str:
+def check_validation(result: Dict, max_invalid_fraction: Optional[float] = None):
+    """
+    Muestra el resumen de la validación y cancela si hay demasiados ejemplos no válidos
+    
+    Args:
+        result: Conteos de la validación (DatasetValidator.to_dict)
+        max_invalid_fraction: Proporción máxima de ejemplos no válidos (None = sin límite)
+    """
+    print(format_validation(result))
+    metrics().inc("invalid_examples", result["invalid"])
+    if max_invalid_fraction is not None and result["validated"] and result["invalid"] / result["validated"] > max_invalid_fraction:
+        raise ValueError(
+            f"{result['invalid']} de {result['validated']} ejemplos no cumplen el esquema de Vertex AI "
+            f"(máximo {max_invalid_fraction:.1%}); revisa {result['quarantine']} antes de subir los datos"
+        )
+
+def prepare_training_data(
+    data_file: str,
+    shards: int = 1,
+    codec_name: str = "auto",
+    holdout_fraction: float = 0.0,
+    shuffle_seed: Optional[int] = None,
+    validation_fraction: float = 0.0,
+    max_invalid_fraction: Optional[float] = None
+) -> Tuple[List[str], List[str]]:
     """
     Prepara los datos de entrenamiento en el formato requerido por Vertex AI
     
+    Cada ejemplo se valida con el esquema de chat de Gemini; los no válidos se
+    apartan en processed_<nombre>.quarantine.jsonl con los motivos.
+    
     Args:
-        data_file: Ruta al archivo de datos en formato JSONL
+        data_file: Ruta al archivo de datos en formato JSONL (puede estar comprimido con gzip o zstd)
+        shards: Número de shards; con más de uno, el archivo se divide por
+            rangos de bytes y cada rango se procesa en un proceso distinto
+        codec_name: Codec JSON para los procesos de los shards
+        holdout_fraction: Proporción de ejemplos que se excluye del
+            entrenamiento para evaluar después el modelo (ver eval-model.py)
+        shuffle_seed: Semilla para barajar los ejemplos (None = conservar el orden)
+        validation_fraction: Proporción de usuarios que forman el conjunto de validación
+        max_invalid_fraction: Proporción máxima de ejemplos no válidos (None = sin límite)
     
     Returns:
-        Ruta al archivo de datos procesado listo para el entrenamiento
+        Rutas a los archivos procesados de entrenamiento y de validación (vacía si no hay validación)
     """
     print(f"Preparando datos de entrenamiento desde {data_file}...")
+    if holdout_fraction > 0:
+        print(f"Se reserva el {holdout_fraction:.0%} de los ejemplos para evaluación")
     
-    processed_data = []
+    # Convertir al formato requerido por Vertex AI para Gemini en una sola
+    # pasada: leer → roles assistant→model → escribir
+    # Nombre estable: la subida se direcciona por contenido, así que el mismo
+    # conjunto de datos no se vuelve a subir aunque se prepare de nuevo
+    stem = os.path.basename(data_file)
+    for extension in (".gz", ".zst", ".jsonl"):
+        if stem.endswith(extension):
+            stem = stem[:-len(extension)]
+    processed_file = f"processed_{stem}.jsonl"
     
+    validation_files = []
+    if shuffle_seed is not None or validation_fraction > 0:
+        # Barajar y separar la validación con el índice de desplazamientos
+        # (la memoria depende del número de ejemplos, no de su tamaño)
+        from jsonl_index import shuffle_split
+        shuffled_file = f"shuffled_{stem}.jsonl"
+        validation_source = f"shuffled_{stem}_validation.jsonl"
+        with metrics().timer("shuffle_split"):
+            result = shuffle_split(data_file, shuffled_file, validation_source, shuffle_seed, validation_fraction)
+        print(f"Ejemplos barajados (semilla {shuffle_seed}): {result['train_examples']} de entrenamiento, "
+              f"{result['validation_examples']} de validación en {result['seconds']:.1f}s")
+        if validation_fraction > 0:
+            validation_file = f"processed_{stem}_validation.jsonl"
+            validator = DatasetValidator(f"processed_{stem}_validation.quarantine.jsonl")
+            try:
+                count = save_jsonl(_prepared_examples(validation_source, holdout_fraction, validator), validation_file)
+            finally:
+                validator.close()
+            metrics().inc("validation_examples", count)
+            print(f"Datos de validación guardados en {validation_file} ({count} ejemplos)")
+            check_validation(validator.to_dict(), max_invalid_fraction)
+            validation_files = [validation_file]
+        data_file = shuffled_file
+    
+    if shards > 1:
+        with metrics().timer("prepare"):
+            manifest = prepare_shards(data_file, f"processed_{stem}", shards, codec_name=codec_name, holdout_fraction=holdout_fraction)
+        metrics().inc("examples_prepared", manifest["total_examples"])
+        metrics().inc("bytes_written", manifest["total_bytes"])
+        for shard in manifest["shards"]:
+            print(f"- {shard['file']}: {shard['examples']} ejemplos, sha256 {shard['sha256'][:12]}")
+        print(f"Datos procesados en {len(manifest['shards'])} shards ({manifest['total_examples']} ejemplos), manifiesto en processed_{stem}.manifest.json")
+        check_validation(manifest["validation"], max_invalid_fraction)
+        return [shard["file"] for shard in manifest["shards"]], validation_files
+    
+    validator = DatasetValidator(f"processed_{stem}.quarantine.jsonl")
     try:
-        with open(data_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                example = json.loads(line.strip())
-                
-                # Convertir al formato requerido por Vertex AI para Gemini
-                processed_example = {
-                    "messages": []
-                }
-                
-                # Procesar mensajes de la conversación
-                for message in example.get("messages", []):
-                    role = message.get("role", "user")
-                    content = message.get("content", "")
-                    
-                    # Convertir roles al formato esperado por Gemini
-                    if role == "assistant":
-                        role = "model"
-                    
-                    processed_example["messages"].append({
-                        "role": role,
-                        "content": content
-                    })
-                
-                processed_data.append(processed_example)
+        with metrics().timer("prepare"):
+            count = save_jsonl(_prepared_examples(data_file, holdout_fraction, validator), processed_file)
+        metrics().inc("examples_prepared", count)
+        metrics().inc("bytes_written", os.path.getsize(processed_file))
     except Exception as e:
         print(f"Error al procesar datos de entrenamiento: {e}")
         raise
+    finally:
+        validator.close()
     
-    # Guardar datos procesados
-    processed_file = f"processed_training_data_{uuid.uuid4().hex[:8]}.jsonl"
-    with open(processed_file, 'w', encoding='utf-8') as f:
-        for example in processed_data:
-            f.write(json.dumps(example) + "\n")
-    
-    print(f"Datos procesados guardados en {processed_file}")
-    return processed_file
+    print(f"Datos procesados guardados en {processed_file} ({count} ejemplos)")
+    check_validation(validator.to_dict(), max_invalid_fraction)
+    return [processed_file], validation_files
 
-def upload_to_gcs(local_file: str, project_id: str, region: str) -> str:
+def upload_to_gcs(
+    local_files: List[str],
+    project_id: str,
+    region: str,
+    bucket_name: Optional[str] = None,
+    workers: int = 8,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    storage_root: Optional[str] = None
+) -> str:
     """
     Sube el archivo de datos de entrenamiento a Google Cloud Storage
     
+    El objeto se nombra con el SHA-256 del contenido, así que si los datos no
+    cambiaron no se vuelven a subir. Los archivos grandes se suben por partes
+    en paralelo y una subida interrumpida continúa con las partes que faltan.
+    Varios shards se suben en paralelo y se unen en un único objeto.
+    
     Args:
-        local_file: Ruta al archivo local
+        local_files: Rutas a los archivos locales (uno o varios shards)
         project_id: ID del proyecto de Google Cloud
         region: Región de Google Cloud
+        bucket_name: Nombre del bucket (por defecto <project>-tuning-data)
+        workers: Partes que se suben en paralelo
+        chunk_size: Tamaño de cada parte
+        storage_root: Directorio local que sustituye a GCS (pruebas sin red)
     
     Returns:
         URI de GCS para el archivo subido
     """
     # Crear un nombre de bucket único para el proyecto
-    bucket_name = f"{project_id}-tuning-data"
-    bucket_uri = f"gs://{bucket_name}"
+    bucket_name = bucket_name or f"{project_id}-tuning-data"
+    backend = LocalBackend(storage_root) if storage_root else GCSBackend(project_id)
     
-    # Ejecutar comandos de gsutil para crear el bucket y subir los datos
     try:
-        print(f"Creando bucket {bucket_name} si no existe...")
-        os.system(f"gsutil mb -l {region} -p {project_id} {bucket_uri}")
+        backend.ensure_bucket(bucket_name, region)
         
-        destination = f"{bucket_uri}/{os.path.basename(local_file)}"
-        print(f"Subiendo datos a {destination}...")
-        os.system(f"gsutil cp {local_file} {destination}")
+        print(f"Subiendo datos a {backend.scheme}://{bucket_name}...")
+        with metrics().timer("upload"):
+            if len(local_files) > 1:
+                result = upload_files(local_files, bucket_name, backend, "tuning-data/", chunk_size, workers)
+            else:
+                result = upload_file(local_files[0], bucket_name, backend, "tuning-data/", chunk_size, workers)
         
-        return destination
+        metrics().inc("bytes_uploaded", result.bytes_uploaded)
+        metrics().set("upload_mb_per_second", round(result.mb_per_second, 3))
+        metrics().set("upload_skipped", int(result.skipped))
+        return result.uri
     except Exception as e:
         print(f"Error al subir datos a GCS: {e}")
         raise
@@ -124,7 +248,8 @@ def train_model(
     tuned_model_name: str,
     epochs: int,
     batch_size: int,
-    learning_rate: float
+    learning_rate: float,
+    gcs_validation_uri: Optional[str] = None
 ) -> str:
     """
     Inicia un trabajo de ajuste fino para el modelo Gemini
@@ -138,10 +263,15 @@ def train_model(
         epochs: Número de épocas para el entrenamiento
         batch_size: Tamaño del lote
         learning_rate: Tasa de aprendizaje
+        gcs_validation_uri: URI de GCS al archivo de validación (opcional)
     
     Returns:
         Nombre del modelo ajustado
     """
+    # El SDK de Vertex AI tarda en importarse: solo se carga al entrenar
+    from google.cloud import aiplatform
+    from google.cloud.aiplatform.tuning import TuningJob
+
     # Inicializar Vertex AI
     aiplatform.init(project=project_id, location=region)
     
@@ -155,13 +285,16 @@ def train_model(
     print(f"Iniciando trabajo de ajuste fino para {base_model}...")
     
     # Crear un trabajo de ajuste fino
-    tuning_job = TuningJob.create(
-        base_model=base_model,
-        tuning_job_display_name=f"tune-{tuned_model_name}",
-        training_data=gcs_data_uri,
-        target_model_display_name=tuned_model_name,
-        hyperparameters=hyperparameters
-    )
+    options = {"validation_data": gcs_validation_uri} if gcs_validation_uri else {}
+    with metrics().timer("submit_tuning_job"):
+        tuning_job = TuningJob.create(
+            base_model=base_model,
+            tuning_job_display_name=f"tune-{tuned_model_name}",
+            training_data=gcs_data_uri,
+            target_model_display_name=tuned_model_name,
+            hyperparameters=hyperparameters,
+            **options
+        )
     
     print(f"Trabajo de ajuste fino iniciado: {tuning_job.display_name}")
     print("Este proceso puede tardar varias horas. Puedes monitorear el progreso en la consola de Google Cloud.")
@@ -172,6 +305,70 @@ def train_model(
     
     return tuned_model_name
 
+def run_sweep(args, gcs_data_uri: str, gcs_validation_uri: Optional[str] = None) -> List[Dict]:
+    """
+    Lanza (o reanuda) un barrido de hiperparámetros y espera a que termine
+    
+    Args:
+        args: Argumentos de la línea de comandos
+        gcs_data_uri: URI de GCS al archivo de datos de entrenamiento
+        gcs_validation_uri: URI de GCS al archivo de validación (opcional)
+    
+    Returns:
+        Pruebas del barrido con su estado final
+    """
+    trials = load_sweep(args.sweep_state)
+    if trials is not None:
+        print(f"Reanudando el barrido guardado en {args.sweep_state} ({len(trials)} pruebas)")
+    else:
+        trials = search_trials(
+            load_search_space(args.sweep),
+            args.sweep_mode,
+            args.sweep_trials,
+            args.sweep_seed,
+            base_params={"epochs": args.epochs, "batch_size": args.batch_size, "learning_rate": args.learning_rate},
+            prefix=args.tuned_model_name
+        )
+        print(f"Barrido de {len(trials)} pruebas ({args.sweep_mode}), estado en {args.sweep_state}")
+    
+    if args.tuning_backend == "mock":
+        backend = create_tuning_backend(
+            "mock",
+            job_seconds=args.mock_job_seconds,
+            failure_rate=args.mock_failure_rate,
+            quota=args.mock_quota,
+            service_file=f"{args.sweep_state}.service.json"
+        )
+    else:
+        backend = create_tuning_backend(
+            "vertex",
+            project=args.project,
+            region=args.region,
+            base_model=args.base_model,
+            training_data=gcs_data_uri,
+            validation_data=gcs_validation_uri
+        )
+    
+    runner = SweepRunner(
+        backend,
+        args.sweep_state,
+        max_concurrent=args.max_concurrent_jobs,
+        poll_seconds=args.poll_seconds,
+        max_poll_seconds=args.max_poll_seconds
+    )
+    try:
+        with metrics().timer("sweep"):
+            asyncio.run(runner.run(trials))
+    except KeyboardInterrupt:
+        print(f"\nBarrido interrumpido. Los trabajos siguen en curso; vuelve a ejecutar el script para reengancharlos desde {args.sweep_state}")
+        raise
+    finally:
+        print(runner.summary())
+    
+    print()
+    print(format_sweep_report(trials))
+    return trials
+
 def create_sample_data():
     """
     Crea un archivo de ejemplo con datos de entrenamiento
@@ -198,51 +395,81 @@ def create_sample_data():
     ]
     
     filename = "training_data.jsonl"
-    with open(filename, 'w', encoding='utf-8') as f:
-        for example in sample_data:
-            f.write(json.dumps(example) + "\n")
+    save_jsonl(sample_data, filename)
     
     print(f"Archivo de ejemplo creado: {filename}")
     return filename
 
 def main():
     args = parser.parse_args()
+    set_default_codec(args.codec)
     
-    # Verificar si existe el archivo de datos o crear uno de ejemplo
-    if not os.path.exists(args.data_file):
-        print(f"No se encontró el archivo {args.data_file}, creando datos de ejemplo...")
-        args.data_file = create_sample_data()
-    
-    # Preparar datos de entrenamiento
-    processed_file = prepare_training_data(args.data_file)
-    
-    # Subir datos a GCS
-    gcs_data_uri = upload_to_gcs(processed_file, args.project, args.region)
-    
-    # Entrenar modelo
-    tuned_model = train_model(
-        project_id=args.project,
-        region=args.region,
-        gcs_data_uri=gcs_data_uri,
-        base_model=args.base_model,
-        tuned_model_name=args.tuned_model_name,
-        epochs=args.epochs,
-        batch_size=args.batch_size,
-        learning_rate=args.learning_rate
-    )
+    metrics().configure("train-gemini-model", args.metrics_json, args.metrics_prom, args.profile, args.profile_output)
+    success = False
+    
+    try:
+        # Verificar si existe el archivo de datos o crear uno de ejemplo
+        if not os.path.exists(args.data_file):
+            print(f"No se encontró el archivo {args.data_file}, creando datos de ejemplo...")
+            args.data_file = create_sample_data()
+    
+        # Preparar datos de entrenamiento
+        processed_files, validation_files = prepare_training_data(
+            args.data_file,
+            args.shards,
+            args.codec,
+            args.holdout_fraction,
+            args.shuffle_seed,
+            args.validation_fraction,
+            args.max_invalid_fraction
+        )
+    
+        # Subir datos a GCS
+        upload_options = {
+            "bucket_name": args.bucket,
+            "workers": args.upload_workers,
+            "chunk_size": args.chunk_size_mb * 1024 * 1024,
+            "storage_root": args.storage_root
+        }
+        gcs_data_uri = upload_to_gcs(processed_files, args.project, args.region, **upload_options)
+        gcs_validation_uri = upload_to_gcs(validation_files, args.project, args.region, **upload_options) if validation_files else None
+    
+        if args.sweep:
+            # Barrido: varios trabajos de ajuste en lugar de uno
+            run_sweep(args, gcs_data_uri, gcs_validation_uri)
+            success = True
+            return
+    
+        # Entrenar modelo
+        tuned_model = train_model(
+            project_id=args.project,
+            region=args.region,
+            gcs_data_uri=gcs_data_uri,
+            base_model=args.base_model,
+            tuned_model_name=args.tuned_model_name,
+            epochs=args.epochs,
+            batch_size=args.batch_size,
+            learning_rate=args.learning_rate,
+            gcs_validation_uri=gcs_validation_uri
+        )
+    
+        print(f"\nResumen del proceso de entrenamiento:")
+        print(f"- Proyecto: {args.project}")
+        print(f"- Región: {args.region}")
+        print(f"- Datos de entrenamiento: {gcs_data_uri}")
+        if gcs_validation_uri:
+            print(f"- Datos de validación: {gcs_validation_uri}")
+        print(f"- Modelo base: {args.base_model}")
+        print(f"- Modelo ajustado: {tuned_model}")
+        print(f"- Épocas: {args.epochs}")
+        print(f"- Tamaño de lote: {args.batch_size}")
+        print(f"- Tasa de aprendizaje: {args.learning_rate}")
     
-    print(f"\nResumen del proceso de entrenamiento:")
-    print(f"- Proyecto: {args.project}")
-    print(f"- Región: {args.region}")
-    print(f"- Datos de entrenamiento: {gcs_data_uri}")
-    print(f"- Modelo base: {args.base_model}")
-    print(f"- Modelo ajustado: {tuned_model}")
-    print(f"- Épocas: {args.epochs}")
-    print(f"- Tamaño de lote: {args.batch_size}")
-    print(f"- Tasa de aprendizaje: {args.learning_rate}")
-    
-    print("\nUna vez completado el entrenamiento, podrás usar tu modelo personalizado en la aplicación.")
-    print("Para usar tu modelo entrenado, actualiza el archivo lib/gemini-config.ts con el nombre del modelo.")
+        print("\nUna vez completado el entrenamiento, podrás usar tu modelo personalizado en la aplicación.")
+        print("Para usar tu modelo entrenado, actualiza el archivo lib/gemini-config.ts con el nombre del modelo.")
+        success = True
+    finally:
+        metrics().finish(success)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,592 @@
+"""
+Pipeline compartido para los datos de entrenamiento
+Etapas componibles como generadores: fuente → normalizar roles → filtrar → destino.
+
+Cada etapa recibe un iterable de ejemplos y devuelve otro, así que una cadena
+completa procesa un ejemplo a la vez y la memoria no depende del tamaño del
+conjunto de datos. Lo usan collect-training-data.py (desde Firestore) y
+train-gemini-model.py (desde un JSONL existente).
+
+Uso:
+    from training_pipeline import read_jsonl, normalize_roles, save_jsonl
+    save_jsonl(normalize_roles(read_jsonl("training_data.jsonl"), MODEL_ROLE), "vertex.jsonl")
+"""
+
+import zlib
+from array import array
+from collections import deque
+from hashlib import blake2b
+from typing import List, Dict, Callable, Iterable, Iterator, Optional, Tuple
+
+from jsonl_codec import Codec, JsonlWriter, compression_for_path, iter_jsonl
+
+# Rol de las respuestas en el JSONL de recopilación y en el formato de Vertex AI
+ASSISTANT_ROLE = "assistant"
+MODEL_ROLE = "model"
+
+# Roles que se consideran respuestas del asistente
+ASSISTANT_ROLES = {"ai", ASSISTANT_ROLE, MODEL_ROLE}
+
+# Aproximación del tokenizador de Gemini: ~4 caracteres por token, y al menos
+# un token por palabra, más unos tokens fijos por mensaje (rol y separadores)
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 3
+
+# Campos de la conversación que acompañan a los mensajes en el JSONL de
+# recopilación (agrupar por usuario al dividir entrenamiento y validación).
+# Las etapas los conservan y strip_metadata los quita antes de Vertex AI
+METADATA_FIELDS = ("userId",)
+
+Stage = Callable[[Iterable[Dict]], Iterator[Dict]]
+
+# ---------------------------------------------------------------------------
+# Fuentes
+# ---------------------------------------------------------------------------
+
+def read_jsonl(path: str, codec: Optional[Codec] = None) -> Iterator[Dict]:
+    """
+    Lee ejemplos de un archivo JSONL, uno por línea (gzip y zstd se detectan solos)
+
+    Args:
+        path: Ruta del archivo JSONL
+        codec: Codec JSON (None = el más rápido disponible)
+
+    Returns:
+        Iterador de ejemplos (se ignoran las líneas vacías)
+    """
+    return iter_jsonl(path, codec)
+
+# ---------------------------------------------------------------------------
+# Etapas
+# ---------------------------------------------------------------------------
+
+def conversations_to_examples(conversations: Iterable[Dict]) -> Iterator[Dict]:
+    """
+    Convierte conversaciones de Firestore (sender/text) en ejemplos (role/content)
+
+    Args:
+        conversations: Iterable de conversaciones
+
+    Returns:
+        Iterador de ejemplos de entrenamiento
+    """
+    for conversation in conversations:
+        example = {
+            "messages": [
+                {
+                    "role": (message.get("sender") or "user").lower(),
+                    "content": message.get("text") or ""
+                }
+                for message in conversation.get("messages", [])
+            ]
+        }
+        for field in METADATA_FIELDS:
+            if conversation.get(field) is not None:
+                example[field] = conversation[field]
+        yield example
+
+def _with_messages(example: Dict, messages: List[Dict]) -> Dict:
+    """
+    Copia de un ejemplo con otros mensajes (conserva METADATA_FIELDS)
+    """
+    result = {"messages": messages}
+    for field in METADATA_FIELDS:
+        if field in example:
+            result[field] = example[field]
+    return result
+
+def normalize_roles(examples: Iterable[Dict], assistant_role: str = ASSISTANT_ROLE) -> Iterator[Dict]:
+    """
+    Unifica el rol de las respuestas del asistente
+
+    Args:
+        examples: Iterable de ejemplos
+        assistant_role: Rol de destino (ASSISTANT_ROLE o MODEL_ROLE para Vertex AI)
+
+    Returns:
+        Iterador de ejemplos con roles normalizados
+    """
+    for example in examples:
+        yield _with_messages(example, [
+            {
+                "role": assistant_role if message.get("role", "user") in ASSISTANT_ROLES else message.get("role", "user"),
+                "content": message.get("content", "")
+            }
+            for message in example.get("messages", [])
+        ])
+
+def strip_metadata(examples: Iterable[Dict]) -> Iterator[Dict]:
+    """
+    Deja solo los mensajes de cada ejemplo (formato de Vertex AI)
+
+    Args:
+        examples: Iterable de ejemplos
+
+    Returns:
+        Iterador de ejemplos {"messages": [...]}
+    """
+    for example in examples:
+        yield {"messages": example.get("messages", [])}
+
+def filter_examples(examples: Iterable[Dict], min_messages: int = 2) -> Iterator[Dict]:
+    """
+    Descarta ejemplos con menos de `min_messages` mensajes
+
+    Args:
+        examples: Iterable de ejemplos
+        min_messages: Número mínimo de mensajes
+
+    Returns:
+        Iterador de ejemplos válidos
+    """
+    for example in examples:
+        if len(example.get("messages", [])) >= min_messages:
+            yield example
+
+class Deduplicator:
+    """
+    Elimina duplicados exactos y casi duplicados en un solo recorrido
+
+    - Duplicados exactos: hash (BLAKE2b) del texto normalizado de `messages`
+      (roles incluidos, minúsculas y espacios colapsados).
+    - Casi duplicados: firma MinHash de los 3-gramas de palabras, calculada
+      con una sola función hash repartida en `num_perm` cubetas (one
+      permutation hashing con densificación por rotación), e índice LSH por
+      bandas. Los candidatos del índice se confirman con la similitud de
+      Jaccard estimada antes de descartarlos.
+
+    La memoria está acotada: solo se recuerdan los últimos `window` ejemplos
+    (ventana FIFO), tanto para los hashes exactos como para el índice LSH.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 64, window: int = 200_000, near: bool = True):
+        """
+        Args:
+            threshold: Similitud de Jaccard a partir de la cual dos ejemplos son casi duplicados
+            num_perm: Número de cubetas de la firma MinHash (potencia de 2)
+            window: Número de ejemplos recientes que se recuerdan
+            near: Detectar también casi duplicados (si no, solo duplicados exactos)
+        """
+        if num_perm < 2 or num_perm & (num_perm - 1):
+            raise ValueError("num_perm debe ser una potencia de 2")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.window = window
+        self.near = near
+        self.bands, self.rows = self._lsh_params(threshold, num_perm)
+
+        self._bin_bits = num_perm.bit_length() - 1
+        self._bin_mask = num_perm - 1
+
+        self._exact = set()
+        self._exact_order = deque()
+        self._signatures = {}
+        self._band_index = [{} for _ in range(self.bands)]
+        self._near_order = deque()
+        self._next_id = 0
+
+        self.seen = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+
+    @staticmethod
+    def _lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+        """
+        Elige bandas y filas (bandas * filas <= num_perm) cuyo umbral
+        aproximado (1/bandas)^(1/filas) sea el más cercano a `threshold`
+        """
+        best = None
+        for rows in range(1, num_perm + 1):
+            for bands in range(1, num_perm // rows + 1):
+                error = abs((1 / bands) ** (1 / rows) - threshold)
+                if best is None or error < best[0]:
+                    best = (error, bands, rows)
+        return best[1], best[2]
+
+    def _signature(self, words: List[bytes]) -> Optional[array]:
+        """
+        Calcula la firma MinHash de los 3-gramas de una lista de palabras
+        """
+        # Hash CRC32 de cada palabra y hash de cada tripleta de enteros (el
+        # hash de enteros y tuplas de Python es determinista entre procesos)
+        word_hashes = list(map(zlib.crc32, words))
+        if len(word_hashes) >= 3:
+            hashes = set(map(hash, zip(word_hashes, word_hashes[1:], word_hashes[2:])))
+        else:
+            hashes = set(word_hashes)
+        if not hashes:
+            return None
+
+        # Los bits bajos del hash eligen la cubeta y los siguientes dan el valor
+        empty = 0xFFFFFFFF
+        mask = self._bin_mask
+        bits = self._bin_bits
+        value_mask = (1 << (32 - bits)) - 1
+        mins = [empty] * self.num_perm
+        for h in hashes:
+            b = h & mask
+            v = (h >> bits) & value_mask
+            if v < mins[b]:
+                mins[b] = v
+
+        # Densificación: cada cubeta vacía toma el valor de la siguiente
+        # cubeta ocupada (circularmente), desplazado según la distancia
+        if empty in mins:
+            n = self.num_perm
+            offset = value_mask + 1
+            first = next(i for i in range(n) if mins[i] != empty)
+            next_value, next_index = mins[first], first + n
+            for i in range(n - 1, -1, -1):
+                if mins[i] == empty:
+                    mins[i] = next_value + offset * (next_index - i)
+                else:
+                    next_value, next_index = mins[i], i
+        return array('I', mins)
+
+    def is_duplicate(self, messages: List[Dict]) -> bool:
+        """
+        Indica si los mensajes duplican (exacta o aproximadamente) un ejemplo reciente
+
+        Los ejemplos que no son duplicados se registran en la ventana.
+
+        Args:
+            messages: Mensajes con "role" y "content"
+
+        Returns:
+            True si el ejemplo debe descartarse
+        """
+        self.seen += 1
+
+        # Texto normalizado: minúsculas, espacios colapsados y un marcador de rol
+        # por mensaje ("\x00" no es un espacio, así que split() lo conserva)
+        words = " ".join(
+            f"\x00{message['role']} {message['content']}" for message in messages
+        ).lower().encode('utf-8').split()
+
+        digest = blake2b(b" ".join(words), digest_size=16).digest()
+        if digest in self._exact:
+            self.exact_duplicates += 1
+            return True
+        self._exact.add(digest)
+        self._exact_order.append(digest)
+        if len(self._exact_order) > self.window:
+            self._exact.discard(self._exact_order.popleft())
+
+        if not self.near:
+            return False
+
+        signature = self._signature(words)
+        if signature is None:
+            return False
+
+        band_keys = [
+            hash(signature[i * self.rows:(i + 1) * self.rows].tobytes())
+            for i in range(self.bands)
+        ]
+        for band, key in zip(self._band_index, band_keys):
+            candidate = band.get(key)
+            if candidate is not None and self._similarity(signature, self._signatures[candidate][0]) >= self.threshold:
+                self.near_duplicates += 1
+                return True
+
+        item_id = self._next_id
+        self._next_id += 1
+        self._signatures[item_id] = (signature, band_keys)
+        for band, key in zip(self._band_index, band_keys):
+            band[key] = item_id
+        self._near_order.append(item_id)
+        if len(self._near_order) > self.window:
+            self._forget(self._near_order.popleft())
+        return False
+
+    def _similarity(self, a: array, b: array) -> float:
+        """
+        Similitud de Jaccard estimada a partir de dos firmas
+        """
+        return sum(map(int.__eq__, a, b)) / self.num_perm
+
+    def _forget(self, item_id: int):
+        """
+        Elimina un ejemplo antiguo del índice LSH
+        """
+        _, band_keys = self._signatures.pop(item_id)
+        for band, key in zip(self._band_index, band_keys):
+            if band.get(key) == item_id:
+                del band[key]
+
+    def summary(self) -> str:
+        """
+        Resumen de los ejemplos eliminados
+        """
+        removed = self.exact_duplicates + self.near_duplicates
+        return (
+            f"Deduplicación: {removed} de {self.seen} ejemplos eliminados "
+            f"({self.exact_duplicates} exactos, {self.near_duplicates} casi duplicados, umbral {self.threshold})"
+        )
+
+def deduplicate(examples: Iterable[Dict], deduplicator: Deduplicator) -> Iterator[Dict]:
+    """
+    Descarta duplicados exactos y casi duplicados
+
+    Args:
+        examples: Iterable de ejemplos
+        deduplicator: Estado de la deduplicación (conserva los contadores)
+
+    Returns:
+        Iterador de ejemplos sin duplicados
+    """
+    for example in examples:
+        if not deduplicator.is_duplicate(example["messages"]):
+            yield example
+
+def estimate_message_tokens(content: str) -> int:
+    """
+    Estima los tokens de un mensaje con una aproximación local del tokenizador
+
+    Args:
+        content: Texto del mensaje
+
+    Returns:
+        Tokens estimados (texto más el coste fijo del mensaje)
+    """
+    words = content.count(" ") + 1 if content else 0
+    return max(-(-len(content) // CHARS_PER_TOKEN), words) + MESSAGE_OVERHEAD_TOKENS
+
+class Windower:
+    """
+    Divide conversaciones largas en ventanas que caben en un presupuesto de tokens
+
+    Los mensajes se agrupan en turnos: uno o más mensajes del usuario seguidos
+    de las respuestas del asistente. Cada ventana es una secuencia de turnos
+    consecutivos, así que empieza en un mensaje del usuario y termina en una
+    respuesta del asistente; las ventanas consecutivas comparten `overlap`
+    turnos para conservar el contexto. Los ejemplos que ya caben en el
+    presupuesto no se modifican.
+    """
+
+    def __init__(self, max_tokens: int, overlap: int = 1):
+        """
+        Args:
+            max_tokens: Presupuesto de tokens por ejemplo
+            overlap: Turnos que se repiten entre ventanas consecutivas
+        """
+        if max_tokens <= 0:
+            raise ValueError("max_tokens debe ser positivo")
+
+        self.max_tokens = max_tokens
+        self.overlap = max(0, overlap)
+        self.seen = 0
+        self.split = 0
+        self.windows = 0
+        self.dropped_turns = 0
+
+    @staticmethod
+    def _turns(messages: List[Dict]) -> List[Tuple[int, int, int]]:
+        """
+        Agrupa los mensajes en turnos usuario → asistente
+
+        Returns:
+            Lista de turnos (primer mensaje, fin exclusivo, tokens); se
+            descartan las respuestas iniciales sin pregunta y las preguntas
+            finales sin respuesta
+        """
+        turns = []
+        start = None
+        tokens = 0
+        answered = False
+        for i, message in enumerate(messages):
+            is_assistant = message.get("role", "user") in ASSISTANT_ROLES
+            if not is_assistant and answered:
+                turns.append((start, i, tokens))
+                start = None
+            if start is None:
+                if is_assistant:
+                    continue
+                start, tokens, answered = i, 0, False
+            tokens += estimate_message_tokens(message.get("content", ""))
+            answered = answered or is_assistant
+        if start is not None and answered:
+            turns.append((start, len(messages), tokens))
+        return turns
+
+    def split_messages(self, messages: List[Dict]) -> Iterator[List[Dict]]:
+        """
+        Divide una conversación en ventanas
+
+        Args:
+            messages: Mensajes de la conversación
+
+        Returns:
+            Iterador de listas de mensajes (una por ventana)
+        """
+        self.seen += 1
+        total = sum(estimate_message_tokens(message.get("content", "")) for message in messages)
+        if total <= self.max_tokens:
+            yield messages
+            return
+
+        self.split += 1
+        turns = self._turns(messages)
+        start = 0
+        while start < len(turns):
+            # Ampliar la ventana mientras quepa el siguiente turno
+            end = start
+            tokens = 0
+            while end < len(turns) and tokens + turns[end][2] <= self.max_tokens:
+                tokens += turns[end][2]
+                end += 1
+
+            if end == start:
+                # Un turno que por sí solo supera el presupuesto no se puede aprovechar
+                self.dropped_turns += 1
+                start += 1
+                continue
+
+            self.windows += 1
+            yield messages[turns[start][0]:turns[end - 1][1]]
+            if end == len(turns):
+                break
+            start = max(start + 1, end - self.overlap)
+
+    def summary(self) -> str:
+        """
+        Resumen de las conversaciones divididas
+        """
+        return (
+            f"Ventanas: {self.split} de {self.seen} ejemplos superaban {self.max_tokens} tokens "
+            f"y se dividieron en {self.windows} ventanas ({self.dropped_turns} turnos demasiado largos descartados)"
+        )
+
+def window_examples(examples: Iterable[Dict], windower: Windower) -> Iterator[Dict]:
+    """
+    Divide los ejemplos largos en ventanas que caben en el presupuesto de tokens
+
+    Args:
+        examples: Iterable de ejemplos
+        windower: Estado de la división en ventanas (conserva los contadores)
+
+    Returns:
+        Iterador de ejemplos dentro del presupuesto
+    """
+    for example in examples:
+        for messages in windower.split_messages(example["messages"]):
+            yield _with_messages(example, messages)
+
+def example_id(example: Dict) -> str:
+    """
+    Identificador estable de un ejemplo: hash BLAKE2b de sus mensajes
+
+    Los roles de asistente (ai/assistant/model) cuentan como uno solo, así
+    que el ID no cambia entre el JSONL recopilado y el preparado para Vertex AI.
+
+    Args:
+        example: Ejemplo con "messages"
+
+    Returns:
+        16 caracteres hexadecimales
+    """
+    digest = blake2b(digest_size=8)
+    for message in example.get("messages", []):
+        role = "a" if message.get("role", "user") in ASSISTANT_ROLES else "u"
+        digest.update(f"{role}\x00{message.get('content', '')}\x00".encode("utf-8"))
+    return digest.hexdigest()
+
+def is_holdout(example: Dict, fraction: float) -> bool:
+    """
+    Indica si un ejemplo pertenece a la parte reservada para evaluación
+
+    La decisión depende solo del contenido del ejemplo, así que el
+    entrenamiento y la evaluación eligen los mismos ejemplos sin guardar la
+    lista y sin importar el orden del archivo.
+
+    Args:
+        example: Ejemplo con "messages"
+        fraction: Proporción reservada (0-1)
+
+    Returns:
+        True si el ejemplo se reserva para evaluación
+    """
+    return fraction > 0 and int(example_id(example), 16) < fraction * 2 ** 64
+
+def split_holdout(examples: Iterable[Dict], fraction: float, holdout: bool = False) -> Iterator[Dict]:
+    """
+    Separa la parte de entrenamiento o la reservada para evaluación
+
+    Args:
+        examples: Iterable de ejemplos
+        fraction: Proporción reservada (0-1)
+        holdout: True para quedarse con la parte reservada, False con la de entrenamiento
+
+    Returns:
+        Iterador de ejemplos de la parte elegida
+    """
+    for example in examples:
+        if is_holdout(example, fraction) == holdout:
+            yield example
+
+def run_pipeline(source: Iterable[Dict], *stages: Stage) -> Iterator[Dict]:
+    """
+    Encadena una fuente con una serie de etapas
+
+    Args:
+        source: Iterable de ejemplos o conversaciones
+        stages: Etapas a aplicar en orden
+
+    Returns:
+        Iterador con el resultado de la última etapa
+    """
+    stream = iter(source)
+    for stage in stages:
+        stream = stage(stream)
+    return stream
+
+# ---------------------------------------------------------------------------
+# Destinos
+# ---------------------------------------------------------------------------
+
+def write_jsonl(
+    f,
+    examples: Iterable[Dict],
+    codec: Optional[Codec] = None,
+    compression: str = "none"
+) -> int:
+    """
+    Escribe ejemplos en un archivo JSONL abierto en modo binario
+
+    Al terminar, el archivo queda en el límite de un bloque (ver JsonlWriter).
+
+    Args:
+        f: Archivo abierto en modo binario
+        examples: Iterable de ejemplos
+        codec: Codec JSON (None = el más rápido disponible)
+        compression: "none", "gzip" o "zstd"
+
+    Returns:
+        Número de ejemplos escritos
+    """
+    writer = JsonlWriter(f, codec, compression)
+    count = writer.write_many(examples)
+    writer.flush()
+    return count
+
+def save_jsonl(
+    examples: Iterable[Dict],
+    path: str,
+    codec: Optional[Codec] = None,
+    compression: Optional[str] = None
+) -> int:
+    """
+    Guarda ejemplos en un archivo JSONL (sobrescribe el archivo)
+
+    Args:
+        examples: Iterable de ejemplos
+        path: Ruta del archivo de salida
+        codec: Codec JSON (None = el más rápido disponible)
+        compression: "none", "gzip" o "zstd" (None = según la extensión)
+
+    Returns:
+        Número de ejemplos guardados
+    """
+    with open(path, 'wb') as f:
+        return write_jsonl(f, examples, codec, compression or compression_for_path(path))
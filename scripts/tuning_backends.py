@@ -0,0 +1,274 @@
+"""
+Backends de trabajos de ajuste fino para el barrido de hiperparámetros
+
+Todos los backends exponen la misma interfaz asíncrona:
+
+    job_id = await backend.submit(name, params)
+    status = await backend.status(job_id)
+    job_id = await backend.find(name)
+
+donde `params` son los hiperparámetros del trabajo (epochs, batch_size,
+learning_rate) y `status` un diccionario {"state", "tuned_model", "metrics",
+"error"} con uno de los estados de JOB_STATES. `find` busca un trabajo ya
+enviado por su nombre (para reengancharse tras un corte).
+
+- VertexTuningBackend: trabajos de ajuste de Vertex AI (las llamadas del SDK,
+  que son síncronas y cortas, se ejecutan en un hilo).
+- MockTuningBackend: servicio de ajuste simulado en local, con duración,
+  cuota de trabajos simultáneos y fallos configurables, para probar el
+  planificador sin red ni coste.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import time
+from typing import Dict, Optional
+
+from gemini_backends import BackendError
+
+# Estados de un trabajo de ajuste
+PENDING = "pending"
+SUBMITTING = "submitting"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+JOB_STATES = (PENDING, SUBMITTING, RUNNING, SUCCEEDED, FAILED, CANCELLED)
+FINAL_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+class VertexTuningBackend:
+    """
+    Trabajos de ajuste fino de Gemini en Vertex AI
+    """
+
+    name = "vertex"
+
+    def __init__(
+        self,
+        project: str,
+        region: str,
+        base_model: str,
+        training_data: str,
+        validation_data: Optional[str] = None,
+        quota: Optional[int] = None
+    ):
+        """
+        Args:
+            project: ID del proyecto de Google Cloud
+            region: Región de Google Cloud
+            base_model: Modelo base para el ajuste fino
+            training_data: URI de GCS de los datos de entrenamiento
+            validation_data: URI de GCS de los datos de validación (opcional)
+            quota: Trabajos de ajuste simultáneos permitidos en la región (None = sin límite conocido)
+        """
+        from google.cloud import aiplatform
+        from google.cloud.aiplatform.tuning import TuningJob
+
+        aiplatform.init(project=project, location=region)
+        self._tuning_job = TuningJob
+        self.base_model = base_model
+        self.training_data = training_data
+        self.validation_data = validation_data
+        self.quota = quota
+        self._jobs: Dict[str, object] = {}
+
+    def _submit(self, name: str, params: Dict) -> str:
+        options = {"validation_data": self.validation_data} if self.validation_data else {}
+        job = self._tuning_job.create(
+            base_model=self.base_model,
+            tuning_job_display_name=f"tune-{name}",
+            training_data=self.training_data,
+            target_model_display_name=name,
+            hyperparameters=params,
+            **options
+        )
+        self._jobs[job.resource_name] = job
+        return job.resource_name
+
+    def _status(self, job_id: str) -> Dict:
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = self._jobs[job_id] = self._tuning_job(job_id)
+        job.refresh()
+        state = job.state.name.replace("JOB_STATE_", "").lower()
+        if state not in FINAL_STATES:
+            state = RUNNING
+        error = getattr(job, "error", None)
+        return {
+            "state": state,
+            "tuned_model": getattr(job, "tuned_model_endpoint_name", None),
+            "metrics": {},
+            "error": str(error) if state == FAILED and error else None,
+        }
+
+    def _find(self, name: str) -> Optional[str]:
+        for job in self._tuning_job.list():
+            if job.display_name == f"tune-{name}":
+                self._jobs[job.resource_name] = job
+                return job.resource_name
+        return None
+
+    async def submit(self, name: str, params: Dict) -> str:
+        """
+        Crea el trabajo de ajuste y devuelve su nombre de recurso
+        """
+        return await asyncio.to_thread(self._submit, name, params)
+
+    async def status(self, job_id: str) -> Dict:
+        """
+        Consulta el estado de un trabajo
+        """
+        return await asyncio.to_thread(self._status, job_id)
+
+    async def find(self, name: str) -> Optional[str]:
+        """
+        Busca un trabajo enviado con este nombre
+        """
+        return await asyncio.to_thread(self._find, name)
+
+class MockTuningBackend:
+    """
+    Servicio de ajuste fino simulado en local
+
+    Cada trabajo dura `job_seconds` por época (con variación log-normal) y
+    termina con una pérdida de validación simulada que depende de los
+    hiperparámetros. Con `failure_rate` una parte de los trabajos falla, y
+    enviar más de `quota` trabajos simultáneos devuelve un error 429. Los
+    trabajos se guardan en `service_file` (si se indica), así que un
+    lanzador reiniciado encuentra los trabajos que siguen en curso.
+    """
+
+    name = "mock"
+
+    def __init__(
+        self,
+        job_seconds: float = 5.0,
+        failure_rate: float = 0.0,
+        quota: Optional[int] = 4,
+        service_file: Optional[str] = None,
+        seed: int = 0
+    ):
+        """
+        Args:
+            job_seconds: Duración media de una época (s)
+            failure_rate: Proporción de trabajos que fallan (0-1)
+            quota: Trabajos simultáneos permitidos (None = sin límite)
+            service_file: Archivo JSON donde el servicio guarda sus trabajos
+            seed: Semilla de la simulación
+        """
+        self.job_seconds = job_seconds
+        self.failure_rate = failure_rate
+        self.quota = quota
+        self.service_file = service_file
+        self.seed = seed
+        self.submits = 0
+        self.polls = 0
+        self._jobs: Dict[str, Dict] = {}
+        if service_file and os.path.exists(service_file):
+            with open(service_file, 'r', encoding='utf-8') as f:
+                self._jobs = json.load(f)
+
+    def _save(self):
+        if not self.service_file:
+            return
+        tmp_file = f"{self.service_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self._jobs, f, indent=2)
+        os.replace(tmp_file, self.service_file)
+
+    def _rng(self, name: str) -> random.Random:
+        digest = hashlib.blake2b(f"{self.seed}\x00{name}".encode("utf-8"), digest_size=8)
+        return random.Random(int.from_bytes(digest.digest(), "big"))
+
+    @staticmethod
+    def validation_loss(params: Dict, rng: random.Random) -> float:
+        """
+        Pérdida simulada: mínima con learning_rate 1e-5, 3 épocas y lotes de 8
+        """
+        learning_rate = float(params.get("learning_rate", 1e-5))
+        epochs = float(params.get("epochs", 3))
+        batch_size = float(params.get("batch_size", 8))
+        loss = 0.6 + 0.08 * (math.log10(learning_rate) + 5) ** 2 + 0.03 * (epochs - 3) ** 2
+        loss += 0.02 * abs(math.log2(batch_size / 8))
+        return round(loss + rng.gauss(0, 0.01), 4)
+
+    def _finished(self, job: Dict, now: float) -> bool:
+        return now >= job["submitted_at"] + job["duration"]
+
+    async def submit(self, name: str, params: Dict) -> str:
+        """
+        Crea un trabajo simulado (error 429 si se supera la cuota)
+        """
+        await asyncio.sleep(0.01)
+        now = time.time()
+        running = sum(1 for job in self._jobs.values() if not self._finished(job, now))
+        if self.quota is not None and running >= self.quota:
+            raise BackendError(
+                f"429 RESOURCE_EXHAUSTED: cuota de {self.quota} trabajos de ajuste simultáneos (simulado)",
+                retryable=True
+            )
+
+        rng = self._rng(name)
+        job_id = f"mock/tuningJobs/{len(self._jobs) + 1:06d}"
+        self._jobs[job_id] = {
+            "name": name,
+            "params": params,
+            "submitted_at": now,
+            "duration": self.job_seconds * max(1, int(params.get("epochs", 1))) * rng.lognormvariate(0, 0.2),
+            "fails": rng.random() < self.failure_rate,
+            "validation_loss": self.validation_loss(params, rng),
+        }
+        self.submits += 1
+        self._save()
+        return job_id
+
+    async def status(self, job_id: str) -> Dict:
+        """
+        Estado de un trabajo simulado
+        """
+        await asyncio.sleep(0.001)
+        self.polls += 1
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise BackendError(f"404 Trabajo no encontrado: {job_id}")
+        if not self._finished(job, time.time()):
+            return {"state": RUNNING, "tuned_model": None, "metrics": {}, "error": None}
+        if job["fails"]:
+            return {"state": FAILED, "tuned_model": None, "metrics": {}, "error": "Error interno del trabajo (simulado)"}
+        return {
+            "state": SUCCEEDED,
+            "tuned_model": f"mock/endpoints/{job['name']}",
+            "metrics": {"validation_loss": job["validation_loss"]},
+            "error": None,
+        }
+
+    async def find(self, name: str) -> Optional[str]:
+        """
+        Busca un trabajo simulado por su nombre
+        """
+        for job_id, job in self._jobs.items():
+            if job["name"] == name:
+                return job_id
+        return None
+
+def create_tuning_backend(name: str, **options):
+    """
+    Crea un backend de trabajos de ajuste por nombre
+
+    Args:
+        name: "vertex" o "mock"
+        options: Argumentos del constructor del backend
+
+    Returns:
+        Backend
+    """
+    if name == "vertex":
+        return VertexTuningBackend(**options)
+    if name == "mock":
+        return MockTuningBackend(**options)
+    raise ValueError(f"Backend desconocido: {name}")
@@ -0,0 +1,337 @@
+"""
+Barrido de hiperparámetros con trabajos de ajuste fino en paralelo
+
+El espacio de búsqueda es un diccionario JSON parámetro → valores:
+
+    {"learning_rate": {"min": 1e-6, "max": 1e-4, "log": true},
+     "epochs": [2, 3, 4], "batch_size": [4, 8]}
+
+Una lista es un conjunto de valores; un rango {"min", "max"} (con "log" para
+escala logarítmica e "int" para enteros) solo se admite en la búsqueda
+aleatoria. La búsqueda en rejilla prueba todas las combinaciones.
+
+SweepRunner envía los trabajos y los sigue desde un único bucle de asyncio:
+
+- Como mucho hay `max_concurrent` trabajos en curso (y no más que la cuota
+  del backend). Un error 429 al enviar reduce el límite a los trabajos en
+  curso y pausa los envíos con espera exponencial; cada trabajo terminado
+  lo vuelve a subir en uno.
+- Cada trabajo se consulta con un intervalo que se duplica mientras no
+  cambia de estado, hasta `max_poll_seconds`.
+- El estado de cada prueba se guarda en un JSON tras cada cambio. Al volver
+  a lanzar el barrido con el mismo archivo se reutilizan sus pruebas: las que
+  estaban en curso se vuelven a consultar en lugar de enviarse otra vez.
+"""
+
+import asyncio
+import datetime
+import itertools
+import json
+import math
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+from gemini_backends import is_rate_limit_error
+from instrumentation import metrics
+from tuning_backends import FAILED, FINAL_STATES, PENDING, RUNNING, SUBMITTING, SUCCEEDED
+
+# Métrica con la que se ordenan las pruebas (menor es mejor)
+DEFAULT_OBJECTIVE = "validation_loss"
+
+def load_search_space(value: str) -> Dict:
+    """
+    Lee el espacio de búsqueda de un archivo JSON o de un JSON en línea
+
+    Args:
+        value: Ruta del archivo o texto JSON
+
+    Returns:
+        Diccionario parámetro → lista de valores o rango
+    """
+    if os.path.exists(value):
+        with open(value, 'r', encoding='utf-8') as f:
+            space = json.load(f)
+    else:
+        space = json.loads(value)
+    if not isinstance(space, dict) or not space:
+        raise ValueError("El espacio de búsqueda debe ser un objeto JSON con al menos un parámetro")
+    for name, spec in space.items():
+        if isinstance(spec, list):
+            if not spec:
+                raise ValueError(f"El parámetro {name} no tiene valores")
+        elif not (isinstance(spec, dict) and "min" in spec and "max" in spec):
+            raise ValueError(f"El parámetro {name} debe ser una lista de valores o un rango {{\"min\", \"max\"}}")
+    return space
+
+def _sample(spec, rng: random.Random):
+    if isinstance(spec, list):
+        return rng.choice(spec)
+    low, high = spec["min"], spec["max"]
+    if spec.get("log"):
+        value = math.exp(rng.uniform(math.log(low), math.log(high)))
+    else:
+        value = rng.uniform(low, high)
+    return int(round(value)) if spec.get("int") else float(f"{value:.4g}")
+
+def search_trials(
+    space: Dict,
+    mode: str = "grid",
+    count: int = 8,
+    seed: int = 0,
+    base_params: Optional[Dict] = None,
+    prefix: str = "trial"
+) -> List[Dict]:
+    """
+    Genera las pruebas del barrido
+
+    Args:
+        space: Espacio de búsqueda (load_search_space)
+        mode: "grid" (todas las combinaciones) o "random"
+        count: Número de pruebas de la búsqueda aleatoria
+        seed: Semilla de la búsqueda aleatoria
+        base_params: Hiperparámetros por defecto de cada prueba
+        prefix: Prefijo del nombre de las pruebas
+
+    Returns:
+        Lista de pruebas {"name", "params", "state"}
+    """
+    names = list(space)
+    if mode == "grid":
+        for name in names:
+            if not isinstance(space[name], list):
+                raise ValueError(f"La búsqueda en rejilla necesita una lista de valores para {name}")
+        combinations = [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+    elif mode == "random":
+        rng = random.Random(seed)
+        combinations = [{name: _sample(space[name], rng) for name in names} for _ in range(count)]
+    else:
+        raise ValueError(f"Modo de búsqueda desconocido: {mode}")
+
+    return [
+        {"name": f"{prefix}-{i:03d}", "params": dict(base_params or {}, **params), "state": PENDING}
+        for i, params in enumerate(combinations)
+    ]
+
+def load_sweep(state_file: str) -> Optional[List[Dict]]:
+    """
+    Pruebas guardadas de un barrido anterior (None si no existe)
+    """
+    if not os.path.exists(state_file):
+        return None
+    with open(state_file, 'r', encoding='utf-8') as f:
+        return json.load(f)["trials"]
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+
+class SweepRunner:
+    """
+    Envía y sigue los trabajos de un barrido desde un único bucle de asyncio
+    """
+
+    def __init__(
+        self,
+        backend,
+        state_file: str,
+        max_concurrent: int = 4,
+        poll_seconds: float = 30.0,
+        max_poll_seconds: float = 600.0,
+        backoff_seconds: float = 30.0,
+        max_submit_retries: int = 8
+    ):
+        """
+        Args:
+            backend: Backend de trabajos de ajuste (tuning_backends)
+            state_file: JSON con el estado de las pruebas (checkpoint del barrido)
+            max_concurrent: Máximo de trabajos en curso
+            poll_seconds: Intervalo inicial entre consultas de un trabajo
+            max_poll_seconds: Intervalo máximo entre consultas
+            backoff_seconds: Pausa inicial de los envíos tras un error 429 (se duplica en cada uno)
+            max_submit_retries: Errores 429 seguidos tras los que una prueba se da por fallida
+        """
+        self.backend = backend
+        self.state_file = state_file
+        quota = getattr(backend, "quota", None)
+        self.max_concurrent = min(max_concurrent, quota) if quota else max_concurrent
+        self.poll_seconds = poll_seconds
+        self.max_poll_seconds = max_poll_seconds
+        self.backoff_seconds = backoff_seconds
+        self.max_submit_retries = max_submit_retries
+        self._limit = self.max_concurrent
+        self._resume_at = 0.0
+        self._throttled = 0
+        self._next_poll: Dict[str, float] = {}
+        self._interval: Dict[str, float] = {}
+        self._rng = random.Random()
+        self.trials: List[Dict] = []
+
+        self.submitted = 0
+        self.reattached = 0
+        self.polls = 0
+        self.throttled = 0
+
+    def _save(self):
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"updated_at": _now(), "trials": self.trials}, f, indent=2)
+        os.replace(tmp_file, self.state_file)
+
+    def _schedule_poll(self, trial: Dict, interval: float):
+        self._interval[trial["name"]] = interval
+        self._next_poll[trial["name"]] = time.monotonic() + interval
+
+    async def _submit(self, trial: Dict):
+        # Se guarda antes de enviar: si el lanzador se corta durante el envío,
+        # al reanudar se busca el trabajo por nombre en lugar de duplicarlo
+        trial["state"] = SUBMITTING
+        self._save()
+        try:
+            job_id = await self.backend.submit(trial["name"], trial["params"])
+        except Exception as e:
+            if is_rate_limit_error(e) and trial.get("throttled", 0) < self.max_submit_retries:
+                # Cuota alcanzada: no enviar más hasta que termine algún trabajo
+                trial["state"] = PENDING
+                trial["throttled"] = trial.get("throttled", 0) + 1
+                self.throttled += 1
+                self._throttled += 1
+                running = sum(1 for t in self.trials if t["state"] == RUNNING)
+                self._limit = max(1, running)
+                delay = self.backoff_seconds * 2 ** (self._throttled - 1) * (0.5 + self._rng.random())
+                self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                metrics().inc("sweep_throttled")
+                return
+            trial.update(state=FAILED, error=f"{type(e).__name__}: {e}", finished_at=_now())
+            metrics().inc("sweep_jobs_failed")
+            print(f"- {trial['name']}: no se pudo enviar ({e})")
+            return
+
+        self._throttled = 0
+        trial.update(state=RUNNING, job_id=job_id, submitted_at=_now())
+        self.submitted += 1
+        metrics().inc("sweep_jobs_submitted")
+        self._schedule_poll(trial, self.poll_seconds)
+        print(f"- {trial['name']}: enviado ({job_id}) {json.dumps(trial['params'])}")
+
+    async def _poll(self, trial: Dict):
+        self.polls += 1
+        interval = min(self._interval.get(trial["name"], self.poll_seconds) * 2, self.max_poll_seconds)
+        try:
+            status = await self.backend.status(trial["job_id"])
+        except Exception as e:
+            if not is_rate_limit_error(e):
+                print(f"- {trial['name']}: error al consultar el estado ({e})")
+            self._schedule_poll(trial, interval)
+            return
+
+        if status["state"] not in FINAL_STATES:
+            self._schedule_poll(trial, interval)
+            return
+
+        trial.update(
+            state=status["state"],
+            tuned_model=status.get("tuned_model"),
+            metrics=status.get("metrics") or {},
+            error=status.get("error"),
+            finished_at=_now()
+        )
+        self._next_poll.pop(trial["name"], None)
+        self._limit = min(self._limit + 1, self.max_concurrent)
+        metrics().inc(f"sweep_jobs_{status['state']}")
+        detail = f" {json.dumps(trial['metrics'])}" if trial["metrics"] else (f" ({trial['error']})" if trial["error"] else "")
+        print(f"- {trial['name']}: {status['state']}{detail}")
+
+    async def _reattach(self):
+        for trial in self.trials:
+            if trial["state"] == SUBMITTING:
+                job_id = await self.backend.find(trial["name"])
+                if job_id is None:
+                    trial["state"] = PENDING
+                else:
+                    trial.update(state=RUNNING, job_id=job_id)
+            if trial["state"] == RUNNING:
+                self.reattached += 1
+                self._interval[trial["name"]] = self.poll_seconds / 2
+                self._next_poll[trial["name"]] = 0.0
+        if self.reattached:
+            print(f"Reenganchando {self.reattached} trabajos en curso")
+
+    async def run(self, trials: List[Dict]) -> List[Dict]:
+        """
+        Ejecuta el barrido hasta que todas las pruebas terminan
+
+        Args:
+            trials: Pruebas del barrido (search_trials o load_sweep)
+
+        Returns:
+            Las pruebas con su estado final
+        """
+        self.trials = trials
+        await self._reattach()
+        self._save()
+
+        while True:
+            running = [t for t in self.trials if t["state"] == RUNNING]
+            pending = [t for t in self.trials if t["state"] == PENDING]
+            if not running and not pending:
+                break
+
+            now = time.monotonic()
+            free = self._limit - len(running)
+            if pending and free > 0 and now >= self._resume_at:
+                await asyncio.gather(*(self._submit(t) for t in pending[:free]))
+                self._save()
+                continue
+
+            due = [t for t in running if self._next_poll.get(t["name"], 0.0) <= now]
+            if due:
+                await asyncio.gather(*(self._poll(t) for t in due))
+                self._save()
+                continue
+
+            wake = [self._next_poll[t["name"]] for t in running if t["name"] in self._next_poll]
+            if pending and free > 0:
+                wake.append(self._resume_at)
+            await asyncio.sleep(max(0.0, min(wake) - time.monotonic()) if wake else self.poll_seconds)
+
+        return self.trials
+
+    def summary(self) -> str:
+        """
+        Resumen del barrido
+        """
+        counts = {state: sum(1 for t in self.trials if t["state"] == state) for state in FINAL_STATES}
+        return (
+            f"Barrido: {len(self.trials)} pruebas ({counts[SUCCEEDED]} completadas, {counts[FAILED]} fallidas), "
+            f"{self.submitted} trabajos enviados, {self.reattached} reenganchados, "
+            f"{self.polls} consultas, {self.throttled} envíos rechazados por cuota"
+        )
+
+def rank_trials(trials: List[Dict], objective: str = DEFAULT_OBJECTIVE) -> List[Dict]:
+    """
+    Ordena las pruebas completadas por la métrica objetivo (menor es mejor)
+
+    Las pruebas sin la métrica van al final, en su orden original.
+    """
+    finished = [t for t in trials if t["state"] == SUCCEEDED]
+    return sorted(finished, key=lambda t: (objective not in t.get("metrics", {}), t.get("metrics", {}).get(objective, 0.0)))
+
+def format_sweep_report(trials: List[Dict], objective: str = DEFAULT_OBJECTIVE) -> str:
+    """
+    Tabla de las pruebas del barrido, de mejor a peor
+    """
+    names = sorted({name for t in trials for name in t["params"]})
+    lines = [f"{'prueba':<24}{'estado':<11}" + "".join(f"{name:>15}" for name in names) + f"{objective:>17}"]
+    ranked = rank_trials(trials, objective)
+    others = [t for t in trials if t not in ranked]
+    for trial in ranked + others:
+        value = trial.get("metrics", {}).get(objective)
+        lines.append(
+            f"{trial['name']:<24}{trial['state']:<11}"
+            + "".join(f"{str(trial['params'].get(name, '')):>15}" for name in names)
+            + (f"{value:>17.4f}" if value is not None else f"{'-':>17}")
+        )
+    if ranked:
+        lines.append(f"\nMejor prueba: {ranked[0]['name']} → {ranked[0].get('tuned_model')}")
+    return "\n".join(lines)